@@ -0,0 +1,40 @@
+"""Add attempts column to checkout_queue table"""
+import asyncio
+import asyncpg
+from app.config import get_settings
+
+async def add_checkout_attempts_column():
+    """Add attempts column to checkout_queue table"""
+    settings = get_settings()
+    # Remove +asyncpg from the URL for asyncpg.connect
+    db_url = settings.DATABASE_URL.replace('postgresql+asyncpg://', 'postgresql://')
+    conn = await asyncpg.connect(db_url)
+    
+    try:
+        # Check if column already exists
+        check_query = """
+        SELECT column_name 
+        FROM information_schema.columns 
+        WHERE table_name='checkout_queue' AND column_name='attempts'
+        """
+        result = await conn.fetch(check_query)
+        
+        if result:
+            print("✓ attempts column already exists")
+            return
+        
+        await conn.execute("""
+            ALTER TABLE checkout_queue 
+            ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0
+        """)
+        
+        print("✓ Successfully added attempts column to checkout_queue table")
+        
+    except Exception as e:
+        print(f"✗ Error adding attempts column: {e}")
+        raise
+    finally:
+        await conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(add_checkout_attempts_column())
@@ -0,0 +1,46 @@
+"""Add claimed_at lease column to idempotency_keys table"""
+import asyncio
+import asyncpg
+from app.config import get_settings
+
+async def add_idempotency_claim_column():
+    """Add claimed_at column to idempotency_keys table"""
+    settings = get_settings()
+    # Remove +asyncpg from the URL for asyncpg.connect
+    db_url = settings.DATABASE_URL.replace('postgresql+asyncpg://', 'postgresql://')
+    conn = await asyncpg.connect(db_url)
+    
+    try:
+        # Check if column already exists
+        check_query = """
+        SELECT column_name 
+        FROM information_schema.columns 
+        WHERE table_name='idempotency_keys' AND column_name='claimed_at'
+        """
+        result = await conn.fetch(check_query)
+        
+        if result:
+            print("✓ claimed_at column already exists")
+            return
+        
+        # Existing in-progress claims get a lease starting at their creation
+        await conn.execute("""
+            ALTER TABLE idempotency_keys 
+            ADD COLUMN claimed_at TIMESTAMP WITH TIME ZONE
+        """)
+        await conn.execute("""
+            UPDATE idempotency_keys 
+            SET claimed_at = created_at 
+            WHERE status = 'in_progress'
+        """)
+        
+        print("✓ Successfully added claimed_at column to idempotency_keys table")
+        
+    except Exception as e:
+        print(f"✗ Error adding claimed_at column: {e}")
+        raise
+    finally:
+        await conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(add_idempotency_claim_column())
@@ -0,0 +1,40 @@
+"""Add company column to orders table and backfill it from users.server"""
+import asyncio
+from sqlalchemy import text
+from app.database import engine
+
+
+async def migrate():
+    """Add company column if it doesn't exist, then backfill existing orders"""
+    async with engine.begin() as conn:
+        # Check if column exists
+        result = await conn.execute(text("""
+            SELECT column_name 
+            FROM information_schema.columns 
+            WHERE table_name='orders' AND column_name='company'
+        """))
+        
+        if result.fetchone() is None:
+            # Added on the partitioned parent, so every partition gets it
+            await conn.execute(text("""
+                ALTER TABLE orders 
+                ADD COLUMN company VARCHAR(255)
+            """))
+            print("✅ Added company column to orders table")
+        else:
+            print("ℹ️  company column already exists")
+        
+        # Older orders did not record their company; use the customer's current one
+        result = await conn.execute(text("""
+            UPDATE orders o
+            SET company = NULLIF(u.server, '')
+            FROM users u
+            WHERE u.email = o.customer_email AND o.company IS NULL AND NULLIF(u.server, '') IS NOT NULL
+        """))
+        print(f"✅ Backfilled company on {result.rowcount} orders")
+    
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,110 @@
+"""Add order_coupons table and backfill it from orders.applied_coupon_code"""
+import asyncio
+from sqlalchemy import text
+from app.database import engine
+from app.models import generate_uuid
+
+
+async def migrate():
+    """Create order_coupons table and backfill existing orders"""
+    async with engine.begin() as conn:
+        print("Creating order_coupons table...")
+
+        result = await conn.execute(text("""
+            SELECT table_name
+            FROM information_schema.tables
+            WHERE table_name='order_coupons'
+        """))
+        if result.fetchone() is None:
+            await conn.execute(text("""
+                CREATE TABLE order_coupons (
+                    id VARCHAR PRIMARY KEY,
+                    order_id VARCHAR NOT NULL,
+                    coupon_id VARCHAR,
+                    code VARCHAR(50) NOT NULL,
+                    position INTEGER NOT NULL DEFAULT 0,
+                    discount_type VARCHAR(20) NOT NULL,
+                    discount_value FLOAT NOT NULL,
+                    discount_amount FLOAT NOT NULL,
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+                    FOREIGN KEY (coupon_id) REFERENCES coupons(id) ON DELETE SET NULL
+                )
+            """))
+            await conn.execute(text("""
+                CREATE INDEX ix_order_coupons_order_id ON order_coupons(order_id)
+            """))
+            await conn.execute(text("""
+                CREATE INDEX ix_order_coupons_code ON order_coupons(code)
+            """))
+            print("✅ Created order_coupons table with indexes")
+        else:
+            print("ℹ️  order_coupons table already exists")
+
+        # Backfill orders placed before the breakdown was recorded
+        result = await conn.execute(text("""
+            SELECT o.id, o.subtotal, o.applied_coupon_code, o.created_at
+            FROM orders o
+            WHERE o.applied_coupon_code IS NOT NULL
+              AND o.applied_coupon_code <> ''
+              AND NOT EXISTS (SELECT 1 FROM order_coupons oc WHERE oc.order_id = o.id)
+        """))
+        orders = result.fetchall()
+
+        if not orders:
+            print("✅ All orders already have a coupon breakdown")
+            return
+
+        result = await conn.execute(text("""
+            SELECT id, code, discount_type, discount_value, makes_free FROM coupons
+        """))
+        coupons = {row.code: row for row in result.fetchall()}
+
+        print(f"Found {len(orders)} orders to backfill...")
+        rows = []
+        for order in orders:
+            # Replay the sequential discount calculation used at checkout
+            remaining_amount = order.subtotal
+            for position, code in enumerate(order.applied_coupon_code.split(",")):
+                coupon = coupons.get(code)
+                if coupon is None:
+                    print(f"  ⚠ Coupon {code} not found for order {order.id}")
+                    continue
+
+                if coupon.makes_free:
+                    discount_amount = remaining_amount
+                elif coupon.discount_type == "percentage":
+                    discount_amount = remaining_amount * (coupon.discount_value / 100)
+                else:
+                    discount_amount = min(coupon.discount_value, remaining_amount)
+                remaining_amount -= discount_amount
+
+                rows.append({
+                    "id": generate_uuid(),
+                    "order_id": order.id,
+                    "coupon_id": coupon.id,
+                    "code": coupon.code,
+                    "position": position,
+                    "discount_type": coupon.discount_type,
+                    "discount_value": coupon.discount_value,
+                    "discount_amount": discount_amount,
+                    "created_at": order.created_at,
+                })
+
+        if rows:
+            await conn.execute(text("""
+                INSERT INTO order_coupons (
+                    id, order_id, coupon_id, code, position,
+                    discount_type, discount_value, discount_amount, created_at
+                )
+                VALUES (
+                    :id, :order_id, :coupon_id, :code, :position,
+                    :discount_type, :discount_value, :discount_amount, :created_at
+                )
+            """), rows)
+
+        print(f"\n✅ Backfilled {len(rows)} order coupon rows")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
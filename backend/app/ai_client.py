@@ -0,0 +1,120 @@
+"""
+Shared asynchronous Gemini client for the admin AI chat.
+
+One google-genai client is created on first use and reused, so its HTTP
+connections are pooled across requests. Calls go through the client's async
+API and never block the event loop. At most AI_MAX_CONCURRENT_REQUESTS calls
+run at once, and each is bounded by AI_REQUEST_TIMEOUT_SECONDS, including
+time spent waiting for a slot.
+"""
+import asyncio
+from typing import AsyncIterator
+
+from fastapi import HTTPException
+
+from app.config import get_settings
+
+try:
+    from google import genai
+    from google.genai import types
+except ImportError:  # pragma: no cover - optional dependency
+    genai = None
+
+settings = get_settings()
+
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 2048,
+}
+
+
+class GeminiClient:
+    """Pooled, concurrency-capped Gemini calls with a per-request timeout"""
+
+    def __init__(self, model: str, max_concurrent: int, timeout_seconds: float):
+        self.model = model
+        self.timeout_seconds = timeout_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._client = None
+
+    def _get_client(self):
+        if genai is None:
+            raise HTTPException(status_code=500, detail="google-genai is not installed")
+        if not settings.GEMINI_API_KEY:
+            raise HTTPException(status_code=500, detail="GEMINI_API_KEY not configured")
+        if self._client is None:
+            self._client = genai.Client(api_key=settings.GEMINI_API_KEY)
+        return self._client.aio
+
+    def _config(self) -> "types.GenerateContentConfig":
+        return types.GenerateContentConfig(**GENERATION_CONFIG)
+
+    async def generate(self, prompt: str) -> str:
+        """Complete a prompt; raises HTTPException 504 on timeout"""
+        client = self._get_client()
+
+        async def call() -> str:
+            async with self._semaphore:
+                response = await client.models.generate_content(
+                    model=self.model, contents=prompt, config=self._config()
+                )
+                return response.text or ""
+
+        try:
+            return await asyncio.wait_for(call(), timeout=self.timeout_seconds)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="AI request timed out")
+
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Text chunks as the model produces them. The timeout bounds the whole
+        response; the concurrency slot is held until the stream ends.
+        Configuration errors are raised here, before the stream starts.
+        """
+        return self._stream(self._get_client(), prompt)
+
+    async def _stream(self, client, prompt: str) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout_seconds
+
+        def remaining() -> float:
+            return max(deadline - loop.time(), 0)
+
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=remaining())
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="AI request timed out")
+        try:
+            chunks = await asyncio.wait_for(
+                client.models.generate_content_stream(
+                    model=self.model, contents=prompt, config=self._config()
+                ),
+                timeout=remaining()
+            )
+            iterator = chunks.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout=remaining())
+                except StopAsyncIteration:
+                    break
+                if chunk.text:
+                    yield chunk.text
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="AI request timed out")
+        finally:
+            self._semaphore.release()
+
+    async def close(self) -> None:
+        """Close the pooled connections"""
+        if self._client is not None:
+            await self._client.aio.aclose()
+            self._client = None
+
+
+gemini_client = GeminiClient(
+    settings.GEMINI_MODEL,
+    settings.AI_MAX_CONCURRENT_REQUESTS,
+    settings.AI_REQUEST_TIMEOUT_SECONDS
+)
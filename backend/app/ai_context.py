@@ -0,0 +1,162 @@
+"""
+Database context snapshot for the admin AI chat: used by the intent
+router, while prompts are built per question by app/ai_planner.py.
+
+The context (stock levels, today's and all-time sales, active coupons) is
+read in one round trip: a single statement of scalar and json_agg
+subqueries over products, coupons and the daily_sales rollup. It is cached
+for AI_CONTEXT_CACHE_SECONDS and shared by every concurrent chat, so
+back-to-back questions only read the data version: the AI_CONTEXT_VERSION
+counter (bumped by admin changes to orders, products and coupons) and the
+order count of the last two days (bumped by every checkout). A snapshot
+read at another version is reloaded, so the next chat sees the data any
+worker committed.
+
+Each snapshot carries a version: a hash of its data, which changes exactly
+when the context the model sees changes.
+"""
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Tuple
+
+from sqlalchemy import text
+
+from app.cache import AI_CONTEXT_VERSION, RefreshingCache
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+
+settings = get_settings()
+
+# Changes whenever committed orders, products or coupons change. Yesterday
+# is included for orders that commit just after midnight.
+DATA_VERSION_SQL = """
+    (SELECT COALESCE(max(version), 0) FROM data_versions WHERE name = :version_name)
+    || '.' || (SELECT COALESCE(sum(order_count), 0) FROM daily_sales WHERE day >= :since)
+"""
+
+
+def _version_params(today: date) -> dict:
+    return {"version_name": AI_CONTEXT_VERSION, "since": today - timedelta(days=1)}
+
+
+CONTEXT_SQL = text("""
+    SELECT
+        (SELECT count(*) FROM products) AS product_count,
+        (
+            SELECT COALESCE(json_agg(p), '[]'::json)
+            FROM (
+                SELECT name, stock_quantity, base_price
+                FROM products
+                ORDER BY stock_quantity, name
+                LIMIT 10
+            ) p
+        ) AS low_stock,
+        (SELECT order_count FROM daily_sales WHERE day = :today) AS orders_today,
+        (SELECT revenue FROM daily_sales WHERE day = :today) AS revenue_today,
+        (SELECT sum(revenue) FROM daily_sales) AS revenue_all_time,
+        (SELECT count(*) FROM coupons WHERE is_active) AS active_coupon_count,
+        (
+            SELECT COALESCE(json_agg(c), '[]'::json)
+            FROM (
+                SELECT code, discount_type, discount_value, makes_free, used_count
+                FROM coupons
+                WHERE is_active
+                ORDER BY used_count DESC, code
+                LIMIT 5
+            ) c
+        ) AS top_coupons,
+        {data_version} AS data_version
+""".format(data_version=DATA_VERSION_SQL))
+
+
+@dataclass(frozen=True)
+class AIContext:
+    """Rendered prompt context with the data it was built from"""
+    text: str
+    data: dict
+    version: str
+    computed_at: datetime
+    data_version: str = ""  # Data version the data was read at
+
+
+def describe_coupon(coupon: dict) -> str:
+    """Discount of a coupon row, e.g. 10% off"""
+    if coupon["makes_free"]:
+        return "Makes order FREE"
+    if coupon["discount_type"] == "percentage":
+        return f"{coupon['discount_value']}% off"
+    return f"${coupon['discount_value']} off"
+
+
+def render_context(data: dict) -> str:
+    """The context block embedded in chat prompts"""
+    context_parts = ["=== INVENTORY STATUS ==="]
+    context_parts.append(f"Total Products: {data['product_count']}")
+    context_parts.append("\nLow Stock Products:")
+    for product in data["low_stock"]:
+        context_parts.append(
+            f"- {product['name']}: {product['stock_quantity']} units (${product['base_price']} each)"
+        )
+
+    context_parts.append("\n=== TODAY'S SALES ===")
+    context_parts.append(f"Orders Today: {data['orders_today']}")
+    context_parts.append(f"Total Revenue Today: ${data['revenue_today']:.2f}")
+    context_parts.append(f"Total Revenue (All Time): ${data['revenue_all_time']:.2f}")
+
+    context_parts.append("\n=== ACTIVE COUPONS ===")
+    context_parts.append(f"Total Active Coupons: {data['active_coupon_count']}")
+    for coupon in data["top_coupons"]:
+        context_parts.append(f"- {coupon['code']}: {describe_coupon(coupon)} | Used: {coupon['used_count']} times")
+
+    return "\n".join(context_parts)
+
+
+async def load_context() -> AIContext:
+    """Query and render a fresh context snapshot"""
+    today = datetime.now(timezone.utc).date()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(CONTEXT_SQL, _version_params(today) | {"today": today})
+        row = result.mappings().one()
+
+    data = {
+        "date": today.isoformat(),
+        "product_count": int(row["product_count"]),
+        "low_stock": row["low_stock"],
+        "orders_today": int(row["orders_today"] or 0),
+        "revenue_today": float(row["revenue_today"] or 0),
+        "revenue_all_time": float(row["revenue_all_time"] or 0),
+        "active_coupon_count": int(row["active_coupon_count"]),
+        "top_coupons": row["top_coupons"],
+    }
+    version = hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return AIContext(
+        text=render_context(data),
+        data=data,
+        version=version,
+        computed_at=datetime.now(timezone.utc),
+        data_version=row["data_version"]
+    )
+
+
+ai_context_cache = RefreshingCache(settings.AI_CONTEXT_CACHE_SECONDS)
+
+
+async def current_data_version() -> str:
+    """The data version as committed by any worker"""
+    today = datetime.now(timezone.utc).date()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(text(f"SELECT {DATA_VERSION_SQL}"), _version_params(today))
+        return result.scalar()
+
+
+async def get_ai_context() -> Tuple[AIContext, float]:
+    """The shared context snapshot and its age in seconds"""
+    data_version = await current_data_version()
+    context, age = await ai_context_cache.get(load_context)
+    if context.data_version != data_version:
+        # Data changed since the snapshot was read (possibly in another worker)
+        ai_context_cache.clear()
+        context, age = await ai_context_cache.get(load_context)
+    return context, age
@@ -0,0 +1,238 @@
+"""
+Fast answers for common admin chat questions.
+
+Questions are matched as a whole: filler words ("what", "is", "the", ...)
+are dropped and the rest must be exactly one rule's phrasing, so any other
+qualifier (a product or company name, a year, an amount, a period outside
+PERIODS) leaves the question to the model. A match is answered from the
+shared AI context snapshot or a small rollup query, formatted like the
+model's plain-text answers. Anything open-ended ("why", "compare",
+"suggest", ...) or unmatched goes to the model.
+"""
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Optional, Pattern, Tuple
+
+from sqlalchemy import desc, func, select
+
+from app.ai_context import AIContext, describe_coupon, get_ai_context
+from app.database import AsyncSessionLocal
+from app.models import DailyProductSales, DailySales, Product
+
+# Questions that ask for reasoning rather than a number are left to the model
+OPEN_ENDED = re.compile(
+    r"\b(why|how come|explain|should|would|could|recommend|suggest|compare|versus|vs|predict|forecast"
+    r"|strategy|improve|analy[sz]e|insight|trend|if)\b"
+)
+
+# Longer questions are usually open-ended even without a trigger word
+MAX_INTENT_WORDS = 12
+
+# Words that do not change what a question asks for; everything else must
+# be part of a rule's template
+FILLER_WORDS = frozenset(
+    "a an are at be been can current currently did do does far for get give had has have hey hi i in is"
+    " just me moment my now of our please right see show so tell the there us was we were what whats"
+    " which you".split()
+)
+
+# Most products a "top N products" answer lists
+MAX_TOP_PRODUCTS = 25
+
+PERIODS = {
+    "yesterday": lambda today: (today - timedelta(days=1), today),
+    "this week": lambda today: (today - timedelta(days=today.weekday()), today + timedelta(days=1)),
+    "last 7 days": lambda today: (today - timedelta(days=6), today + timedelta(days=1)),
+    "past week": lambda today: (today - timedelta(days=6), today + timedelta(days=1)),
+    "last week": lambda today: (
+        today - timedelta(days=today.weekday() + 7), today - timedelta(days=today.weekday())
+    ),
+    "this month": lambda today: (today.replace(day=1), today + timedelta(days=1)),
+    "last 30 days": lambda today: (today - timedelta(days=29), today + timedelta(days=1)),
+}
+PERIOD_PATTERN = "|".join(re.escape(period) for period in PERIODS)
+COUNT_PATTERN = r"how many|how much|number|count|total"
+
+
+def _money(value: float) -> str:
+    return f"${value:,.2f}"
+
+
+async def _period_sales(start: date, end: date) -> Tuple[int, float]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(func.sum(DailySales.order_count), func.sum(DailySales.revenue))
+            .where(DailySales.day >= start, DailySales.day < end)
+        )
+        orders, revenue = result.one()
+    return int(orders or 0), float(revenue or 0)
+
+
+async def _revenue_today(match: re.Match, context: AIContext) -> str:
+    data = context.data
+    return (
+        f"TODAY'S REVENUE: {_money(data['revenue_today'])}\n"
+        f"- Orders today: {data['orders_today']}"
+    )
+
+
+async def _orders_today(match: re.Match, context: AIContext) -> str:
+    data = context.data
+    return (
+        f"ORDERS TODAY: {data['orders_today']}\n"
+        f"- Revenue today: {_money(data['revenue_today'])}"
+    )
+
+
+async def _revenue_all_time(match: re.Match, context: AIContext) -> str:
+    return f"TOTAL REVENUE (ALL TIME): {_money(context.data['revenue_all_time'])}"
+
+
+async def _period_summary(match: re.Match, context: AIContext) -> str:
+    period = match.group("period") or match.group("period_first")
+    start, end = PERIODS[period](datetime.now(timezone.utc).date())
+    orders, revenue = await _period_sales(start, end)
+    last_day = end - timedelta(days=1)
+    return (
+        f"SALES {period.upper()} ({start.isoformat()} to {last_day.isoformat()}):\n"
+        f"- Revenue: {_money(revenue)}\n"
+        f"- Orders: {orders}\n"
+        f"- Average order value: {_money(revenue / orders if orders else 0)}"
+    )
+
+
+async def _low_stock(match: re.Match, context: AIContext) -> str:
+    lines = ["LOWEST STOCK PRODUCTS:"]
+    for product in context.data["low_stock"]:
+        lines.append(f"- {product['name']}: {product['stock_quantity']} units")
+    return "\n".join(lines)
+
+
+async def _product_count(match: re.Match, context: AIContext) -> str:
+    return f"TOTAL PRODUCTS: {context.data['product_count']}"
+
+
+async def _active_coupons(match: re.Match, context: AIContext) -> str:
+    data = context.data
+    lines = [f"ACTIVE COUPONS: {data['active_coupon_count']}"]
+    if data["top_coupons"]:
+        lines.append("\nMost used:")
+    for coupon in data["top_coupons"]:
+        lines.append(f"- {coupon['code']}: {describe_coupon(coupon)} | Used: {coupon['used_count']} times")
+    return "\n".join(lines)
+
+
+async def _top_products(match: re.Match, context: AIContext) -> str:
+    limit = min(max(int(match.group("limit") or 5), 1), MAX_TOP_PRODUCTS)
+    period = match.group("period")
+    query = (
+        select(
+            Product.name,
+            func.sum(DailyProductSales.quantity),
+            func.sum(DailyProductSales.revenue)
+        )
+        .join(DailyProductSales, Product.id == DailyProductSales.product_id)
+        .group_by(Product.id, Product.name)
+        .order_by(desc(func.sum(DailyProductSales.quantity)), Product.name)
+        .limit(limit)
+    )
+    if period:
+        start, end = PERIODS[period](datetime.now(timezone.utc).date())
+        query = query.where(DailyProductSales.day >= start, DailyProductSales.day < end)
+        title = f"{period.upper()} ({start.isoformat()} to {(end - timedelta(days=1)).isoformat()})"
+    else:
+        title = "(ALL TIME)"
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(query)
+        rows = result.all()
+    lines = [f"TOP {limit} SELLING PRODUCTS {title}:"]
+    for rank, (name, quantity, revenue) in enumerate(rows, start=1):
+        lines.append(f"{rank}. {name}: {int(quantity)} units | {_money(float(revenue))}")
+    if not rows:
+        lines.append("- No sales yet")
+    return "\n".join(lines)
+
+
+IntentHandler = Callable[[re.Match, AIContext], Awaitable[str]]
+
+# (intent, template, handler); the first template matching the whole
+# question, after FILLER_WORDS are dropped, answers
+INTENTS: List[Tuple[str, Pattern, IntentHandler]] = [
+    (
+        "sales_period",
+        re.compile(rf"(?:(?:{COUNT_PATTERN}) )?(?:revenue|sales|orders?|earnings|earn|make|made|sold)"
+                   rf" (?P<period>{PERIOD_PATTERN})"
+                   rf"|(?P<period_first>{PERIOD_PATTERN})s? (?:revenue|sales|orders)"),
+        _period_summary,
+    ),
+    (
+        "orders_today",
+        re.compile(rf"(?:(?:{COUNT_PATTERN}) )?orders (?:placed |received )?todays?|todays orders"),
+        _orders_today,
+    ),
+    (
+        "revenue_today",
+        re.compile(rf"(?:(?:{COUNT_PATTERN}) )?(?:revenue|sales|income|earnings|earn|make|made) todays?"
+                   r"|todays (?:revenue|sales|income|earnings)"),
+        _revenue_today,
+    ),
+    (
+        "revenue_all_time",
+        re.compile(r"(?:total|all time|overall|lifetime) (?:revenue|sales)(?: all time| ever)?"
+                   r"|(?:revenue|sales) (?:all time|ever|overall)"),
+        _revenue_all_time,
+    ),
+    (
+        "low_stock",
+        re.compile(r"(?:(?:products?|items?) )?(?:running )?(?:low|lowest|out|short)(?: on)? (?:stock|inventory)"
+                   r"(?: products?| items?)?"
+                   r"|(?:stock|inventory) (?:levels?|status)"
+                   r"|(?:(?:products?|items?) )?(?:(?:needs?|needing) restock(?:ing)?|running (?:low|out))"),
+        _low_stock,
+    ),
+    (
+        "active_coupons",
+        re.compile(rf"(?:(?:{COUNT_PATTERN}) )?(?:all )?(?:active |available |valid )?"
+                   r"(?:coupons?|discount codes?|promo codes?)(?: active| available| valid)?"),
+        _active_coupons,
+    ),
+    (
+        "top_products",
+        re.compile(r"(?:(?:top|best|most popular)(?: (?P<limit>\d+))?(?: selling| sold)?"
+                   r" (?:products?|items?|sellers?)|bestsellers?)"
+                   rf"(?: (?P<period>{PERIOD_PATTERN}))?"),
+        _top_products,
+    ),
+    (
+        "product_count",
+        re.compile(rf"(?:{COUNT_PATTERN}) (?:products?|items?)"),
+        _product_count,
+    ),
+]
+
+
+def question_core(normalized_question: str) -> str:
+    """A normalized question without FILLER_WORDS, as matched by the INTENTS templates"""
+    return " ".join(word for word in normalized_question.split() if word not in FILLER_WORDS)
+
+
+def match_intent(normalized_question: str) -> Optional[Tuple[str, re.Match, IntentHandler]]:
+    """The rule for a normalized question, or None when the model should answer"""
+    if len(normalized_question.split()) > MAX_INTENT_WORDS or OPEN_ENDED.search(normalized_question):
+        return None
+    core = question_core(normalized_question)
+    for intent, pattern, handler in INTENTS:
+        match = pattern.fullmatch(core)
+        if match:
+            return intent, match, handler
+    return None
+
+
+async def answer_intent(normalized_question: str) -> Optional[Tuple[str, str, AIContext]]:
+    """(intent, answer, context) for a question matching a rule, else None"""
+    matched = match_intent(normalized_question)
+    if matched is None:
+        return None
+    intent, match, handler = matched
+    context, _ = await get_ai_context()
+    return intent, await handler(match, context), context
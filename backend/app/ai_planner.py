@@ -0,0 +1,373 @@
+"""
+Question-aware prompt context for the admin AI chat.
+
+Instead of one fixed dump, the planner picks the sections a question needs
+(named products, inventory, sales over a period, top products, coupons,
+customers), loads only those, concurrently and each on its own session,
+and trims the result to AI_CONTEXT_TOKEN_BUDGET estimated tokens. Sections
+are listed most specific first, so trimming drops general data before the
+products the question names. Questions that match no section get the
+sales, inventory and coupon overview.
+
+Loaded sections are cached for AI_CONTEXT_CACHE_SECONDS under the current data
+version (see app/ai_context.py), so a change committed by any worker is seen
+at once.
+"""
+import asyncio
+import hashlib
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import desc, func, select
+
+from app.ai_context import AIContext, current_data_version, describe_coupon
+from app.ai_intents import PERIODS
+from app.cache import ai_section_cache, normalize_question
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.models import (
+    CompanyMetrics, Coupon, CustomerMetrics, DailyCouponSales, DailyProductSales,
+    DailySales, InventoryForecast, Product
+)
+
+settings = get_settings()
+
+# Rough size of a token for English text and numbers; no tokenizer needed
+CHARS_PER_TOKEN = 4
+
+# Named products get the full detail of at most this many products
+MAX_NAMED_PRODUCTS = 10
+
+# Product name words that are too short or generic to identify products
+MIN_PRODUCT_WORD_LENGTH = 4
+
+# (section, pattern) in the order sections appear in the prompt
+SECTION_RULES: List[Tuple[str, re.Pattern]] = [
+    ("inventory", re.compile(
+        r"\b(stock\w*|inventory|restock\w*|reorder\w*|replenish\w*|run(ning)? (low|out)|sold out|supply)\b"
+    )),
+    ("sales", re.compile(
+        r"\b(revenue|sales|sold|orders?|earn\w*|income|make|made|aov|average order|perform\w*|trend\w*|growth)\b"
+    )),
+    ("top_products", re.compile(r"\b(top|best\w*|popular|selling|sold|worst|slow\w*)\b")),
+    ("coupons", re.compile(r"\b(coupons?|discounts?|promo\w*|codes?|redemptions?|redeem\w*|vouchers?)\b")),
+    ("customers", re.compile(r"\b(customers?|compan(y|ies)|clients?|buyers?|accounts?|users?)\b")),
+]
+
+DEFAULT_SECTIONS = ["sales", "inventory", "coupons"]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _money(value: float) -> str:
+    return f"${value:,.2f}"
+
+
+def question_period(normalized_question: str, today: date) -> Tuple[str, date, date]:
+    """(label, start, end) of the period a question asks about; end is exclusive"""
+    for period, bounds in PERIODS.items():
+        if re.search(rf"\b{re.escape(period)}\b", normalized_question):
+            return (period, *bounds(today))
+    if re.search(r"\btodays?\b", normalized_question):
+        return "today", today, today + timedelta(days=1)
+    return "last 7 days", *PERIODS["last 7 days"](today)
+
+
+def _singular(word: str) -> str:
+    return word[:-1] if word.endswith("s") and len(word) > MIN_PRODUCT_WORD_LENGTH else word
+
+
+def match_products(normalized_question: str, catalog: Sequence[Tuple[str, str, str]]) -> List[str]:
+    """
+    Ids of catalog products (id, name, category) the question refers to: by
+    full name first, then by category or a distinctive word of the name
+    """
+    words = {_singular(word) for word in normalized_question.split()}
+    exact, partial = [], []
+    for product_id, name, category in catalog:
+        normalized_name = normalize_question(name)
+        if re.search(rf"\b{re.escape(normalized_name)}s?\b", normalized_question):
+            exact.append(product_id)
+        elif (
+            _singular(normalize_question(category)) in words
+            or any(
+                len(word) >= MIN_PRODUCT_WORD_LENGTH and _singular(word) in words
+                for word in normalized_name.split()
+            )
+        ):
+            partial.append(product_id)
+    return (exact or partial)[:MAX_NAMED_PRODUCTS]
+
+
+async def _load_catalog() -> List[Tuple[str, str, str]]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Product.id, Product.name, Product.category).order_by(Product.name))
+        return [(str(product_id), name, category) for product_id, name, category in result.all()]
+
+
+async def _load_products(product_ids: Tuple[str, ...], start: date, end: date, label: str) -> List[str]:
+    period_sales = (
+        select(
+            DailyProductSales.product_id,
+            func.sum(DailyProductSales.quantity).label("quantity"),
+            func.sum(DailyProductSales.revenue).label("revenue")
+        )
+        .where(DailyProductSales.day >= start, DailyProductSales.day < end)
+        .group_by(DailyProductSales.product_id)
+        .subquery()
+    )
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Product, InventoryForecast, period_sales.c.quantity, period_sales.c.revenue)
+            .outerjoin(InventoryForecast, InventoryForecast.product_id == Product.id)
+            .outerjoin(period_sales, period_sales.c.product_id == Product.id)
+            .where(Product.id.in_(product_ids))
+            .order_by(Product.name)
+        )
+        rows = result.all()
+
+    lines = [f"=== PRODUCTS MENTIONED ({label.upper()}) ==="]
+    for product, forecast, quantity, revenue in rows:
+        line = (
+            f"- {product.name} [{product.category}, tier {product.tier}]: ${product.base_price} each"
+            f" | {product.stock_quantity} in stock | Sold {int(quantity or 0)} units ({_money(float(revenue or 0))})"
+        )
+        if forecast is not None:
+            line += f" | ~{forecast.velocity:.1f}/day"
+            if forecast.days_of_stock is not None:
+                line += f", {forecast.days_of_stock:.0f} days of stock"
+            line += f", reorder at {forecast.reorder_point}"
+        lines.append(line)
+    return lines
+
+
+async def _load_inventory() -> List[str]:
+    async with AsyncSessionLocal() as db:
+        product_count = await db.scalar(select(func.count(Product.id)))
+        result = await db.execute(
+            select(Product.name, Product.stock_quantity, Product.base_price, InventoryForecast)
+            .outerjoin(InventoryForecast, InventoryForecast.product_id == Product.id)
+            .order_by(Product.stock_quantity, Product.name)
+            .limit(15)
+        )
+        rows = result.all()
+
+    lines = ["=== INVENTORY STATUS ===", f"Total Products: {product_count}", "Lowest stock first:"]
+    for name, stock_quantity, base_price, forecast in rows:
+        line = f"- {name}: {stock_quantity} units (${base_price} each)"
+        if forecast is not None and forecast.days_of_stock is not None:
+            line += f" | {forecast.days_of_stock:.0f} days of stock, reorder at {forecast.reorder_point}"
+        lines.append(line)
+    return lines
+
+
+async def _load_sales(start: date, end: date, label: str) -> List[str]:
+    previous_start = start - (end - start)
+    async with AsyncSessionLocal() as db:
+        all_time = await db.scalar(select(func.sum(DailySales.revenue)))
+        previous_orders, previous_revenue = (await db.execute(
+            select(func.sum(DailySales.order_count), func.sum(DailySales.revenue))
+            .where(DailySales.day >= previous_start, DailySales.day < start)
+        )).one()
+        result = await db.execute(
+            select(DailySales)
+            .where(DailySales.day >= start, DailySales.day < end)
+            .order_by(desc(DailySales.day))
+        )
+        days = result.scalars().all()
+
+    orders = sum(day.order_count for day in days)
+    revenue = sum(day.revenue for day in days)
+    lines = [
+        f"=== SALES {label.upper()} ({start.isoformat()} to {(end - timedelta(days=1)).isoformat()}) ===",
+        f"Orders: {orders} | Items sold: {sum(day.items_sold for day in days)} | Revenue: {_money(revenue)}"
+        f" | Average order value: {_money(revenue / orders if orders else 0)}",
+        f"Previous period ({previous_start.isoformat()} to {(start - timedelta(days=1)).isoformat()}):"
+        f" {int(previous_orders or 0)} orders, {_money(float(previous_revenue or 0))}",
+        f"Total Revenue (All Time): {_money(float(all_time or 0))}",
+    ]
+    if len(days) > 1:
+        lines.append("By day, newest first:")
+        lines.extend(
+            f"- {day.day.isoformat()}: {day.order_count} orders, {_money(day.revenue)}" for day in days
+        )
+    return lines
+
+
+async def _load_top_products(start: date, end: date, label: str) -> List[str]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(
+                Product.name,
+                func.sum(DailyProductSales.quantity),
+                func.sum(DailyProductSales.revenue)
+            )
+            .join(DailyProductSales, Product.id == DailyProductSales.product_id)
+            .where(DailyProductSales.day >= start, DailyProductSales.day < end)
+            .group_by(Product.id, Product.name)
+            .order_by(desc(func.sum(DailyProductSales.quantity)))
+            .limit(10)
+        )
+        rows = result.all()
+
+    lines = [f"=== TOP PRODUCTS {label.upper()} ==="]
+    lines.extend(
+        f"{rank}. {name}: {int(quantity)} units | {_money(float(revenue))}"
+        for rank, (name, quantity, revenue) in enumerate(rows, start=1)
+    )
+    if not rows:
+        lines.append("- No sales in this period")
+    return lines
+
+
+async def _load_coupons(start: date, end: date, label: str) -> List[str]:
+    period_redemptions = (
+        select(
+            DailyCouponSales.code,
+            func.sum(DailyCouponSales.redemptions).label("redemptions"),
+            func.sum(DailyCouponSales.discount_amount).label("discount_amount")
+        )
+        .where(DailyCouponSales.day >= start, DailyCouponSales.day < end)
+        .group_by(DailyCouponSales.code)
+        .subquery()
+    )
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Coupon, period_redemptions.c.redemptions, period_redemptions.c.discount_amount)
+            .outerjoin(period_redemptions, period_redemptions.c.code == Coupon.code)
+            .where(Coupon.is_active == True)
+            .order_by(
+                desc(func.coalesce(period_redemptions.c.redemptions, 0)),
+                desc(Coupon.used_count),
+                Coupon.code
+            )
+        )
+        rows = result.all()
+
+    lines = [f"=== ACTIVE COUPONS ({label.upper()}) ===", f"Total Active Coupons: {len(rows)}"]
+    for coupon, redemptions, discount_amount in rows:
+        line = (
+            f"- {coupon.code}: {describe_coupon(vars(coupon))} | Used: {coupon.used_count} times"
+            f" | {int(redemptions or 0)} in period, {_money(float(discount_amount or 0))} discounted"
+        )
+        if coupon.usage_limit is not None:
+            line += f" | Limit: {coupon.usage_limit}"
+        if coupon.expires_at is not None:
+            line += f" | Expires: {coupon.expires_at.date().isoformat()}"
+        lines.append(line)
+    return lines
+
+
+async def _load_customers() -> List[str]:
+    """Company names and aggregates only; customer emails never go to the model"""
+    async with AsyncSessionLocal() as db:
+        companies = (await db.execute(
+            select(CompanyMetrics).order_by(desc(CompanyMetrics.lifetime_spend)).limit(5)
+        )).scalars().all()
+        totals = (await db.execute(
+            select(
+                func.count(),
+                func.count().filter(CustomerMetrics.order_count > 1),
+                func.count().filter(CustomerMetrics.company.is_(None)),
+                func.coalesce(func.avg(CustomerMetrics.lifetime_spend), 0),
+                func.coalesce(func.max(CustomerMetrics.lifetime_spend), 0)
+            )
+        )).one()
+
+    customer_count, repeat_count, without_company, average_spend, top_spend = totals
+    lines = ["=== TOP CUSTOMERS (LIFETIME) ===", "Companies:"]
+    lines.extend(
+        f"- {company.company}: {company.customer_count} customers, {company.order_count} orders,"
+        f" {_money(company.lifetime_spend)}"
+        for company in companies
+    )
+    lines.append(
+        f"Customers: {customer_count} total, {repeat_count} with repeat orders,"
+        f" {without_company} without a company | Average lifetime spend: {_money(float(average_spend))},"
+        f" highest: {_money(float(top_spend))}"
+    )
+    return lines
+
+
+def plan_sections(normalized_question: str) -> List[str]:
+    """Sections a question needs, in prompt order"""
+    sections = [name for name, pattern in SECTION_RULES if pattern.search(normalized_question)]
+    return sections or list(DEFAULT_SECTIONS)
+
+
+def fit_to_budget(sections: Sequence[List[str]], budget: int) -> Tuple[str, int]:
+    """
+    Join sections (heading line first) into at most budget estimated tokens.
+    Sections are kept in order; the one that overflows keeps the lines that
+    fit, and later sections are left out.
+    """
+    kept: List[str] = []
+    used = 0
+    for lines in sections:
+        heading, rows = lines[0], lines[1:]
+        cost = estimate_tokens(heading) + (estimate_tokens(rows[0]) if rows else 0)
+        if used + cost > budget:
+            break
+        kept.append("\n" + heading if kept else heading)
+        used += estimate_tokens(heading)
+        for index, row in enumerate(rows):
+            note = f"- ... {len(rows) - index} more not shown"
+            remaining = rows[index + 1:]
+            needed = estimate_tokens(row) + (estimate_tokens(note) if remaining else 0)
+            if used + needed > budget:
+                kept.append(note)
+                used += estimate_tokens(note)
+                return "\n".join(kept), used
+            kept.append(row)
+            used += estimate_tokens(row)
+    return "\n".join(kept), used
+
+
+async def _cached(key: Tuple, load: Callable[[], Awaitable[List[str]]]) -> List[str]:
+    lines, _ = await ai_section_cache.get_or_compute(key, load)
+    return lines
+
+
+async def plan_context(question: str) -> AIContext:
+    """
+    Prompt context for a question: the relevant sections, loaded
+    concurrently and trimmed to the token budget. The version is a hash of
+    the rendered text.
+    """
+    normalized = normalize_question(question)
+    today = datetime.now(timezone.utc).date()
+    label, start, end = question_period(normalized, today)
+    data_version = await current_data_version()
+
+    catalog = await _cached(("catalog", data_version), _load_catalog)
+    product_ids = tuple(sorted(match_products(normalized, catalog)))
+    section_names = plan_sections(normalized)
+
+    loaders: Dict[str, Tuple[Tuple, Callable[[], Awaitable[List[str]]]]] = {
+        "products": (("products", product_ids, start, end),
+                     lambda: _load_products(product_ids, start, end, label)),
+        "inventory": (("inventory",), _load_inventory),
+        "sales": (("sales", start, end), lambda: _load_sales(start, end, label)),
+        "top_products": (("top_products", start, end), lambda: _load_top_products(start, end, label)),
+        "coupons": (("coupons", start, end), lambda: _load_coupons(start, end, label)),
+        "customers": (("customers",), _load_customers),
+    }
+    if product_ids:
+        # Named products are the most specific data, so they are trimmed last
+        section_names.insert(0, "products")
+    sections = await asyncio.gather(*(
+        _cached((*loaders[name][0], data_version), loaders[name][1]) for name in section_names
+    ))
+
+    header = [f"Date: {today.isoformat()} (UTC)"]
+    text, tokens = fit_to_budget([header, *sections], settings.AI_CONTEXT_TOKEN_BUDGET)
+    return AIContext(
+        text=text,
+        data={"sections": section_names, "tokens": tokens, "period": label},
+        version=hashlib.sha256(text.encode("utf-8")).hexdigest()[:16],
+        computed_at=datetime.now(timezone.utc),
+        data_version=data_version
+    )
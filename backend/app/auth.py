@@ -91,6 +91,16 @@ async def get_current_user(
     return user
 
 
+async def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    """
+    Dependency for admin routes.
+    Returns the current user if their email is in ADMIN_EMAILS.
+    """
+    if current_user.email not in settings.ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+
 async def get_current_user_optional(
     authorization: str = Header(None),
     db: AsyncSession = Depends(get_db)
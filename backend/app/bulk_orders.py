@@ -0,0 +1,311 @@
+"""
+Bulk order ingestion for B2B procurement uploads.
+
+Orders arrive as NDJSON ({"product_id": ..., "quantity": ...} per line) or CSV
+(with a header containing product_id and quantity) and are validated while the
+body streams in. Product lookups are batched, prices are computed server-side
+from the catalog, and the order is written with bulk inserts. Memory grows with
+the number of distinct products, not with the number of lines.
+"""
+import csv
+import json
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.checkout import apply_coupons, add_order_coupons
+from app.config import get_settings
+from app.models import Order, OrderItem, Product, User
+from app.rollups import record_customer_order, record_order_sales
+from app.sales_cube import stage_order_rows
+from app.sketches import stage_order_sketch
+from app.trending import stage_trending_sales
+from app.recommendations import stage_related_order
+from app.schemas import BulkLineError, BulkOrderResponse, OrderItemResponse
+
+settings = get_settings()
+
+# Number of parsed lines validated per product lookup query
+LOOKUP_BATCH_SIZE = 500
+
+
+@dataclass
+class _BulkLine:
+    line: int
+    product_id: str
+    quantity: int
+
+
+async def _iter_text_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Split a byte stream into numbered lines without buffering the whole body"""
+    buffer = b""
+    line_no = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            line_no += 1
+            yield line_no, raw
+    if buffer:
+        yield line_no + 1, buffer
+
+
+def _parse_quantity(value) -> int:
+    quantity = int(value)
+    if quantity <= 0 or quantity != float(value):
+        raise ValueError
+    return quantity
+
+
+def unit_price_for(product: Product, quantity: int) -> float:
+    """Catalog price for a quantity, using the best applicable bulk pricing tier"""
+    price = product.base_price
+    for tier in product.tiered_pricing:
+        if quantity >= tier.min_quantity and tier.price < price:
+            price = tier.price
+    return price
+
+
+async def create_bulk_order(
+    db: AsyncSession,
+    chunks: AsyncIterator[bytes],
+    content_type: str,
+    current_user: User,
+    coupon_codes: List[str],
+    strict: bool = False
+) -> BulkOrderResponse:
+    """
+    Validate a streamed order and persist it in the given session.
+    Invalid lines are reported in line_errors and skipped, or reject the
+    whole order when strict is set. The caller owns the transaction and commits.
+    """
+    is_csv = "csv" in (content_type or "")
+    user_tier = current_user.tier or 1
+
+    errors: List[BulkLineError] = []
+    quantities: Dict[str, int] = defaultdict(int)
+    product_lines: Dict[str, List[int]] = defaultdict(list)
+    product_tiers: Dict[str, Optional[int]] = {}
+    pending: List[_BulkLine] = []
+    lines_received = 0
+    csv_columns: Optional[Dict[str, int]] = None
+
+    async def validate_pending():
+        unknown = {line.product_id for line in pending if line.product_id not in product_tiers}
+        if unknown:
+            result = await db.execute(
+                select(Product.id, Product.tier).where(Product.id.in_(unknown))
+            )
+            found = dict(result.all())
+            for product_id in unknown:
+                product_tiers[product_id] = found.get(product_id)
+
+        for line in pending:
+            tier = product_tiers[line.product_id]
+            if tier is None:
+                errors.append(BulkLineError(line=line.line, product_id=line.product_id, detail="Product not found"))
+            elif tier > user_tier:
+                errors.append(BulkLineError(
+                    line=line.line,
+                    product_id=line.product_id,
+                    detail="Product is not available for your tier"
+                ))
+            else:
+                quantities[line.product_id] += line.quantity
+                product_lines[line.product_id].append(line.line)
+        pending.clear()
+
+    async for line_no, raw in _iter_text_lines(chunks):
+        try:
+            text = raw.decode("utf-8-sig" if line_no == 1 else "utf-8").strip()
+        except UnicodeDecodeError:
+            errors.append(BulkLineError(line=line_no, detail="Line is not valid UTF-8"))
+            continue
+        if not text:
+            continue
+
+        if is_csv and csv_columns is None:
+            header = [column.strip().lower() for column in next(csv.reader([text]))]
+            if "product_id" not in header or "quantity" not in header:
+                raise HTTPException(status_code=400, detail="CSV header must include product_id and quantity")
+            csv_columns = {column: index for index, column in enumerate(header)}
+            continue
+
+        lines_received += 1
+        if lines_received > settings.BULK_ORDER_MAX_LINES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Bulk orders are limited to {settings.BULK_ORDER_MAX_LINES} lines"
+            )
+
+        try:
+            if is_csv:
+                row = next(csv.reader([text]))
+                product_id = row[csv_columns["product_id"]].strip()
+                quantity = _parse_quantity(row[csv_columns["quantity"]])
+            else:
+                row = json.loads(text)
+                product_id = str(row["product_id"]).strip()
+                quantity = _parse_quantity(row["quantity"])
+        except (ValueError, KeyError, IndexError, TypeError):
+            errors.append(BulkLineError(
+                line=line_no,
+                detail="Expected a product_id and a positive integer quantity"
+            ))
+            continue
+
+        pending.append(_BulkLine(line=line_no, product_id=product_id, quantity=quantity))
+        if len(pending) >= LOOKUP_BATCH_SIZE:
+            await validate_pending()
+
+    await validate_pending()
+
+    # Lock the ordered products in a consistent order, then check stock
+    products: Dict[str, Product] = {}
+    product_ids = sorted(quantities)
+    for start in range(0, len(product_ids), LOOKUP_BATCH_SIZE):
+        result = await db.execute(
+            select(Product)
+            .where(Product.id.in_(product_ids[start:start + LOOKUP_BATCH_SIZE]))
+            .order_by(Product.id)
+            .options(selectinload(Product.tiered_pricing))
+            .with_for_update()
+        )
+        products.update({product.id: product for product in result.scalars().all()})
+
+    for product_id in product_ids:
+        product = products.get(product_id)
+        if product is None:
+            # Deleted after validation
+            errors.extend(
+                BulkLineError(line=line, product_id=product_id, detail="Product not found")
+                for line in product_lines[product_id]
+            )
+            del quantities[product_id]
+        elif product.stock_quantity < quantities[product_id]:
+            for line in product_lines[product_id]:
+                errors.append(BulkLineError(
+                    line=line,
+                    product_id=product_id,
+                    detail=(
+                        f"Insufficient stock for product '{product.name}'. "
+                        f"Available: {product.stock_quantity}, ordered: {quantities[product_id]}"
+                    )
+                ))
+            del quantities[product_id]
+
+    errors.sort(key=lambda error: error.line)
+    if errors and strict:
+        raise HTTPException(status_code=422, detail=[error.model_dump() for error in errors])
+    if not quantities:
+        raise HTTPException(status_code=422, detail=[error.model_dump() for error in errors] or "Order must contain at least one item")
+
+    # Price lines server-side
+    lines = []
+    for product_id, quantity in quantities.items():
+        product = products[product_id]
+        unit_price = unit_price_for(product, quantity)
+        lines.append((product, quantity, unit_price))
+    subtotal = sum(quantity * unit_price for _, quantity, unit_price in lines)
+
+    applied_coupons, coupon_breakdown, total_discount = await apply_coupons(db, coupon_codes, subtotal)
+    coupon_codes_used = [coupon.code for coupon, _ in coupon_breakdown]
+    final_total = max(0, subtotal - total_discount)
+
+    items_brought = [
+        {"name": product.name, "quantity": quantity, "price": unit_price}
+        for product, quantity, unit_price in lines
+    ]
+    new_order = Order(
+        customer_email=current_user.email,
+        customer_name=current_user.name,
+        items_brought=items_brought,
+        subtotal=subtotal,
+        discount=total_discount,
+        total=final_total,
+        status="confirmed",
+        applied_coupon_code=",".join(coupon_codes_used) if coupon_codes_used else None,
+        company=current_user.server or None
+    )
+    db.add(new_order)
+    await db.flush()
+    add_order_coupons(db, new_order, coupon_breakdown)
+
+    item_rows = [
+        {
+            "order_id": new_order.id,
+            "order_created_at": new_order.created_at,
+            "product_id": product.id,
+            "product_name": product.name,
+            "quantity": quantity,
+            "unit_price": unit_price,
+            "total_price": unit_price * quantity,
+        }
+        for product, quantity, unit_price in lines
+    ]
+    await db.execute(insert(OrderItem), item_rows)
+
+    # Deduct stock; the flush batches these into one executemany UPDATE
+    for product, quantity, _ in lines:
+        product.stock_quantity -= quantity
+
+    result = await db.execute(select(User).where(User.id == current_user.id))
+    user = result.scalar_one()
+    await db.refresh(new_order)
+    user.order_history = (user.order_history or []) + [{
+        "order_id": new_order.id,
+        "items": [
+            {"product_id": product.id, "name": product.name, "quantity": quantity, "price": unit_price}
+            for product, quantity, unit_price in lines
+        ],
+        "total": final_total,
+        "coupons": coupon_codes_used,
+        "date": new_order.created_at.isoformat()
+    }]
+    user.coupons_used = (user.coupons_used or []) + coupon_codes_used
+    await db.flush()
+    await record_order_sales(
+        db,
+        new_order.created_at,
+        final_total,
+        [(row["product_id"], row["quantity"], row["total_price"]) for row in item_rows],
+        [(coupon.code, discount_amount) for coupon, discount_amount in coupon_breakdown]
+    )
+    await record_customer_order(db, new_order)
+    stage_order_rows(
+        db,
+        new_order,
+        user,
+        [(product, quantity, unit_price * quantity) for product, quantity, unit_price in lines]
+    )
+    stage_order_sketch(db, new_order)
+    stage_trending_sales(db, [(product, quantity) for product, quantity, _ in lines])
+    stage_related_order(db, [product for product, _, _ in lines])
+
+    return BulkOrderResponse(
+        order_id=new_order.id,
+        lines_received=lines_received,
+        lines_accepted=sum(len(product_lines[product_id]) for product_id in quantities),
+        line_errors=errors,
+        items=[
+            OrderItemResponse(
+                product_id=row["product_id"],
+                product_name=row["product_name"],
+                quantity=row["quantity"],
+                unit_price=row["unit_price"],
+                total_price=row["total_price"]
+            )
+            for row in item_rows
+        ],
+        subtotal=subtotal,
+        applied_coupons=applied_coupons,
+        total_discount=total_discount,
+        final_total=final_total,
+        created_at=new_order.created_at,
+        status=new_order.status
+    )
@@ -0,0 +1,322 @@
+"""
+In-process caches shared by the API routes.
+
+Caches whose data can be changed by another worker are validated against
+data_versions counters: the transaction that changes cached data bumps its
+counter (see _bump_data_versions), and readers compare the counter they
+read with the one their cached copy was built at. New orders are seen
+through daily_sales instead (see app/ai_context.py).
+"""
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.database import pop_committed, stage_for_commit
+from app.models import Coupon, DataVersion, Order, Product
+
+settings = get_settings()
+
+# data_versions counters
+AI_CONTEXT_VERSION = "ai_context"  # Changes to orders, products or coupons outside checkout
+BILLS_VERSION = "bills"  # Changes to existing orders (e.g. status) and deletions
+
+# Marks transactions that place orders; they are seen through daily_sales instead
+ORDER_PLACED = "order_placed"
+
+
+class LRUCache:
+    """Bounded least-recently-used cache"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value and mark it as recently used"""
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entry when full"""
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop a single entry"""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RefreshingCache:
+    """
+    Single value cache with stale-while-revalidate semantics.
+    Within max_age seconds the cached value is returned as is. After that the
+    stale value is still returned immediately while one background task
+    recomputes it; concurrent callers never start a second computation.
+    Only the very first call waits for the value.
+    """
+
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self._value: Any = None
+        self._updated_at: Optional[float] = None  # time.monotonic() of the last refresh
+        self.computed_at: Optional[datetime] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._generation = 0  # Bumped by clear() so refreshes started before it are discarded
+
+    @property
+    def age(self) -> float:
+        """Seconds since the cached value was computed"""
+        if self._updated_at is None:
+            return 0.0
+        return time.monotonic() - self._updated_at
+
+    @property
+    def has_value(self) -> bool:
+        return self._updated_at is not None
+
+    def _start_refresh(self, compute: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh(compute))
+        return self._refresh_task
+
+    async def _refresh(self, compute: Callable[[], Awaitable[Any]]) -> None:
+        generation = self._generation
+        try:
+            value = await compute()
+        except Exception as e:
+            if not self.has_value:
+                raise
+            print(f"⚠️  Cache refresh failed, serving stale value: {e}")
+            return
+        if generation != self._generation:
+            return
+        self._value = value
+        self._updated_at = time.monotonic()
+        self.computed_at = datetime.now(timezone.utc)
+
+    async def get(self, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, float]:
+        """Return the cached value and its age in seconds, refreshing it if needed"""
+        if not self.has_value:
+            # Shielded so one caller disconnecting does not cancel everyone's refresh.
+            # Loops when the value was cleared while the refresh was running.
+            while not self.has_value:
+                await asyncio.shield(self._start_refresh(compute))
+        elif self.age > self.max_age:
+            self._start_refresh(compute)
+        return self._value, self.age
+
+    def clear(self) -> None:
+        """Forget the cached value; the next call recomputes it"""
+        self._generation += 1
+        self._value = None
+        self._updated_at = None
+        self.computed_at = None
+
+
+class CoalescingTTLCache:
+    """
+    Bounded LRU cache of computed values that expire after ttl seconds.
+    Concurrent misses on the same key share one computation; failures are
+    not cached.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.ttl = ttl
+        self._entries = LRUCache(maxsize)  # key -> (value, expires_at)
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self._generation = 0  # Bumped by clear() so computations started before it are not cached
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a cached value that has not expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            self._entries.invalidate(key)
+            return None
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._entries.put(key, (value, time.monotonic() + self.ttl))
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (value, cached); cached is false for the callers that waited on a computation"""
+        value = self.get(key)
+        if value is not None:
+            return value, True
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._compute(key, compute, self._generation))
+            self._in_flight[key] = task
+        # Shielded so one caller disconnecting does not cancel the others' computation
+        return await asyncio.shield(task), False
+
+    async def _compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]], generation: int) -> Any:
+        try:
+            value = await compute()
+            if generation == self._generation:
+                self.put(key, value)
+            return value
+        finally:
+            if self._in_flight.get(key) is asyncio.current_task():
+                del self._in_flight[key]
+
+    def clear(self) -> None:
+        """Forget every value; computations already running are not cached or joined"""
+        self._generation += 1
+        self._entries.clear()
+        self._in_flight.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@dataclass(frozen=True)
+class CachedBill:
+    """Serialized bill body with the data needed to authorize and validate it"""
+    customer_email: str
+    body: bytes
+    etag: str
+    version: int  # BILLS_VERSION the body was read at
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from the response body"""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+# Bills of confirmed orders rarely change, so they are cached until any
+# existing order is changed or deleted (BILLS_VERSION moves).
+bill_cache = LRUCache(settings.BILL_CACHE_SIZE)
+
+
+# Assembled analytics dashboard, shared by every admin polling it
+dashboard_cache = RefreshingCache(settings.DASHBOARD_CACHE_SECONDS)
+
+
+# Admin AI chat answers keyed by normalized question and context version
+ai_answer_cache = CoalescingTTLCache(settings.AI_ANSWER_CACHE_SIZE, settings.AI_ANSWER_CACHE_SECONDS)
+
+
+# Prompt context sections keyed by section and parameters (app/ai_planner.py)
+ai_section_cache = CoalescingTTLCache(settings.AI_SECTION_CACHE_SIZE, settings.AI_CONTEXT_CACHE_SECONDS)
+
+
+def normalize_question(question: str) -> str:
+    """Case, punctuation and whitespace-insensitive form of a chat question"""
+    question = re.sub(r"['\u2019]", "", question.lower())
+    return " ".join(re.sub(r"[^\w\s$%.-]|(?<!\d)[.-]|[.-](?!\d)", " ", question).split())
+
+
+async def read_data_version(db: AsyncSession, name: str) -> int:
+    """Current value of a data_versions counter (0 before its first change)"""
+    result = await db.execute(select(DataVersion.version).where(DataVersion.name == name))
+    return result.scalar() or 0
+
+
+def cache_bill(order_id: str, customer_email: str, body: bytes, version: int) -> CachedBill:
+    """Store a serialized bill read at BILLS_VERSION version and return the cache entry"""
+    entry = CachedBill(customer_email=customer_email, body=body, etag=make_etag(body), version=version)
+    bill_cache.put(order_id, entry)
+    return entry
+
+
+def get_cached_bill(order_id: str, version: int) -> Optional[CachedBill]:
+    """A cached bill that is still current at BILLS_VERSION version"""
+    entry = bill_cache.get(order_id)
+    if entry is not None and entry.version != version:
+        bill_cache.invalidate(order_id)
+        return None
+    return entry
+
+
+def _changes_in_flush(session) -> set:
+    changes = set()
+    for instance in session.deleted:
+        if isinstance(instance, Order):
+            changes.update((AI_CONTEXT_VERSION, BILLS_VERSION))
+        elif isinstance(instance, (Product, Coupon)):
+            changes.add(AI_CONTEXT_VERSION)
+    for instance in session.dirty:
+        if isinstance(instance, (Order, Product, Coupon)) and session.is_modified(instance, include_collections=False):
+            changes.add(AI_CONTEXT_VERSION)
+            if isinstance(instance, Order):
+                changes.add(BILLS_VERSION)
+    for instance in session.new:
+        if isinstance(instance, Order):
+            changes.add(ORDER_PLACED)
+        elif isinstance(instance, (Product, Coupon)):
+            changes.add(AI_CONTEXT_VERSION)
+    return changes
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_data_changes(session, flush_context):
+    changes = _changes_in_flush(session)
+    if changes:
+        stage_for_commit(session, "data_changes", changes)
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_data_versions(session):
+    """
+    Bump the counters of the data the committing transaction changed.
+    Checkouts bump nothing: every order also updates its day's daily_sales
+    row, which the AI context version includes (see app/ai_context.py), so
+    they do not queue behind a shared counter row. Admin edits of products,
+    coupons and orders are rare and bump the counters in name order.
+    """
+    if session.get_nested_transaction() is not None:
+        return
+    session.flush()
+    changes = set(pop_committed(session, "data_changes"))
+    if ORDER_PLACED in changes:
+        changes.discard(AI_CONTEXT_VERSION)
+    names = sorted(changes & {AI_CONTEXT_VERSION, BILLS_VERSION})
+    if not names:
+        return
+    stmt = insert(DataVersion).values([{"name": name, "version": 1} for name in names])
+    session.connection().execute(stmt.on_conflict_do_update(
+        index_elements=[DataVersion.name],
+        set_={"version": DataVersion.version + 1}
+    ))
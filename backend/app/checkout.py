@@ -0,0 +1,417 @@
+"""
+Checkout: order creation shared by the synchronous and asynchronous order APIs
+"""
+import asyncio
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import BILLS_VERSION, cache_bill, read_data_version
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.models import Order, OrderItem, OrderCoupon, Product, Coupon, User, CheckoutQueueEntry
+from app.rollups import record_customer_order, record_order_sales
+from app.sales_cube import stage_order_rows
+from app.sketches import stage_order_sketch
+from app.trending import stage_trending_sales
+from app.recommendations import stage_related_order
+from app.schemas import (
+    PlaceOrderRequest,
+    OrderItemResponse,
+    BillResponse,
+    AppliedCouponInfo
+)
+
+settings = get_settings()
+
+
+async def apply_coupons(
+    db: AsyncSession,
+    coupon_codes: List[str],
+    subtotal: float
+) -> Tuple[List[AppliedCouponInfo], List[Tuple[Coupon, float]], float]:
+    """
+    Validate coupons and apply them sequentially to the subtotal.
+    Increments each applied coupon's usage count and returns the applied
+    coupon info, the (coupon, discount_amount) breakdown and the total discount.
+    """
+    applied_coupons = []
+    total_discount = 0.0
+    remaining_amount = subtotal
+    coupon_breakdown = []
+    
+    for coupon_code in coupon_codes:
+        if remaining_amount <= 0:
+            break
+            
+        # Fetch and validate coupon
+        query = select(Coupon).where(Coupon.code == coupon_code.upper())
+        result = await db.execute(query)
+        coupon = result.scalar_one_or_none()
+        
+        if not coupon:
+            raise HTTPException(status_code=404, detail=f"Coupon '{coupon_code}' not found")
+        
+        if not coupon.is_active:
+            raise HTTPException(status_code=400, detail=f"Coupon '{coupon_code}' is inactive")
+        
+        # Fix timezone comparison
+        if coupon.expires_at:
+            current_time = datetime.now(timezone.utc)
+            expires_at = coupon.expires_at.replace(tzinfo=timezone.utc) if coupon.expires_at.tzinfo is None else coupon.expires_at
+            if expires_at < current_time:
+                raise HTTPException(status_code=400, detail=f"Coupon '{coupon_code}' has expired")
+        
+        if coupon.usage_limit and coupon.used_count >= coupon.usage_limit:
+            raise HTTPException(status_code=400, detail=f"Coupon '{coupon_code}' usage limit reached")
+        
+        # Calculate discount
+        discount_amount = 0.0
+        
+        if coupon.makes_free:
+            discount_amount = remaining_amount
+        elif coupon.discount_type == "percentage":
+            discount_amount = remaining_amount * (coupon.discount_value / 100)
+        elif coupon.discount_type == "fixed":
+            discount_amount = min(coupon.discount_value, remaining_amount)
+        
+        remaining_amount -= discount_amount
+        total_discount += discount_amount
+        
+        applied_coupons.append(AppliedCouponInfo(
+            code=coupon.code,
+            discount_type=coupon.discount_type,
+            discount_value=coupon.discount_value,
+            discount_amount=discount_amount
+        ))
+        
+        coupon_breakdown.append((coupon, discount_amount))
+        
+        # Increment coupon usage count
+        coupon.used_count += 1
+    
+    return applied_coupons, coupon_breakdown, total_discount
+
+
+def add_order_coupons(
+    db: AsyncSession,
+    order: Order,
+    coupon_breakdown: List[Tuple[Coupon, float]]
+) -> None:
+    """Record the exact discount each coupon contributed"""
+    for position, (coupon, discount_amount) in enumerate(coupon_breakdown):
+        db.add(OrderCoupon(
+            order_id=order.id,
+            order_created_at=order.created_at,
+            coupon_id=coupon.id,
+            code=coupon.code,
+            position=position,
+            discount_type=coupon.discount_type,
+            discount_value=coupon.discount_value,
+            discount_amount=discount_amount
+        ))
+
+
+async def create_order(
+    db: AsyncSession,
+    request: PlaceOrderRequest,
+    current_user: User
+) -> BillResponse:
+    """
+    Validate, price and persist an order in the given session.
+    Deducts stock, increments coupon usage and updates the user's order
+    history and coupons used. The caller owns the transaction and commits.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Order must contain at least one item")
+    
+    # Calculate subtotal
+    subtotal = sum(item.price * item.quantity for item in request.items)
+    
+    # Apply coupons and calculate discount
+    applied_coupons, coupon_breakdown, total_discount = await apply_coupons(
+        db, request.coupon_codes, subtotal
+    )
+    coupon_codes_used = [coupon.code for coupon, _ in coupon_breakdown]
+    
+    final_total = max(0, subtotal - total_discount)
+    
+    # Prepare items_brought data
+    items_brought = [
+        {
+            "name": item.name,
+            "quantity": item.quantity,
+            "price": item.price
+        }
+        for item in request.items
+    ]
+    
+    # Create order
+    new_order = Order(
+        customer_email=current_user.email,
+        customer_name=current_user.name,
+        items_brought=items_brought,
+        subtotal=subtotal,
+        discount=total_discount,
+        total=final_total,
+        status="confirmed",
+        applied_coupon_code=",".join(coupon_codes_used) if coupon_codes_used else None,
+        company=current_user.server or None
+    )
+    
+    db.add(new_order)
+    await db.flush()  # Get order ID
+    
+    add_order_coupons(db, new_order, coupon_breakdown)
+    
+    # Create order items
+    order_items = []
+    cube_lines = []
+    for item in request.items:
+        # Verify product exists
+        product_query = select(Product).where(Product.id == item.product_id)
+        product_result = await db.execute(product_query)
+        product = product_result.scalar_one_or_none()
+        
+        if not product:
+            raise HTTPException(status_code=404, detail=f"Product '{item.product_id}' not found")
+        
+        # Check stock
+        if product.stock_quantity < item.quantity:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Insufficient stock for product '{product.name}'. Available: {product.stock_quantity}"
+            )
+        
+        # Deduct stock
+        product.stock_quantity -= item.quantity
+        
+        # Create order item with product name
+        order_item = OrderItem(
+            order_id=new_order.id,
+            order_created_at=new_order.created_at,
+            product_id=item.product_id,
+            product_name=product.name,
+            quantity=item.quantity,
+            unit_price=item.price,
+            total_price=item.price * item.quantity
+        )
+        db.add(order_item)
+        order_items.append(order_item)
+        cube_lines.append((product, item.quantity, order_item.total_price))
+    
+    # Update user's order history and coupons used
+    user_query = select(User).where(User.id == current_user.id)
+    user_result = await db.execute(user_query)
+    user = user_result.scalar_one()
+    
+    # Build detailed order info with product names and quantities
+    order_details = {
+        "order_id": new_order.id,
+        "items": [
+            {
+                "product_id": item.product_id,
+                "name": item.name,
+                "quantity": item.quantity,
+                "price": item.price
+            }
+            for item in request.items
+        ],
+        "total": final_total,
+        "coupons": coupon_codes_used,
+        "date": new_order.created_at.isoformat() if new_order.created_at else datetime.utcnow().isoformat()
+    }
+    
+    # Update order history
+    if user.order_history is None:
+        user.order_history = []
+    user.order_history.append(order_details)
+    
+    # Update coupons used
+    if user.coupons_used is None:
+        user.coupons_used = []
+    user.coupons_used.extend(coupon_codes_used)
+    
+    await db.flush()
+    await record_order_sales(
+        db,
+        new_order.created_at,
+        final_total,
+        [(item.product_id, item.quantity, item.total_price) for item in order_items],
+        [(coupon.code, discount_amount) for coupon, discount_amount in coupon_breakdown]
+    )
+    await record_customer_order(db, new_order)
+    stage_order_rows(db, new_order, user, cube_lines)
+    stage_order_sketch(db, new_order)
+    stage_trending_sales(db, [(product, quantity) for product, quantity, _ in cube_lines])
+    stage_related_order(db, [product for product, _, _ in cube_lines])
+    await db.refresh(new_order)
+    
+    # Prepare response
+    order_items_response = [
+        OrderItemResponse(
+            product_id=item.product_id,
+            quantity=item.quantity,
+            unit_price=item.unit_price,
+            total_price=item.total_price
+        )
+        for item in order_items
+    ]
+    
+    return BillResponse(
+        order_id=new_order.id,
+        customer_name=new_order.customer_name or "Guest",
+        customer_email=new_order.customer_email,
+        items=order_items_response,
+        subtotal=subtotal,
+        applied_coupons=applied_coupons,
+        total_discount=total_discount,
+        final_total=final_total,
+        created_at=new_order.created_at,
+        status=new_order.status
+    )
+
+
+async def validate_order_request(db: AsyncSession, request: PlaceOrderRequest) -> None:
+    """
+    Cheap up-front validation for orders accepted asynchronously.
+    Stock and coupon usage limits are checked again when the order is placed.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Order must contain at least one item")
+    
+    product_ids = {item.product_id for item in request.items}
+    result = await db.execute(select(Product.id).where(Product.id.in_(product_ids)))
+    missing = product_ids - set(result.scalars().all())
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Product '{sorted(missing)[0]}' not found")
+    
+    codes = {code.upper() for code in request.coupon_codes}
+    if codes:
+        result = await db.execute(select(Coupon).where(Coupon.code.in_(codes)))
+        coupons = {coupon.code: coupon for coupon in result.scalars().all()}
+        for code in request.coupon_codes:
+            coupon = coupons.get(code.upper())
+            if not coupon:
+                raise HTTPException(status_code=404, detail=f"Coupon '{code}' not found")
+            if not coupon.is_active:
+                raise HTTPException(status_code=400, detail=f"Coupon '{code}' is inactive")
+
+
+# SQLSTATEs of failures that succeed when retried: serialization failure, deadlock
+TRANSIENT_SQLSTATES = {"40001", "40P01"}
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether a database error is worth retrying (deadlocks, serialization failures, lost connections)"""
+    if isinstance(error, OperationalError):
+        return True
+    return isinstance(error, DBAPIError) and getattr(error.orig, "sqlstate", None) in TRANSIENT_SQLSTATES
+
+
+class CheckoutPipeline:
+    """
+    Worker pool that drains the checkout_queue table.
+    Each worker claims a batch of queued orders with SKIP LOCKED, places
+    them in savepoints and commits the whole batch at once (group commit).
+    A crash rolls the batch back, leaving its entries queued; an entry that
+    hits a transient database error stays queued for up to
+    CHECKOUT_MAX_ATTEMPTS tries.
+    """
+
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    def notify(self) -> None:
+        """Wake idle workers after an order was enqueued"""
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        for index in range(settings.CHECKOUT_WORKERS):
+            self._tasks.append(asyncio.create_task(self._run(), name=f"checkout-worker-{index}"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                processed = await self.process_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Checkout worker error: {e}")
+                processed = 0
+            
+            if processed < settings.CHECKOUT_BATCH_SIZE:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(),
+                        timeout=settings.CHECKOUT_POLL_INTERVAL_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+    async def process_batch(self) -> int:
+        """Place up to CHECKOUT_BATCH_SIZE queued orders in one transaction"""
+        bills = []
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(CheckoutQueueEntry)
+                .where(CheckoutQueueEntry.status == "queued")
+                .order_by(CheckoutQueueEntry.created_at)
+                .limit(settings.CHECKOUT_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )
+            entries = result.scalars().all()
+            if not entries:
+                return 0
+            
+            for entry in entries:
+                try:
+                    async with db.begin_nested():
+                        user = await db.get(User, entry.user_id)
+                        if user is None:
+                            raise HTTPException(status_code=404, detail="User not found")
+                        bill = await create_order(db, PlaceOrderRequest(**entry.payload), user)
+                except HTTPException as e:
+                    entry.status = "failed"
+                    entry.error = str(e.detail)
+                except Exception as e:
+                    # Any failure only affects this entry (its savepoint is rolled back);
+                    # otherwise one bad payload would block every order behind it
+                    entry.attempts += 1
+                    if is_transient_error(e) and entry.attempts < settings.CHECKOUT_MAX_ATTEMPTS:
+                        print(f"⚠️  Retrying queue entry {entry.token} (attempt {entry.attempts}): {e}")
+                        continue
+                    print(f"❌ Checkout failed for queue entry {entry.token}: {e}")
+                    entry.status = "failed"
+                    entry.error = "Order processing failed"
+                else:
+                    entry.status = "completed"
+                    entry.order_id = bill.order_id
+                    bills.append(bill)
+                entry.processed_at = datetime.now(timezone.utc)
+            
+            bills_version = await read_data_version(db, BILLS_VERSION)
+            await db.commit()
+        
+        for bill in bills:
+            cache_bill(bill.order_id, bill.customer_email, bill.model_dump_json().encode(), bills_version)
+        return len(entries)
+
+
+checkout_pipeline = CheckoutPipeline()
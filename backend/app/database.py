@@ -1,6 +1,8 @@
 
+from typing import Iterable, List, Union
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import Session, declarative_base
 from app.config import get_settings
 
 settings = get_settings()
@@ -45,11 +47,58 @@ async def get_db() -> AsyncSession:
 
 
 async def init_db():
-    """Create all tables in the database"""
+    """Create all tables in the database and the upcoming order partitions"""
+    from app.partitions import ensure_current_partitions
+    
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await ensure_current_partitions(conn, settings.PARTITION_MONTHS_AHEAD)
 
 
 async def close_db():
     """Close database connections"""
     await engine.dispose()
+
+
+def stage_for_commit(db: Union[AsyncSession, Session], key: str, items: Iterable) -> None:
+    """
+    Queue items under key until the session commits (see pop_committed).
+    They are dropped if the savepoint or transaction they were staged in
+    rolls back, while items staged in other savepoints are kept.
+    """
+    session = db.sync_session if isinstance(db, AsyncSession) else db
+    transaction = session.get_nested_transaction() or session.get_transaction() or session.begin()
+    staged = session.info.setdefault("staged_for_commit", {})
+    staged.setdefault(key, []).append((transaction, list(items)))
+
+
+def pop_committed(session: Session, key: str) -> List:
+    """
+    Items staged under key, in staging order; call from a before_commit or
+    after_commit listener. Those also fire when a savepoint is released,
+    and then nothing is returned: the items wait for the outermost commit.
+    """
+    if session.get_nested_transaction() is not None:
+        return []
+    return [item for _, items in session.info.get("staged_for_commit", {}).pop(key, ()) for item in items]
+
+
+def _staged_within(transaction, rolled_back) -> bool:
+    while transaction is not None:
+        if transaction is rolled_back:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back_items(session, previous_transaction):
+    """Drop items staged in the transaction or savepoint that was just rolled back"""
+    staged = session.info.get("staged_for_commit")
+    if not staged:
+        return
+    for key, entries in list(staged.items()):
+        staged[key] = [
+            (transaction, items) for transaction, items in entries
+            if not _staged_within(transaction, previous_transaction)
+        ]
@@ -0,0 +1,157 @@
+"""
+Inventory velocity and days-of-stock forecasting.
+
+Sales velocity is the exponentially smoothed number of units sold per day
+over the last FORECAST_LOOKBACK_DAYS complete UTC days, read from the
+daily_product_sales rollup. The whole catalog is smoothed at once as a
+products x days matrix; days before a product existed are left out of its
+series. From the velocity and its smoothed deviation:
+
+    days_of_stock = stock / velocity
+    reorder_point = velocity * lead_time + safety_factor * stddev * sqrt(lead_time)
+
+forecast_inventory.py recomputes the inventory_forecasts table nightly and
+the restock endpoint reads only that table.
+"""
+import math
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.config import get_settings
+from app.models import DailyProductSales, InventoryForecast, Product
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+settings = get_settings()
+
+
+def _smooth_series(values: List[Optional[float]], alpha: float) -> Tuple[float, float]:
+    """Smoothed level and standard deviation of one series; None marks days to skip"""
+    observed = [value for value in values if value is not None]
+    if not observed:
+        return 0.0, 0.0
+    level = sum(observed) / len(observed)
+    variance = sum((value - level) ** 2 for value in observed) / len(observed)
+    for value in observed:
+        error = value - level
+        level += alpha * error
+        variance = (1 - alpha) * (variance + alpha * error * error)
+    return level, math.sqrt(variance)
+
+
+def _smooth_matrix(sales: "np.ndarray", alpha: float) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Smoothed level and standard deviation per row of a products x days
+    matrix, NaN marking days to skip. Each day is one vectorized step over
+    the whole catalog.
+    """
+    observed = ~np.isnan(sales)
+    counts = observed.sum(axis=1)
+    filled = np.where(observed, sales, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        level = np.where(counts > 0, filled.sum(axis=1) / counts, 0.0)
+        variance = np.where(
+            counts > 0,
+            (np.where(observed, sales - level[:, None], 0.0) ** 2).sum(axis=1) / counts,
+            0.0
+        )
+    for day in range(sales.shape[1]):
+        seen = observed[:, day]
+        error = filled[:, day] - level
+        level = np.where(seen, level + alpha * error, level)
+        variance = np.where(seen, (1 - alpha) * (variance + alpha * error * error), variance)
+    return level, np.sqrt(variance)
+
+
+def _forecast_row(
+    stock: int,
+    velocity: float,
+    stddev: float,
+    lead_time_days: float,
+    safety_factor: float
+) -> Tuple[Optional[float], int]:
+    """days_of_stock and reorder_point for one product"""
+    days_of_stock = stock / velocity if velocity > 1e-9 else None
+    reorder_point = math.ceil(
+        velocity * lead_time_days + safety_factor * stddev * math.sqrt(lead_time_days) - 1e-9
+    )
+    return days_of_stock, max(reorder_point, 0)
+
+
+async def compute_forecasts(db: AsyncSession, today: Optional[date] = None) -> List[dict]:
+    """Forecast every product from the rollups; returns inventory_forecasts rows"""
+    today = today or datetime.now(timezone.utc).date()
+    lookback = settings.FORECAST_LOOKBACK_DAYS
+    first_day = today - timedelta(days=lookback)  # Today is incomplete and left out
+
+    result = await db.execute(select(Product.id, Product.stock_quantity, Product.created_at))
+    products = result.all()
+    index = {product_id: row for row, (product_id, _, _) in enumerate(products)}
+
+    result = await db.execute(
+        select(DailyProductSales.product_id, DailyProductSales.day, DailyProductSales.quantity)
+        .where(DailyProductSales.day >= first_day, DailyProductSales.day < today)
+    )
+    sales = result.all()
+
+    # Days before a product was created are not part of its series
+    first_columns = [
+        max((created_at.astimezone(timezone.utc).date() - first_day).days, 0) if created_at else 0
+        for _, _, created_at in products
+    ]
+
+    if np is not None and products:
+        matrix = np.zeros((len(products), lookback))
+        rows = np.array([index[product_id] for product_id, _, _ in sales if product_id in index], dtype=np.int64)
+        columns = np.array([(day - first_day).days for product_id, day, _ in sales if product_id in index], dtype=np.int64)
+        quantities = np.array([quantity for product_id, _, quantity in sales if product_id in index], dtype=float)
+        np.add.at(matrix, (rows, columns), quantities)
+        matrix[np.arange(lookback)[None, :] < np.array(first_columns)[:, None]] = np.nan
+        velocities, stddevs = (array.tolist() for array in _smooth_matrix(matrix, settings.FORECAST_SMOOTHING))
+    else:
+        series: Dict[int, List[Optional[float]]] = {
+            row: [None] * first_columns[row] + [0.0] * (lookback - first_columns[row])
+            for row in range(len(products))
+        }
+        for product_id, day, quantity in sales:
+            row = index.get(product_id)
+            column = (day - first_day).days
+            if row is not None and series[row][column] is not None:
+                series[row][column] += quantity
+        smoothed = [_smooth_series(series[row], settings.FORECAST_SMOOTHING) for row in range(len(products))]
+        velocities = [level for level, _ in smoothed]
+        stddevs = [stddev for _, stddev in smoothed]
+
+    computed_at = datetime.now(timezone.utc)
+    forecasts = []
+    for (product_id, stock, _), velocity, stddev in zip(products, velocities, stddevs):
+        days_of_stock, reorder_point = _forecast_row(
+            stock, velocity, stddev, settings.RESTOCK_LEAD_TIME_DAYS, settings.RESTOCK_SAFETY_FACTOR
+        )
+        forecasts.append({
+            "product_id": product_id,
+            "stock_quantity": stock,
+            "velocity": velocity,
+            "velocity_stddev": stddev,
+            "days_of_stock": days_of_stock,
+            "reorder_point": reorder_point,
+            "computed_at": computed_at,
+        })
+    return forecasts
+
+
+async def refresh_forecasts(engine: AsyncEngine) -> int:
+    """Replace the inventory_forecasts table in one transaction; returns the number of products"""
+    async with AsyncSession(engine) as db:
+        forecasts = await compute_forecasts(db)
+        await db.execute(delete(InventoryForecast))
+        if forecasts:
+            db.add_all(InventoryForecast(**forecast) for forecast in forecasts)
+        await db.commit()
+    return len(forecasts)
@@ -0,0 +1,191 @@
+"""
+Idempotency-Key support for order placement.
+
+The first request with a key claims it in its own committed transaction so
+that concurrent duplicates can see it. The order transaction then stores the
+serialized result on the same row before committing, and duplicates replay
+that stored result instead of re-running checkout.
+
+A claim is a lease of IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS: if the owning
+process dies before completing or releasing the key, a retry takes the key
+over once the lease has expired instead of getting 409 until the key
+expires. An owner that outlives its lease cannot complete the key, so its
+order is rolled back rather than placed twice.
+"""
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, select, update, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.models import IdempotencyKey
+
+settings = get_settings()
+
+# Expired keys are purged at most once per interval
+PURGE_INTERVAL_SECONDS = 60
+POLL_INTERVAL_SECONDS = 0.1
+
+_last_purge = 0.0
+
+
+def hash_request(payload: str) -> str:
+    """Fingerprint of the request body a key was first used with"""
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def _purge_expired(db: AsyncSession) -> None:
+    global _last_purge
+    now = time.monotonic()
+    if now - _last_purge < PURGE_INTERVAL_SECONDS:
+        return
+    _last_purge = now
+    await db.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.now(timezone.utc))
+    )
+
+
+def _lease_expired(record: IdempotencyKey, now: datetime) -> bool:
+    return (
+        record.status == "in_progress"
+        and record.claimed_at is not None
+        and record.claimed_at < now - timedelta(seconds=settings.IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS)
+    )
+
+
+async def claim_key(user_id: str, key: str, request_hash: str) -> Optional[datetime]:
+    """
+    Try to claim a key for this request.
+    Returns the claim time when the caller owns the key and should run
+    checkout, else None. An expired key, or an in-progress claim whose
+    lease expired, is reclaimed as if it were new.
+    """
+    now = datetime.now(timezone.utc)
+    values = {
+        "user_id": user_id,
+        "key": key,
+        "request_hash": request_hash,
+        "status": "in_progress",
+        "order_id": None,
+        "response_status": None,
+        "response_body": None,
+        "created_at": now,
+        "claimed_at": now,
+        "expires_at": now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS),
+    }
+    stmt = insert(IdempotencyKey).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[IdempotencyKey.user_id, IdempotencyKey.key],
+        set_={name: stmt.excluded[name] for name in values if name not in ("user_id", "key")},
+        where=or_(
+            IdempotencyKey.expires_at < now,
+            and_(
+                IdempotencyKey.status == "in_progress",
+                IdempotencyKey.claimed_at < now - timedelta(seconds=settings.IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS)
+            )
+        )
+    ).returning(IdempotencyKey.key)
+
+    async with AsyncSessionLocal() as db:
+        await _purge_expired(db)
+        result = await db.execute(stmt)
+        claimed = result.scalar_one_or_none() is not None
+        await db.commit()
+    return now if claimed else None
+
+
+async def wait_for_result(user_id: str, key: str, request_hash: str) -> Optional[IdempotencyKey]:
+    """
+    Wait for the request that owns a key to finish and return its stored result.
+    Returns None when the owner's lease expired, so the caller can claim the
+    key. Raises 422 if the key was used with a different request body and 409
+    if the original request is still running after IDEMPOTENCY_WAIT_SECONDS.
+    """
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(IdempotencyKey).where(
+                    IdempotencyKey.user_id == user_id,
+                    IdempotencyKey.key == key
+                )
+            )
+            record = result.scalar_one_or_none()
+
+        if record is None:
+            # The original request failed and released the key
+            raise HTTPException(
+                status_code=409,
+                detail="The original request with this Idempotency-Key failed; retry the request"
+            )
+        if record.request_hash != request_hash:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request"
+            )
+        if record.status == "completed":
+            return record
+        if _lease_expired(record, datetime.now(timezone.utc)):
+            return None
+        if time.monotonic() >= deadline:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still being processed"
+            )
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+
+async def complete_key(
+    db: AsyncSession,
+    user_id: str,
+    key: str,
+    claimed_at: datetime,
+    order_id: str,
+    response_body: bytes,
+    response_status: int = 200
+) -> None:
+    """
+    Store the result in the caller's transaction so it commits with the order.
+    Raises 409 if the claim was taken over after its lease expired.
+    """
+    result = await db.execute(
+        update(IdempotencyKey)
+        .where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.status == "in_progress",
+            IdempotencyKey.claimed_at == claimed_at
+        )
+        .values(
+            status="completed",
+            order_id=order_id,
+            response_status=response_status,
+            response_body=response_body.decode()
+        )
+    )
+    if result.rowcount == 0:
+        raise HTTPException(
+            status_code=409,
+            detail="The Idempotency-Key claim expired while the order was being placed; retry the request"
+        )
+
+
+async def release_key(user_id: str, key: str, claimed_at: datetime) -> None:
+    """Drop our in-progress claim after checkout failed so the client can retry"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key,
+                IdempotencyKey.status == "in_progress",
+                IdempotencyKey.claimed_at == claimed_at
+            )
+        )
+        await db.commit()
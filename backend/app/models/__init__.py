@@ -1,23 +1,60 @@
 """
 Database models using SQLAlchemy ORM with async support
 """
-from sqlalchemy import Column, String, Float, Integer, Boolean, DateTime, ForeignKey, JSON
+from sqlalchemy import (
+    BigInteger, Column, String, Float, Integer, Boolean, Date, DateTime, ForeignKey, ForeignKeyConstraint,
+    JSON, LargeBinary, Text, Uuid
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from sqlalchemy.types import TypeDecorator
 from app.database import Base
+from datetime import datetime, timezone
+import secrets
+import time
 import uuid
 
 
 def generate_uuid():
-    """Generate UUID string for primary keys"""
-    return str(uuid.uuid4())
+    """
+    Generate a time-ordered UUIDv7 string for primary keys.
+    The leading 48 bits are the Unix time in milliseconds, so new keys land at
+    the right-hand edge of the index instead of at random pages.
+    """
+    value = (time.time_ns() // 1_000_000) << 80 | secrets.randbits(80)
+    value = (value & ~(0xF << 76)) | (0x7 << 76)  # version 7
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)  # RFC 4122 variant
+    return str(uuid.UUID(int=value))
+
+
+class GUID(TypeDecorator):
+    """
+    Native 16-byte UUID column exposed to Python as a string.
+    Values that are not UUIDs (e.g. a malformed id in a URL) bind as NULL,
+    so lookups by them find nothing instead of raising a database error.
+    """
+    impl = Uuid(as_uuid=False)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        try:
+            return str(uuid.UUID(str(value)))
+        except ValueError:
+            return None
+
+
+def utcnow():
+    """Current UTC time, for timestamps that must be known before insert"""
+    return datetime.now(timezone.utc)
 
 
 class Product(Base):
     """Product model with tiered pricing support"""
     __tablename__ = "products"
     
-    id = Column(String, primary_key=True, default=generate_uuid)
+    id = Column(GUID, primary_key=True, default=generate_uuid)
     name = Column(String(255), nullable=False, index=True)
     description = Column(String, nullable=True)
     base_price = Column(Float, nullable=False)
@@ -37,8 +74,8 @@ class TieredPricing(Base):
     """Bulk pricing tiers for products"""
     __tablename__ = "tiered_pricing"
     
-    id = Column(String, primary_key=True, default=generate_uuid)
-    product_id = Column(String, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    id = Column(GUID, primary_key=True, default=generate_uuid)
+    product_id = Column(GUID, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
     min_quantity = Column(Integer, nullable=False)
     price = Column(Float, nullable=False)
     
@@ -50,7 +87,7 @@ class Coupon(Base):
     """Coupon model with validation fields"""
     __tablename__ = "coupons"
     
-    id = Column(String, primary_key=True, default=generate_uuid)
+    id = Column(GUID, primary_key=True, default=generate_uuid)
     code = Column(String(50), unique=True, nullable=False, index=True)
     discount_type = Column(String(20), nullable=False)
     discount_value = Column(Float, nullable=False)
@@ -63,10 +100,15 @@ class Coupon(Base):
 
 
 class Order(Base):
-    """Order model with customer and payment info"""
+    """
+    Order model with customer and payment info.
+    Range-partitioned by month on created_at, which is therefore part of the
+    primary key (see app/partitions.py).
+    """
     __tablename__ = "orders"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
     
-    id = Column(String, primary_key=True, default=generate_uuid)
+    id = Column(GUID, primary_key=True, default=generate_uuid)
     customer_email = Column(String(255), nullable=False, index=True)
     customer_name = Column(String(255), nullable=True)
     items_brought = Column(JSON, nullable=True)  # List of items with name and quantity
@@ -75,19 +117,41 @@ class Order(Base):
     total = Column(Float, nullable=False)
     status = Column(String(50), default="confirmed", nullable=False)
     applied_coupon_code = Column(String(50), nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    company = Column(String(255), nullable=True)  # User.server when the order was placed
+    created_at = Column(
+        DateTime(timezone=True),
+        primary_key=True,
+        index=True,
+        default=utcnow,
+        server_default=func.now()
+    )
     
     # Relationships
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
+    coupons = relationship(
+        "OrderCoupon",
+        back_populates="order",
+        cascade="all, delete-orphan",
+        order_by="OrderCoupon.position"
+    )
 
 
 class OrderItem(Base):
-    """Individual items in an order"""
+    """Individual items in an order, co-partitioned with orders on the order timestamp"""
     __tablename__ = "order_items"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["order_id", "order_created_at"],
+            ["orders.id", "orders.created_at"],
+            ondelete="CASCADE"
+        ),
+        {"postgresql_partition_by": "RANGE (order_created_at)"},
+    )
     
-    id = Column(String, primary_key=True, default=generate_uuid)
-    order_id = Column(String, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
-    product_id = Column(String, ForeignKey("products.id", ondelete="RESTRICT"), nullable=False)
+    id = Column(GUID, primary_key=True, default=generate_uuid)
+    order_id = Column(GUID, nullable=False, index=True)
+    order_created_at = Column(DateTime(timezone=True), primary_key=True)
+    product_id = Column(GUID, ForeignKey("products.id", ondelete="RESTRICT"), nullable=False)
     product_name = Column(String(255), nullable=True)
     quantity = Column(Integer, nullable=False)
     unit_price = Column(Float, nullable=False)
@@ -98,11 +162,177 @@ class OrderItem(Base):
     product = relationship("Product", back_populates="order_items")
 
 
+class OrderCoupon(Base):
+    """Per-coupon discount breakdown recorded at checkout, co-partitioned with orders"""
+    __tablename__ = "order_coupons"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["order_id", "order_created_at"],
+            ["orders.id", "orders.created_at"],
+            ondelete="CASCADE"
+        ),
+        {"postgresql_partition_by": "RANGE (order_created_at)"},
+    )
+    
+    id = Column(GUID, primary_key=True, default=generate_uuid)
+    order_id = Column(GUID, nullable=False, index=True)
+    order_created_at = Column(DateTime(timezone=True), primary_key=True)
+    coupon_id = Column(GUID, ForeignKey("coupons.id", ondelete="SET NULL"), nullable=True)
+    code = Column(String(50), nullable=False, index=True)
+    position = Column(Integer, nullable=False, default=0)  # Order in which the coupon was applied
+    discount_type = Column(String(20), nullable=False)
+    discount_value = Column(Float, nullable=False)
+    discount_amount = Column(Float, nullable=False)
+    
+    # Relationships
+    order = relationship("Order", back_populates="coupons")
+
+
+class DailySales(Base):
+    """Per-day order totals, maintained at checkout for the analytics dashboard"""
+    __tablename__ = "daily_sales"
+    
+    day = Column(Date, primary_key=True)  # UTC date of Order.created_at
+    order_count = Column(Integer, default=0, nullable=False)
+    items_sold = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0, nullable=False)  # Sum of Order.total
+
+
+class DailyProductSales(Base):
+    """Per-day, per-product quantities and item revenue, maintained at checkout"""
+    __tablename__ = "daily_product_sales"
+    
+    day = Column(Date, primary_key=True)
+    product_id = Column(GUID, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    quantity = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0, nullable=False)  # Sum of OrderItem.total_price
+
+
+class DailyCouponSales(Base):
+    """Per-day, per-coupon redemptions and discounts, maintained at checkout"""
+    __tablename__ = "daily_coupon_sales"
+    
+    day = Column(Date, primary_key=True)
+    code = Column(String(50), primary_key=True)
+    redemptions = Column(Integer, default=0, nullable=False)
+    discount_amount = Column(Float, default=0, nullable=False)  # Sum of OrderCoupon.discount_amount
+    order_revenue = Column(Float, default=0, nullable=False)  # Sum of Order.total of the redeeming orders
+
+
+class DailySketch(Base):
+    """Mergeable per-day sketches of distinct customers and order totals (see app/sketches.py)"""
+    __tablename__ = "daily_sketches"
+    
+    day = Column(Date, primary_key=True)
+    customers = Column(LargeBinary, nullable=False)  # HyperLogLog registers
+    order_totals = Column(JSON, nullable=False)  # Log-bucketed order total counts
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class DataVersion(Base):
+    """
+    Change counter bumped in the transaction that changes the data it
+    covers, so every worker can tell whether its cached copy is current
+    """
+    __tablename__ = "data_versions"
+    
+    name = Column(String(50), primary_key=True)
+    version = Column(BigInteger, default=0, nullable=False)
+
+
+class PendingSketchOrder(Base):
+    """Order written with its checkout transaction and not yet merged into daily_sketches"""
+    __tablename__ = "pending_sketch_orders"
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    order_created_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    customer_email = Column(String(255), nullable=False)
+    total = Column(Float, nullable=False)
+
+
+class CustomerMetrics(Base):
+    """Lifetime order totals per customer, maintained at checkout"""
+    __tablename__ = "customer_metrics"
+    
+    customer_email = Column(String(255), primary_key=True)
+    company = Column(String(255), nullable=True, index=True)  # Company of the latest order placed with one
+    order_count = Column(Integer, default=0, nullable=False, index=True)
+    lifetime_spend = Column(Float, default=0, nullable=False, index=True)  # Sum of Order.total
+    total_discount = Column(Float, default=0, nullable=False)  # Sum of Order.discount
+    first_order_at = Column(DateTime(timezone=True), nullable=False)
+    last_order_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class CompanyCustomer(Base):
+    """Customers who ordered for a company, so each is counted once per company"""
+    __tablename__ = "company_customers"
+    
+    company = Column(String(255), primary_key=True)
+    customer_email = Column(String(255), primary_key=True)
+
+
+class CompanyMetrics(Base):
+    """Lifetime order totals per company (Order.company), maintained at checkout"""
+    __tablename__ = "company_metrics"
+    
+    company = Column(String(255), primary_key=True)
+    customer_count = Column(Integer, default=0, nullable=False)  # Customers who ordered
+    order_count = Column(Integer, default=0, nullable=False)
+    lifetime_spend = Column(Float, default=0, nullable=False)
+    total_discount = Column(Float, default=0, nullable=False)
+    first_order_at = Column(DateTime(timezone=True), nullable=False)
+    last_order_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class InventoryForecast(Base):
+    """Nightly per-product sales velocity and restock forecast (see app/forecasting.py)"""
+    __tablename__ = "inventory_forecasts"
+    
+    product_id = Column(GUID, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    stock_quantity = Column(Integer, nullable=False)  # Stock when the forecast was computed
+    velocity = Column(Float, nullable=False)  # Smoothed units sold per day
+    velocity_stddev = Column(Float, nullable=False)
+    days_of_stock = Column(Float, nullable=True)  # NULL when the product is not selling
+    reorder_point = Column(Integer, nullable=False)
+    computed_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class IdempotencyKey(Base):
+    """Stored outcome of an order placement made with an Idempotency-Key header"""
+    __tablename__ = "idempotency_keys"
+    
+    user_id = Column(GUID, ForeignKey("users.userid", ondelete="CASCADE"), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    status = Column(String(20), default="in_progress", nullable=False)  # in_progress, completed
+    order_id = Column(GUID, nullable=True)
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)  # Serialized BillResponse
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    claimed_at = Column(DateTime(timezone=True), nullable=True)  # Start of the current in-progress claim's lease
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class CheckoutQueueEntry(Base):
+    """Durable queue of orders accepted by the asynchronous checkout API"""
+    __tablename__ = "checkout_queue"
+    
+    token = Column(GUID, primary_key=True, default=generate_uuid)
+    user_id = Column(GUID, ForeignKey("users.userid", ondelete="CASCADE"), nullable=False, index=True)
+    payload = Column(JSON, nullable=False)  # Serialized PlaceOrderRequest
+    status = Column(String(20), default="queued", nullable=False, index=True)  # queued, completed, failed
+    attempts = Column(Integer, default=0, server_default="0", nullable=False)  # Tries that hit a transient database error
+    order_id = Column(GUID, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+
 class User(Base):
     """User model for authentication and order tracking"""
     __tablename__ = "users"
     
-    id = Column(String, primary_key=True, default=generate_uuid, name="userid")
+    id = Column(GUID, primary_key=True, default=generate_uuid, name="userid")
     email = Column(String(255), unique=True, nullable=False, index=True)
     password = Column(String(255), nullable=False)  # Hashed password
     name = Column(String(255), nullable=True)
@@ -123,8 +353,8 @@ class Cart(Base):
     """Shopping cart model for persistent cart storage"""
     __tablename__ = "carts"
     
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, ForeignKey("users.userid", ondelete="CASCADE"), nullable=False, unique=True)
+    id = Column(GUID, primary_key=True, default=generate_uuid)
+    user_id = Column(GUID, ForeignKey("users.userid", ondelete="CASCADE"), nullable=False, unique=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -137,9 +367,9 @@ class CartItem(Base):
     """Individual items in a shopping cart"""
     __tablename__ = "cart_items"
     
-    id = Column(String, primary_key=True, default=generate_uuid)
-    cart_id = Column(String, ForeignKey("carts.id", ondelete="CASCADE"), nullable=False)
-    product_id = Column(String, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    id = Column(GUID, primary_key=True, default=generate_uuid)
+    cart_id = Column(GUID, ForeignKey("carts.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(GUID, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
     quantity = Column(Integer, nullable=False, default=1)
     added_at = Column(DateTime(timezone=True), server_default=func.now())
     
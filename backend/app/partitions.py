@@ -0,0 +1,164 @@
+"""
+Monthly range partitions for orders and the tables co-partitioned with it.
+
+orders is partitioned on created_at; order_items and order_coupons are
+partitioned on order_created_at, a copy of their order's timestamp, so a month
+of orders and everything that references it live in sibling partitions that
+can be detached together.
+
+There is no default partition, so inserts fail for months without one.
+Partitions up to PARTITION_MONTHS_AHEAD months ahead are created at startup,
+by archive_order_partitions.py and every PARTITION_CHECK_INTERVAL_SECONDS by
+partition_maintainer while the API runs.
+"""
+import asyncio
+import gzip
+import os
+from datetime import date, datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.config import get_settings
+
+settings = get_settings()
+
+# Parent tables, children (referencing tables) first so they can be detached
+# before the orders partition they reference.
+PARTITIONED_TABLES = ["order_items", "order_coupons", "orders"]
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+async def ensure_partitions(conn: AsyncConnection, start: date, end: date) -> None:
+    """Create the missing monthly partitions covering [start, end] for every partitioned table"""
+    # Existing partitions are skipped without touching the parent, which
+    # CREATE TABLE ... PARTITION OF locks exclusively
+    existing = {table: set(await list_partitions(conn, table)) for table in PARTITIONED_TABLES}
+    month = month_start(start)
+    while month <= end:
+        upper = add_months(month, 1)
+        for table in reversed(PARTITIONED_TABLES):
+            if partition_name(table, month) in existing[table]:
+                continue
+            await conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} "
+                f"PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+            ))
+        month = upper
+
+
+async def ensure_current_partitions(conn: AsyncConnection, months_ahead: int) -> None:
+    """Make sure last month, this month and the next months_ahead months exist"""
+    today = datetime.now(timezone.utc).date()
+    await ensure_partitions(conn, add_months(month_start(today), -1), add_months(month_start(today), months_ahead))
+
+
+class PartitionMaintainer:
+    """Background task creating upcoming partitions, so a long-running API never runs out of them"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self, engine: AsyncEngine) -> None:
+        while True:
+            await asyncio.sleep(settings.PARTITION_CHECK_INTERVAL_SECONDS)
+            try:
+                async with engine.begin() as conn:
+                    # Give up rather than queue checkouts behind the parent table lock
+                    await conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+                    await ensure_current_partitions(conn, settings.PARTITION_MONTHS_AHEAD)
+            except Exception as e:
+                print(f"⚠️  Partition maintenance failed, will retry: {e}")
+
+    def start(self, engine: AsyncEngine) -> None:
+        self._task = asyncio.create_task(self._run(engine), name="partition-maintenance")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+partition_maintainer = PartitionMaintainer()
+
+
+async def list_partitions(conn: AsyncConnection, table: str) -> List[str]:
+    """Names of the partitions currently attached to a table"""
+    result = await conn.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table
+        ORDER BY child.relname
+    """), {"table": table})
+    return [row[0] for row in result.all()]
+
+
+async def _export_partition(conn: AsyncConnection, name: str, archive_dir: str) -> int:
+    """Write a partition's rows to a gzip-compressed NDJSON file"""
+    path = os.path.join(archive_dir, f"{name}.ndjson.gz")
+    rows = 0
+    result = await conn.stream(text(f"SELECT row_to_json(t)::text FROM {name} t"))
+    with gzip.open(path, "wt", encoding="utf-8") as archive:
+        async for (record,) in result:
+            archive.write(record)
+            archive.write("\n")
+            rows += 1
+    return rows
+
+
+async def archive_month(engine: AsyncEngine, month: date, archive_dir: str) -> dict:
+    """
+    Detach one month from every partitioned table, export it to
+    archive_dir as compressed NDJSON and drop the detached tables.
+    Each detach commits on its own so the parent table is only locked
+    briefly; the export runs against the detached table and the table is
+    only dropped once its file has been written.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    exported = {}
+    for table in PARTITIONED_TABLES:
+        name = partition_name(table, month)
+        async with engine.begin() as conn:
+            if name in await list_partitions(conn, table):
+                await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            else:
+                # Not attached: either never created or detached by an interrupted run
+                result = await conn.execute(text("SELECT to_regclass(:name)"), {"name": name})
+                if result.scalar() is None:
+                    continue
+        # The export's server-side cursor lives until its transaction ends,
+        # so the drop runs in a transaction of its own
+        async with engine.begin() as conn:
+            exported[name] = await _export_partition(conn, name, archive_dir)
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP TABLE {name}"))
+    return exported
+
+
+async def archivable_months(conn: AsyncConnection, horizon_months: int) -> List[date]:
+    """Months with orders partitions older than the retention horizon"""
+    cutoff = add_months(month_start(datetime.now(timezone.utc).date()), -horizon_months)
+    months = []
+    for name in await list_partitions(conn, "orders"):
+        suffix = name[len("orders_y"):]
+        month = date(int(suffix[:4]), int(suffix[5:7]), 1)
+        if month < cutoff:
+            months.append(month)
+    return months
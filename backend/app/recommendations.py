@@ -0,0 +1,161 @@
+"""
+Frequently-bought-together recommendations.
+
+A sparse product co-occurrence matrix (how many orders contained both
+products) is built from order_items at startup and updated as orders commit.
+Each product keeps its RELATED_TOP_K strongest neighbours ranked, so a lookup
+reads at most that many entries and never touches order_items.
+
+Orders with more than RELATED_MAX_ORDER_SIZE distinct products (large B2B
+uploads) are ignored: they would add n^2 pairs that say little about what
+shoppers buy together.
+"""
+import heapq
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.database import pop_committed, stage_for_commit
+from app.models import OrderItem, Product
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+settings = get_settings()
+
+
+class CoOccurrenceIndex:
+    """Sparse symmetric co-occurrence counts with a ranked top-k per product"""
+
+    def __init__(self, top_k: int, max_order_size: int):
+        self.top_k = top_k
+        self.max_order_size = max_order_size
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._ranked: Dict[Tuple[str, Optional[int]], List[Tuple[str, int]]] = {}
+        self._dirty: Set[str] = set()
+        self._tiers: Dict[str, int] = {}
+
+    def add_order(self, products: Iterable[Tuple[str, int]]) -> None:
+        """Count one order given its (product_id, tier) pairs"""
+        tiers = dict(products)
+        self._tiers.update(tiers)
+        if len(tiers) < 2 or len(tiers) > self.max_order_size:
+            return
+        for product_id in tiers:
+            neighbours = self._counts[product_id]
+            for other_id in tiers:
+                if other_id != product_id:
+                    neighbours[other_id] = neighbours.get(other_id, 0) + 1
+            self._dirty.add(product_id)
+
+    def related(self, product_id: str, limit: int, max_tier: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        Up to limit (product_id, orders together) pairs, strongest first,
+        restricted to products of tier <= max_tier. Rankings are cached per
+        tier and only recomputed after new orders touched the product.
+        """
+        if product_id in self._dirty:
+            for tier in (None, 1, 2, 3):
+                self._ranked.pop((product_id, tier), None)
+            self._dirty.discard(product_id)
+        key = (product_id, max_tier)
+        if key not in self._ranked:
+            neighbours = self._counts.get(product_id, {}).items()
+            if max_tier is not None:
+                neighbours = [entry for entry in neighbours if self._tiers.get(entry[0], 1) <= max_tier]
+            self._ranked[key] = heapq.nlargest(self.top_k, neighbours, key=lambda entry: (entry[1], entry[0]))
+        return self._ranked[key][:limit]
+
+    def _replace(self, counts: Dict[str, Dict[str, int]], tiers: Dict[str, int]) -> None:
+        self._counts = defaultdict(dict, counts)
+        self._tiers = tiers
+        self._ranked = {}
+        self._dirty = set(counts)
+
+    async def rebuild(self, engine: AsyncEngine) -> int:
+        """Recompute the matrix from every order; returns the number of product pairs"""
+        async with AsyncSession(engine) as db:
+            result = await db.execute(select(Product.id, Product.tier))
+            tiers = {product_id: tier or 1 for product_id, tier in result.all()}
+            result = await db.execute(
+                select(OrderItem.order_id, OrderItem.product_id).distinct()
+            )
+            pairs = result.all()
+
+        if np is not None:
+            counts = self._count_pairs_vectorized(pairs)
+        else:
+            counts = self._count_pairs(pairs)
+        self._replace(counts, tiers)
+        return sum(len(neighbours) for neighbours in counts.values())
+
+    def _count_pairs(self, pairs: List[Tuple[str, str]]) -> Dict[str, Dict[str, int]]:
+        orders: Dict[str, List[str]] = defaultdict(list)
+        for order_id, product_id in pairs:
+            orders[order_id].append(product_id)
+        counts: Dict[str, Dict[str, int]] = defaultdict(dict)
+        for products in orders.values():
+            if len(products) < 2 or len(products) > self.max_order_size:
+                continue
+            for product_id in products:
+                for other_id in products:
+                    if other_id != product_id:
+                        counts[product_id][other_id] = counts[product_id].get(other_id, 0) + 1
+        return counts
+
+    def _count_pairs_vectorized(self, pairs: List[Tuple[str, str]]) -> Dict[str, Dict[str, int]]:
+        """Self-join (order, product) rows on order with NumPy and count each product pair"""
+        if not pairs:
+            return {}
+        order_ids, product_ids = zip(*pairs)
+        _, orders = np.unique(np.array(order_ids), return_inverse=True)
+        products_index, products = np.unique(np.array(product_ids), return_inverse=True)
+        products_index = products_index.tolist()
+
+        # Group rows by order and drop orders that are too small or too large
+        by_order = np.argsort(orders, kind="stable")
+        orders, products = orders[by_order], products[by_order]
+        sizes = np.bincount(orders)
+        row_sizes = sizes[orders]
+        keep = (row_sizes >= 2) & (row_sizes <= self.max_order_size)
+        orders, products, row_sizes = orders[keep], products[keep], row_sizes[keep]
+        if not len(orders):
+            return {}
+
+        # For every row, pair it with each row of the same order
+        starts = np.searchsorted(orders, orders, side="left")
+        left = np.repeat(np.arange(len(orders)), row_sizes)
+        offsets = np.arange(len(left)) - np.repeat(np.cumsum(row_sizes) - row_sizes, row_sizes)
+        right = np.repeat(starts, row_sizes) + offsets
+        distinct = left != right
+        left, right = products[left[distinct]], products[right[distinct]]
+
+        keys, pair_counts = np.unique(left.astype(np.int64) * len(products_index) + right, return_counts=True)
+        counts: Dict[str, Dict[str, int]] = defaultdict(dict)
+        for key, count in zip(keys.tolist(), pair_counts.tolist()):
+            first, second = divmod(key, len(products_index))
+            counts[products_index[first]][products_index[second]] = count
+        return counts
+
+
+related_products = CoOccurrenceIndex(settings.RELATED_TOP_K, settings.RELATED_MAX_ORDER_SIZE)
+
+
+def stage_related_order(db: AsyncSession, products: Iterable[Product]) -> None:
+    """
+    Queue an order's products; they are counted once the session commits
+    and dropped if their transaction or savepoint rolls back
+    """
+    stage_for_commit(db, "related_orders", [[(product.id, product.tier) for product in products]])
+
+
+@event.listens_for(Session, "after_commit")
+def _count_staged_orders(session):
+    for products in pop_committed(session, "related_orders"):
+        related_products.add_order(products)
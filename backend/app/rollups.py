@@ -0,0 +1,265 @@
+"""
+Sales rollups for the analytics dashboard and admin reports.
+
+daily_sales and daily_product_sales are updated in the same transaction as the
+order they count, so they never drift from the orders table. The dashboard
+reads only these tables, so its cost depends on the number of days shown and
+not on the number of orders ever placed.
+
+customer_metrics and company_metrics hold lifetime totals per customer and
+per company (User.server), updated the same way, so customer rankings never
+group the orders table.
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncConnection
+
+from app.models import CompanyCustomer, CompanyMetrics, CustomerMetrics, DailyCouponSales, DailySales, DailyProductSales, Order
+
+
+async def record_order_sales(
+    db: AsyncSession,
+    created_at: datetime,
+    order_total: float,
+    items: Iterable[Tuple[str, int, float]],
+    coupons: Iterable[Tuple[str, float]] = ()
+) -> None:
+    """
+    Add one order to the rollups for its day.
+    items are (product_id, quantity, total_price) tuples and coupons are
+    (code, discount_amount) pairs. Call this last in the checkout
+    transaction: the day's daily_sales row stays locked until commit.
+    """
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    day = created_at.date()
+
+    per_product: Dict[str, list] = defaultdict(lambda: [0, 0.0])
+    for product_id, quantity, total_price in items:
+        per_product[product_id][0] += quantity
+        per_product[product_id][1] += total_price
+
+    if per_product:
+        # Sorted so concurrent checkouts lock product rows in the same order
+        rows = [
+            {"day": day, "product_id": product_id, "quantity": quantity, "revenue": revenue}
+            for product_id, (quantity, revenue) in sorted(per_product.items())
+        ]
+        stmt = insert(DailyProductSales).values(rows)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[DailyProductSales.day, DailyProductSales.product_id],
+            set_={
+                "quantity": DailyProductSales.quantity + stmt.excluded.quantity,
+                "revenue": DailyProductSales.revenue + stmt.excluded.revenue,
+            }
+        ))
+
+    # A code can be applied more than once per order; one row per code, or
+    # the upsert would touch the same row twice
+    per_coupon: Dict[str, list] = defaultdict(lambda: [0, 0.0])
+    for code, discount_amount in coupons:
+        per_coupon[code][0] += 1
+        per_coupon[code][1] += discount_amount
+
+    coupon_rows = [
+        {
+            "day": day,
+            "code": code,
+            "redemptions": redemptions,
+            "discount_amount": discount_amount,
+            "order_revenue": order_total * redemptions,
+        }
+        for code, (redemptions, discount_amount) in sorted(per_coupon.items())
+    ]
+    if coupon_rows:
+        stmt = insert(DailyCouponSales).values(coupon_rows)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[DailyCouponSales.day, DailyCouponSales.code],
+            set_={
+                "redemptions": DailyCouponSales.redemptions + stmt.excluded.redemptions,
+                "discount_amount": DailyCouponSales.discount_amount + stmt.excluded.discount_amount,
+                "order_revenue": DailyCouponSales.order_revenue + stmt.excluded.order_revenue,
+            }
+        ))
+
+    stmt = insert(DailySales).values(
+        day=day,
+        order_count=1,
+        items_sold=sum(quantity for quantity, _ in per_product.values()),
+        revenue=order_total
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[DailySales.day],
+        set_={
+            "order_count": DailySales.order_count + stmt.excluded.order_count,
+            "items_sold": DailySales.items_sold + stmt.excluded.items_sold,
+            "revenue": DailySales.revenue + stmt.excluded.revenue,
+        }
+    ))
+
+
+async def record_customer_order(db: AsyncSession, order: Order) -> None:
+    """
+    Add one order to its customer's and company's (Order.company) lifetime
+    totals. A customer counts towards a company's customer_count from their
+    first order for that company, whatever they ordered before.
+    Call this after record_order_sales so checkouts lock rows in the same order.
+    """
+    company = order.company or None
+    stmt = insert(CustomerMetrics).values(
+        customer_email=order.customer_email,
+        company=company,
+        order_count=1,
+        lifetime_spend=order.total,
+        total_discount=order.discount or 0,
+        first_order_at=order.created_at,
+        last_order_at=order.created_at
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[CustomerMetrics.customer_email],
+        set_={
+            "company": func.coalesce(stmt.excluded.company, CustomerMetrics.company),
+            "order_count": CustomerMetrics.order_count + 1,
+            "lifetime_spend": CustomerMetrics.lifetime_spend + stmt.excluded.lifetime_spend,
+            "total_discount": CustomerMetrics.total_discount + stmt.excluded.total_discount,
+            "first_order_at": func.least(CustomerMetrics.first_order_at, stmt.excluded.first_order_at),
+            "last_order_at": func.greatest(CustomerMetrics.last_order_at, stmt.excluded.last_order_at),
+        }
+    ))
+
+    if not company:
+        return
+    result = await db.execute(
+        insert(CompanyCustomer)
+        .values(company=company, customer_email=order.customer_email)
+        .on_conflict_do_nothing()
+        .returning(CompanyCustomer.company)
+    )
+    new_customer = result.scalar_one_or_none() is not None
+
+    stmt = insert(CompanyMetrics).values(
+        company=company,
+        customer_count=1 if new_customer else 0,
+        order_count=1,
+        lifetime_spend=order.total,
+        total_discount=order.discount or 0,
+        first_order_at=order.created_at,
+        last_order_at=order.created_at
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[CompanyMetrics.company],
+        set_={
+            "customer_count": CompanyMetrics.customer_count + stmt.excluded.customer_count,
+            "order_count": CompanyMetrics.order_count + 1,
+            "lifetime_spend": CompanyMetrics.lifetime_spend + stmt.excluded.lifetime_spend,
+            "total_discount": CompanyMetrics.total_discount + stmt.excluded.total_discount,
+            "first_order_at": func.least(CompanyMetrics.first_order_at, stmt.excluded.first_order_at),
+            "last_order_at": func.greatest(CompanyMetrics.last_order_at, stmt.excluded.last_order_at),
+        }
+    ))
+
+
+async def rebuild_rollups(conn: AsyncConnection) -> Tuple[int, int, int]:
+    """Recompute the daily rollup tables from orders, order_items and order_coupons"""
+    await conn.execute(text(
+        "LOCK TABLE daily_sales, daily_product_sales, daily_coupon_sales IN EXCLUSIVE MODE"
+    ))
+    await conn.execute(text("DELETE FROM daily_product_sales"))
+    await conn.execute(text("DELETE FROM daily_coupon_sales"))
+    await conn.execute(text("DELETE FROM daily_sales"))
+
+    result = await conn.execute(text("""
+        INSERT INTO daily_sales (day, order_count, items_sold, revenue)
+        SELECT
+            (o.created_at AT TIME ZONE 'UTC')::date,
+            count(*),
+            COALESCE(sum(i.quantity), 0),
+            sum(o.total)
+        FROM orders o
+        LEFT JOIN (
+            SELECT order_id, order_created_at, sum(quantity) AS quantity
+            FROM order_items
+            GROUP BY order_id, order_created_at
+        ) i ON i.order_id = o.id AND i.order_created_at = o.created_at
+        GROUP BY 1
+    """))
+    days = result.rowcount
+
+    result = await conn.execute(text("""
+        INSERT INTO daily_product_sales (day, product_id, quantity, revenue)
+        SELECT (order_created_at AT TIME ZONE 'UTC')::date, product_id, sum(quantity), sum(total_price)
+        FROM order_items
+        GROUP BY 1, 2
+    """))
+    product_days = result.rowcount
+
+    result = await conn.execute(text("""
+        INSERT INTO daily_coupon_sales (day, code, redemptions, discount_amount, order_revenue)
+        SELECT (c.order_created_at AT TIME ZONE 'UTC')::date, c.code, count(*), sum(c.discount_amount), sum(o.total)
+        FROM order_coupons c
+        JOIN orders o ON o.id = c.order_id AND o.created_at = c.order_created_at
+        GROUP BY 1, 2
+    """))
+    return days, product_days, result.rowcount
+
+
+async def rebuild_customer_metrics(conn: AsyncConnection) -> Tuple[int, int]:
+    """
+    Recompute customer_metrics, company_customers and company_metrics from
+    orders, attributing each order to Order.company like checkout does.
+    """
+    await conn.execute(text(
+        "LOCK TABLE customer_metrics, company_customers, company_metrics IN EXCLUSIVE MODE"
+    ))
+    await conn.execute(text("DELETE FROM company_metrics"))
+    await conn.execute(text("DELETE FROM company_customers"))
+    await conn.execute(text("DELETE FROM customer_metrics"))
+
+    result = await conn.execute(text("""
+        INSERT INTO customer_metrics (
+            customer_email, company, order_count, lifetime_spend, total_discount,
+            first_order_at, last_order_at
+        )
+        SELECT
+            customer_email,
+            (array_agg(NULLIF(company, '') ORDER BY created_at DESC)
+                FILTER (WHERE NULLIF(company, '') IS NOT NULL))[1],
+            count(*),
+            sum(total),
+            COALESCE(sum(discount), 0),
+            min(created_at),
+            max(created_at)
+        FROM orders
+        GROUP BY customer_email
+    """))
+    customers = result.rowcount
+
+    await conn.execute(text("""
+        INSERT INTO company_customers (company, customer_email)
+        SELECT DISTINCT company, customer_email
+        FROM orders
+        WHERE company IS NOT NULL AND company <> ''
+    """))
+
+    result = await conn.execute(text("""
+        INSERT INTO company_metrics (
+            company, customer_count, order_count, lifetime_spend, total_discount,
+            first_order_at, last_order_at
+        )
+        SELECT
+            company,
+            count(DISTINCT customer_email),
+            count(*),
+            sum(total),
+            COALESCE(sum(discount), 0),
+            min(created_at),
+            max(created_at)
+        FROM orders
+        WHERE company IS NOT NULL AND company <> ''
+        GROUP BY company
+    """))
+    return customers, result.rowcount
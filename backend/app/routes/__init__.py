@@ -1,5 +1,5 @@
 """Routes package"""
 
-from . import cart, products, coupons, orders, analytics, ai, auth, admin_ai
+from . import cart, products, coupons, orders, analytics, ai, auth, admin_ai, admin_orders, admin_customers
 
-__all__ = ['cart', 'products', 'coupons', 'orders', 'analytics', 'ai', 'auth', 'admin_ai']
+__all__ = ['cart', 'products', 'coupons', 'orders', 'analytics', 'ai', 'auth', 'admin_ai', 'admin_orders', 'admin_customers']
@@ -1,84 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from datetime import datetime, timezone
-import google.generativeai as genai
-
-from app.database import get_db
-from app.models import Product, Order, OrderItem, Coupon
+"""Admin AI chat routes (main.py mounts them through app/routes/ai.py)"""
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Tuple
+import json
+
+from app.ai_client import gemini_client
+from app.ai_context import AIContext
+from app.ai_intents import answer_intent
+from app.ai_planner import plan_context
+from app.cache import ai_answer_cache, normalize_question
 from app.schemas import ChatRequest, ChatResponse
 from app.config import get_settings
 
 settings = get_settings()
 
-router = APIRouter(
-    prefix="/admin/ai", 
-    tags=["Admin AI"],
-    include_in_schema=True
-)
-
-
-async def get_database_context(db: AsyncSession) -> str:
-    """Fetch database context for AI responses"""
-    context_parts = []
-    
-    # Get product inventory
-    products_result = await db.execute(select(Product).order_by(Product.stock_quantity.asc()).limit(10))
-    products = products_result.scalars().all()
-    
-    context_parts.append("=== INVENTORY STATUS ===")
-    context_parts.append(f"Total Products: {len(products)}")
-    context_parts.append("\nLow Stock Products:")
-    for product in products:
-        context_parts.append(f"- {product.name}: {product.stock_quantity} units (${product.base_price} each)")
-    
-    # Get today's revenue
-    today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-    orders_today_result = await db.execute(select(Order).where(Order.created_at >= today_start))
-    orders_today = orders_today_result.scalars().all()
-    
-    total_revenue_today = sum(order.total for order in orders_today)
-    context_parts.append(f"\n=== TODAY'S SALES ===")
-    context_parts.append(f"Orders Today: {len(orders_today)}")
-    context_parts.append(f"Total Revenue Today: ${total_revenue_today:.2f}")
-    
-    # Get total revenue
-    all_orders_result = await db.execute(select(func.sum(Order.total)))
-    all_revenue = all_orders_result.scalar() or 0
-    context_parts.append(f"Total Revenue (All Time): ${all_revenue:.2f}")
-    
-    # Get active coupons
-    coupons_result = await db.execute(select(Coupon).where(Coupon.is_active == True))
-    coupons = coupons_result.scalars().all()
-    
-    context_parts.append(f"\n=== ACTIVE COUPONS ===")
-    context_parts.append(f"Total Active Coupons: {len(coupons)}")
-    for coupon in coupons[:5]:  # Top 5
-        discount_info = "Makes order FREE" if coupon.makes_free else (
-            f"{coupon.discount_value}% off" if coupon.discount_type == "percentage" 
-            else f"${coupon.discount_value} off"
-        )
-        context_parts.append(f"- {coupon.code}: {discount_info} | Used: {coupon.used_count} times")
-    
-    return "\n".join(context_parts)
+router = APIRouter(prefix="/admin/ai", tags=["Admin AI"])
 
 
-@router.post("/chat", response_model=ChatResponse)
-async def admin_ai_chat(
-    request: ChatRequest,
-    db: AsyncSession = Depends(get_db)
-):
-    """Admin AI chat endpoint with database context"""
-    try:
-        # Validate API key
-        if not settings.GEMINI_API_KEY:
-            raise HTTPException(status_code=500, detail="GEMINI_API_KEY not configured")
-        
-        # Get database context
-        db_context = await get_database_context(db)
-        
-        # Create the prompt with context
-        system_prompt = """You are an intelligent admin assistant for SwagCommerce.
+CHAT_PROMPT = """You are an intelligent admin assistant for SwagCommerce.
 You have access to real-time database information including inventory, sales, orders, and coupons.
 
 Your role is to:
@@ -87,7 +26,7 @@ Your role is to:
 3. Give insights about order history and customer behavior
 4. Be concise and accurate
 
-Current Database Context:
+Current Database Context (only the data relevant to the question; say so if something needed is missing):
 {context}
 
 User Question: {question}
@@ -104,31 +43,100 @@ IMPORTANT FORMATTING RULES:
 
 Provide a clear, well-structured answer based on the data above."""
 
-        prompt = system_prompt.format(context=db_context, question=request.question)
+
+def answer_cache_key(question: str, context: AIContext) -> Tuple[str, str]:
+    """Answers are shared by equivalent questions asked against the same data"""
+    return normalize_question(question), context.version
+
+
+@router.post("/chat", response_model=ChatResponse)
+async def admin_ai_chat(request: ChatRequest):
+    """
+    Admin AI chat endpoint with database context.
+    Common questions (revenue, orders, stock, coupons, top products) are
+    answered directly from the data (see app/ai_intents.py). Other questions
+    get a prompt with only the data sections the question needs, within
+    AI_CONTEXT_TOKEN_BUDGET (see app/ai_planner.py). Answers are cached per
+    normalized question and context version, and concurrent identical
+    questions share one model call. answered_by tells which path answered.
+    """
+    try:
+        routed = await answer_intent(normalize_question(request.question))
+        if routed is not None:
+            intent, answer, context = routed
+            return ChatResponse(
+                answer=answer,
+                context_used={
+                    "question": "Answered from the database without the model",
+                    "context_version": context.version,
+                    "intent": intent
+                },
+                answered_by="intent"
+            )
         
-        # Call Gemini API with generation config for better text formatting
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        model = genai.GenerativeModel(
-            'gemini-2.0-flash-exp',
-            generation_config={
-                'temperature': 0.7,
-                'top_p': 0.95,
-                'top_k': 40,
-                'max_output_tokens': 2048,
-            }
+        context = await plan_context(request.question)
+        prompt = CHAT_PROMPT.format(context=context.text, question=request.question)
+        answer, cached = await ai_answer_cache.get_or_compute(
+            answer_cache_key(request.question, context),
+            lambda: gemini_client.generate(prompt)
         )
-        response = model.generate_content(prompt)
         
         return ChatResponse(
-            answer=response.text,
-            context_used={"message": "Database context included in response"}
+            answer=answer,
+            context_used={
+                "question": "Database context included in response",
+                "context_version": context.version,
+                "context_sections": context.data["sections"],
+                "context_tokens": context.data["tokens"],
+                "cached": cached
+            },
+            answered_by="cache" if cached else "model"
         )
         
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"AI Error: {str(e)}")
-        print(error_details)
+        print(f"❌ AI Error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"AI Error: {str(e)}")
+
+
+@router.post("/chat/stream")
+async def admin_ai_chat_stream(request: ChatRequest):
+    """
+    Admin AI chat as Server-Sent Events: one "data: {"text": ...}" event per
+    chunk as the model produces it, then "event: done". A failure after the
+    stream started is sent as "event: error". Intent and cached answers are
+    sent as a single chunk, and a completed stream is added to the answer cache.
+    """
+    routed = await answer_intent(normalize_question(request.question))
+    if routed is not None:
+        cached_answer = routed[1]
+    else:
+        context = await plan_context(request.question)
+        key = answer_cache_key(request.question, context)
+        cached_answer = ai_answer_cache.get(key)
+    chunks = None
+    if cached_answer is None:
+        chunks = gemini_client.stream(CHAT_PROMPT.format(context=context.text, question=request.question))
+
+    async def events():
+        try:
+            if chunks is None:
+                yield f"data: {json.dumps({'text': cached_answer})}\n\n"
+            else:
+                answer = []
+                async for text in chunks:
+                    answer.append(text)
+                    yield f"data: {json.dumps({'text': text})}\n\n"
+                ai_answer_cache.put(key, "".join(answer))
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else f"AI Error: {str(e)}"
+            print(f"❌ AI stream error: {detail}")
+            yield f"event: error\ndata: {json.dumps({'detail': detail})}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,99 @@
+"""Admin customer and company ranking routes"""
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import get_current_admin
+from app.database import get_db
+from app.models import CompanyMetrics, CustomerMetrics, User
+
+router = APIRouter(prefix="/admin", tags=["Admin Customers"])
+
+
+def _average(count: int, lifetime_spend: float) -> float:
+    return round(lifetime_spend / count, 2) if count else 0.0
+
+
+@router.get("/customers")
+async def top_customers(
+    sort_by: Literal["lifetime_spend", "order_count", "last_order_at"] = "lifetime_spend",
+    company: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin)
+):
+    """
+    Customers ranked by lifetime spend, order count or most recent order,
+    read from customer_metrics (maintained at checkout, see app/rollups.py).
+    Filter by company (User.server).
+    """
+    query = select(CustomerMetrics).order_by(
+        getattr(CustomerMetrics, sort_by).desc(), CustomerMetrics.customer_email
+    )
+    if company:
+        query = query.where(CustomerMetrics.company == company)
+    result = await db.execute(query.offset(offset).limit(limit))
+
+    return {
+        "sort_by": sort_by,
+        "customers": [
+            {
+                "customer_email": row.customer_email,
+                "company": row.company,
+                "order_count": row.order_count,
+                "lifetime_spend": round(row.lifetime_spend, 2),
+                "total_discount": round(row.total_discount, 2),
+                "avg_order_value": _average(row.order_count, row.lifetime_spend),
+                "first_order_at": row.first_order_at,
+                "last_order_at": row.last_order_at,
+            }
+            for row in result.scalars().all()
+        ]
+    }
+
+
+@router.get("/companies")
+async def top_companies(
+    sort_by: Literal[
+        "lifetime_spend", "order_count", "customer_count", "avg_spend_per_customer", "last_order_at"
+    ] = "lifetime_spend",
+    limit: int = Query(50, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_admin)
+):
+    """
+    Companies (User.server) ranked by lifetime spend, order count, customers,
+    average spend per customer or most recent order, read from company_metrics.
+    """
+    avg_spend_per_customer = CompanyMetrics.lifetime_spend / func.nullif(CompanyMetrics.customer_count, 0)
+    sort_column = (
+        avg_spend_per_customer if sort_by == "avg_spend_per_customer" else getattr(CompanyMetrics, sort_by)
+    )
+    result = await db.execute(
+        select(CompanyMetrics)
+        .order_by(sort_column.desc().nulls_last(), CompanyMetrics.company)
+        .offset(offset)
+        .limit(limit)
+    )
+
+    return {
+        "sort_by": sort_by,
+        "companies": [
+            {
+                "company": row.company,
+                "customer_count": row.customer_count,
+                "order_count": row.order_count,
+                "lifetime_spend": round(row.lifetime_spend, 2),
+                "total_discount": round(row.total_discount, 2),
+                "avg_order_value": _average(row.order_count, row.lifetime_spend),
+                "avg_spend_per_customer": _average(row.customer_count, row.lifetime_spend),
+                "first_order_at": row.first_order_at,
+                "last_order_at": row.last_order_at,
+            }
+            for row in result.scalars().all()
+        ]
+    }
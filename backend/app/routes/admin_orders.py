@@ -0,0 +1,119 @@
+"""Admin order export routes"""
+import csv
+import io
+import json
+from datetime import date, timedelta
+from typing import AsyncIterator, Literal, Optional
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+from app.auth import get_current_admin
+from app.database import AsyncSessionLocal
+from app.models import Order, OrderItem, User
+
+router = APIRouter(prefix="/admin/orders", tags=["Admin Orders"])
+
+# Rows fetched from the server-side cursor per round trip
+EXPORT_BATCH_SIZE = 2000
+
+EXPORT_COLUMNS = [
+    "order_id",
+    "created_at",
+    "customer_email",
+    "customer_name",
+    "status",
+    "subtotal",
+    "discount",
+    "total",
+    "applied_coupon_code",
+    "product_id",
+    "product_name",
+    "quantity",
+    "unit_price",
+    "total_price",
+]
+
+
+def _export_query(start_date: Optional[date], end_date: Optional[date], status: Optional[str]):
+    query = (
+        select(
+            Order.id,
+            Order.created_at,
+            Order.customer_email,
+            Order.customer_name,
+            Order.status,
+            Order.subtotal,
+            Order.discount,
+            Order.total,
+            Order.applied_coupon_code,
+            OrderItem.product_id,
+            OrderItem.product_name,
+            OrderItem.quantity,
+            OrderItem.unit_price,
+            OrderItem.total_price,
+        )
+        .select_from(Order)
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .order_by(Order.created_at, Order.id)
+    )
+    if start_date:
+        query = query.where(Order.created_at >= start_date)
+    if end_date:
+        query = query.where(Order.created_at < end_date + timedelta(days=1))
+    if status:
+        query = query.where(Order.status == status)
+    return query
+
+
+async def _stream_export(query, export_format: str) -> AsyncIterator[str]:
+    """
+    Stream rows from a server-side cursor on a dedicated connection.
+    Only one batch of rows is held in memory at a time.
+    """
+    if export_format == "csv":
+        yield ",".join(EXPORT_COLUMNS) + "\r\n"
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            buffer = io.StringIO()
+            if export_format == "csv":
+                writer = csv.writer(buffer)
+                for row in rows:
+                    writer.writerow([
+                        value.isoformat() if column == "created_at" and value else value
+                        for column, value in zip(EXPORT_COLUMNS, row)
+                    ])
+            else:
+                for row in rows:
+                    record = dict(zip(EXPORT_COLUMNS, row))
+                    record["created_at"] = record["created_at"].isoformat() if record["created_at"] else None
+                    buffer.write(json.dumps(record))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+
+
+@router.get("/export")
+async def export_orders(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    status: Optional[str] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """
+    Export orders joined with their items, one row per order item.
+    Filter by created_at date range (inclusive) and order status.
+    The response is streamed, so memory use does not depend on the range size.
+    """
+    query = _export_query(start_date, end_date, status)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"orders_{start_date or 'all'}_{end_date or 'all'}.{format}"
+
+    return StreamingResponse(
+        _stream_export(query, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -1,77 +1,90 @@
 """Analytics API routes"""
-from fastapi import APIRouter, Depends
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, desc
-from datetime import datetime, timedelta
+from sqlalchemy import select, func, desc, text
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Literal, Optional
+import time
 
-from app.database import get_db
-from app.models import Product, Order, OrderItem
+from app.cache import dashboard_cache
+from app.config import get_settings
+from app.database import AsyncSessionLocal, get_db
+from app.models import Coupon, Product, DailySales, DailyProductSales, DailyCouponSales, InventoryForecast
+from app.sales_cube import sales_cube
+from app.sketches import sketch_store
+from app.trending import trending_tracker
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
+settings = get_settings()
 
 
-@router.get("/dashboard")
-async def get_analytics(db: AsyncSession = Depends(get_db)):
-    """Get analytics dashboard data with charts"""
-    
-    # Total orders
-    result = await db.execute(select(func.count(Order.id)))
-    total_orders = result.scalar() or 0
-    
-    # Total revenue
-    result = await db.execute(select(func.sum(Order.total)))
-    total_revenue = result.scalar() or 0
-    
-    # Average order value
-    avg_order_value = float(total_revenue / total_orders) if total_orders > 0 else 0
-    
-    # Low stock products (products with stock < 50)
+async def _totals(db: AsyncSession) -> dict:
+    """Order count, revenue and average order value from the daily rollups"""
+    result = await db.execute(
+        select(func.sum(DailySales.order_count), func.sum(DailySales.revenue))
+    )
+    total_orders, total_revenue = result.one()
+    total_orders = total_orders or 0
+    total_revenue = total_revenue or 0
+    return {
+        "total_revenue": float(total_revenue),
+        "total_orders": int(total_orders),
+        "avg_order_value": float(total_revenue / total_orders) if total_orders > 0 else 0
+    }
+
+
+async def _low_stock(db: AsyncSession) -> dict:
+    """Products with stock < 50, and products at or below their forecast reorder point"""
     result = await db.execute(select(func.count(Product.id)).where(Product.stock_quantity < 50))
-    low_stock_products = result.scalar() or 0
-    
-    # Revenue trend (last 7 days)
-    seven_days_ago = datetime.utcnow() - timedelta(days=7)
+    low_stock = result.scalar()
     result = await db.execute(
-        select(
-            func.date(Order.created_at).label('date'),
-            func.sum(Order.total).label('revenue')
-        )
-        .where(Order.created_at >= seven_days_ago)
-        .group_by(func.date(Order.created_at))
-        .order_by(func.date(Order.created_at))
+        select(func.count(InventoryForecast.product_id))
+        .join(Product, Product.id == InventoryForecast.product_id)
+        .where(InventoryForecast.velocity > 0, Product.stock_quantity <= InventoryForecast.reorder_point)
+    )
+    return {"low_stock_products": int(low_stock or 0), "restock_needed_products": int(result.scalar() or 0)}
+
+
+async def _revenue_trend(db: AsyncSession) -> dict:
+    """Revenue for the last 7 days, including today, with missing days as zero"""
+    today = datetime.now(timezone.utc).date()
+    days = [today - timedelta(days=6 - i) for i in range(7)]
+    result = await db.execute(
+        select(DailySales.day, DailySales.revenue).where(DailySales.day >= days[0])
     )
-    revenue_trend = [
-        {"date": row[0].strftime('%m/%d'), "revenue": float(row[1])}
-        for row in result.all()
-    ]
-    
-    # Fill missing days with zero revenue
-    if len(revenue_trend) < 7:
-        existing_dates = {item['date'] for item in revenue_trend}
-        for i in range(7):
-            date = (datetime.utcnow() - timedelta(days=6-i)).strftime('%m/%d')
-            if date not in existing_dates:
-                revenue_trend.append({"date": date, "revenue": 0})
-        revenue_trend.sort(key=lambda x: x['date'])
-    
-    # Top products by sales
+    revenue_by_day = dict(result.all())
+    return {
+        "revenue_trend": [
+            {"date": day.strftime('%m/%d'), "revenue": float(revenue_by_day.get(day, 0))}
+            for day in days
+        ]
+    }
+
+
+async def _top_products(db: AsyncSession) -> dict:
+    """Top 5 products by quantity sold"""
     result = await db.execute(
         select(
             Product.name,
-            func.sum(OrderItem.quantity).label("sales"),
-            func.sum(OrderItem.total_price).label("revenue")
+            func.sum(DailyProductSales.quantity).label("sales"),
+            func.sum(DailyProductSales.revenue).label("revenue")
         )
-        .join(OrderItem, Product.id == OrderItem.product_id)
+        .join(DailyProductSales, Product.id == DailyProductSales.product_id)
         .group_by(Product.id, Product.name)
-        .order_by(desc(func.sum(OrderItem.quantity)))
+        .order_by(desc(func.sum(DailyProductSales.quantity)))
         .limit(5)
     )
-    top_products = [
-        {"name": row[0], "sales": int(row[1]), "revenue": float(row[2])}
-        for row in result.all()
-    ]
-    
-    # Category distribution
+    return {
+        "top_products": [
+            {"name": row[0], "sales": int(row[1]), "revenue": float(row[2])}
+            for row in result.all()
+        ]
+    }
+
+
+async def _category_distribution(db: AsyncSession) -> dict:
+    """Number of products per category"""
     result = await db.execute(
         select(
             Product.category,
@@ -79,17 +92,472 @@ async def get_analytics(db: AsyncSession = Depends(get_db)):
         )
         .group_by(Product.category)
     )
-    category_distribution = [
-        {"category": row[0], "count": int(row[1])}
-        for row in result.all()
-    ]
-    
     return {
-        "total_revenue": float(total_revenue),
-        "total_orders": int(total_orders),
-        "avg_order_value": avg_order_value,
-        "low_stock_products": int(low_stock_products),
-        "revenue_trend": revenue_trend,
-        "top_products": top_products,
-        "category_distribution": category_distribution
+        "category_distribution": [
+            {"category": row[0], "count": int(row[1])}
+            for row in result.all()
+        ]
+    }
+
+
+async def _customer_sketches(db: AsyncSession) -> dict:
+    """Approximate unique buyers and order value percentiles for the last 7 days"""
+    today = datetime.now(timezone.utc).date()
+    summary = await sketch_store.summary(db, today - timedelta(days=6), today + timedelta(days=1))
+    return {
+        "unique_customers_7d": summary["unique_customers"],
+        "order_value_percentiles_7d": {
+            "p50": summary["order_value_p50"],
+            "p90": summary["order_value_p90"],
+            "p99": summary["order_value_p99"],
+        }
+    }
+
+
+async def _trending_products(db: AsyncSession) -> dict:
+    """Top 5 products by decayed recent sales (see app/trending.py)"""
+    top = trending_tracker.top(5)
+    names = {}
+    if top:
+        result = await db.execute(
+            select(Product.id, Product.name).where(Product.id.in_([product_id for product_id, _ in top]))
+        )
+        names = dict(result.all())
+    return {
+        "trending_products": [
+            {"name": names[product_id], "score": round(score, 3)}
+            for product_id, score in top
+            if product_id in names
+        ]
+    }
+
+
+# Dashboard sections and the values reported when a section is unavailable
+DASHBOARD_SECTIONS = {
+    "totals": (_totals, {"total_revenue": 0.0, "total_orders": 0, "avg_order_value": 0}),
+    "low_stock": (_low_stock, {"low_stock_products": 0, "restock_needed_products": 0}),
+    "revenue_trend": (_revenue_trend, {"revenue_trend": []}),
+    "top_products": (_top_products, {"top_products": []}),
+    "category_distribution": (_category_distribution, {"category_distribution": []}),
+    "trending_products": (_trending_products, {"trending_products": []}),
+    "customer_sketches": (
+        _customer_sketches,
+        {"unique_customers_7d": 0, "order_value_percentiles_7d": {"p50": None, "p90": None, "p99": None}}
+    ),
+}
+
+
+# Sections that failed the latest refresh while the last complete dashboard was kept
+_failing_sections: List[str] = []
+
+
+async def _run_section(name: str, query) -> dict:
+    """Run one section on its own pooled connection, bounded by the query timeout"""
+    async with AsyncSessionLocal() as db:
+        return await asyncio.wait_for(query(db), timeout=settings.DASHBOARD_QUERY_TIMEOUT_SECONDS)
+
+
+async def _compute_dashboard() -> dict:
+    """
+    Query the dashboard sections concurrently. A section that fails or
+    exceeds DASHBOARD_QUERY_TIMEOUT_SECONDS is returned empty and listed in
+    unavailable_sections, with partial set to true. While a complete
+    dashboard younger than DASHBOARD_MAX_STALE_SECONDS is cached, it is kept
+    instead and the failing sections are reported with it.
+    """
+    results = await asyncio.gather(
+        *(_run_section(name, query) for name, (query, _) in DASHBOARD_SECTIONS.items()),
+        return_exceptions=True
+    )
+
+    dashboard = {}
+    unavailable_sections = []
+    for (name, (_, fallback)), result in zip(DASHBOARD_SECTIONS.items(), results):
+        if isinstance(result, BaseException):
+            reason = "timed out" if isinstance(result, asyncio.TimeoutError) else str(result)
+            print(f"⚠️  Dashboard section {name} unavailable: {reason}")
+            unavailable_sections.append(name)
+            dashboard.update(fallback)
+        else:
+            dashboard.update(result)
+
+    if (
+        unavailable_sections
+        and dashboard_cache.has_value
+        and dashboard_cache.age < settings.DASHBOARD_MAX_STALE_SECONDS
+    ):
+        # Keep serving the last complete dashboard rather than replacing it with gaps
+        _failing_sections[:] = unavailable_sections
+        raise RuntimeError(f"dashboard sections unavailable: {', '.join(unavailable_sections)}")
+    _failing_sections.clear()
+
+    dashboard["partial"] = bool(unavailable_sections)
+    dashboard["unavailable_sections"] = unavailable_sections
+    return dashboard
+
+
+@router.get("/dashboard")
+async def get_analytics():
+    """
+    Get analytics dashboard data with charts.
+    Order figures come from the daily rollups (see app/rollups.py).
+    The payload is cached for DASHBOARD_CACHE_SECONDS; after that the cached
+    copy is still served while a single background refresh runs.
+    data_age_seconds and computed_at tell how old the figures are, and
+    failing_sections lists sections whose latest refresh failed.
+    """
+    dashboard, age = await dashboard_cache.get(_compute_dashboard)
+    return {
+        **dashboard,
+        "computed_at": dashboard_cache.computed_at,
+        "data_age_seconds": round(age, 1),
+        "failing_sections": list(_failing_sections)
+    }
+
+
+# Bucket width per granularity, used to bound the number of buckets
+GRANULARITY_STEPS = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+    "month": timedelta(days=31),
+}
+MAX_TIMESERIES_BUCKETS = 5000
+
+# group_by option -> (SQL expression for the group, whether it needs order_items)
+TIMESERIES_GROUPS = {
+    None: ("NULL::text", False),
+    "category": ("p.category", True),
+    "product_tier": ("p.tier::text", True),
+    "user_tier": ("u.tier::text", False),
+    "company": ("u.server", False),
+}
+
+
+def _timeseries_sql(granularity: str, group_by: Optional[str]) -> str:
+    """
+    One query that buckets orders with date_trunc and fills empty buckets with
+    generate_series, crossed with every group that has data in the range.
+    granularity and group_by are validated against fixed options before use.
+    """
+    group_expr, item_level = TIMESERIES_GROUPS[group_by]
+    if item_level:
+        # Revenue of the items in the group (before order-level coupon discounts)
+        facts_from = """
+            FROM order_items i
+            JOIN orders o ON o.id = i.order_id AND o.created_at = i.order_created_at
+            JOIN products p ON p.id = i.product_id
+            WHERE i.order_created_at >= :start AND i.order_created_at < :end
+        """
+        revenue, quantity = "sum(i.total_price)", "sum(i.quantity)"
+    else:
+        # Order totals, with item quantities summed per order
+        facts_from = """
+            FROM orders o
+            LEFT JOIN users u ON u.email = o.customer_email
+            LEFT JOIN (
+                SELECT order_id, order_created_at, sum(quantity) AS quantity
+                FROM order_items
+                WHERE order_created_at >= :start AND order_created_at < :end
+                GROUP BY order_id, order_created_at
+            ) i ON i.order_id = o.id AND i.order_created_at = o.created_at
+            WHERE o.created_at >= :start AND o.created_at < :end
+        """
+        revenue, quantity = "sum(o.total)", "COALESCE(sum(i.quantity), 0)"
+
+    groups = "SELECT DISTINCT grp FROM facts" if group_by else "SELECT NULL::text AS grp"
+    return f"""
+        WITH buckets AS (
+            SELECT generate_series(
+                date_trunc('{granularity}', CAST(:start AS timestamptz) AT TIME ZONE 'UTC'),
+                CAST(:end AS timestamptz) AT TIME ZONE 'UTC' - interval '1 microsecond',
+                interval '1 {granularity}'
+            ) AS bucket
+        ),
+        facts AS (
+            SELECT
+                date_trunc('{granularity}', o.created_at AT TIME ZONE 'UTC') AS bucket,
+                {group_expr} AS grp,
+                {revenue} AS revenue,
+                count(DISTINCT o.id) AS orders,
+                {quantity} AS quantity
+            {facts_from}
+            GROUP BY 1, 2
+        ),
+        groups AS ({groups})
+        SELECT
+            b.bucket AT TIME ZONE 'UTC',
+            g.grp,
+            COALESCE(f.revenue, 0),
+            COALESCE(f.orders, 0),
+            COALESCE(f.quantity, 0)
+        FROM buckets b
+        CROSS JOIN groups g
+        LEFT JOIN facts f ON f.bucket = b.bucket AND f.grp IS NOT DISTINCT FROM g.grp
+        ORDER BY g.grp NULLS FIRST, b.bucket
+    """
+
+
+@router.get("/timeseries")
+async def get_timeseries(
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    granularity: Literal["hour", "day", "week", "month"] = "day",
+    group_by: Optional[Literal["category", "product_tier", "user_tier", "company"]] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Revenue, order count and quantity per time bucket over [from, to).
+    Defaults to the last 30 days. Times without a timezone are UTC; buckets
+    are UTC (weeks start on Monday) and empty buckets are returned as zeros.
+    With group_by, one series is returned per category, product tier, user
+    tier or company (User.server) that has orders in the range.
+    """
+    end = end or datetime.now(timezone.utc)
+    start = start or end - timedelta(days=30)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=timezone.utc)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    if (end - start) / GRANULARITY_STEPS[granularity] > MAX_TIMESERIES_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range too large for {granularity} granularity (max {MAX_TIMESERIES_BUCKETS} buckets)"
+        )
+
+    result = await db.execute(
+        text(_timeseries_sql(granularity, group_by)),
+        {"start": start, "end": end}
+    )
+
+    series = {}
+    for bucket, group, revenue, orders, quantity in result.all():
+        points = series.setdefault(group, [])
+        points.append({
+            "bucket": bucket.replace(tzinfo=timezone.utc),
+            "revenue": float(revenue),
+            "orders": int(orders),
+            "quantity": int(quantity)
+        })
+
+    return {
+        "from": start,
+        "to": end,
+        "granularity": granularity,
+        "group_by": group_by,
+        "series": [{"group": group, "points": points} for group, points in series.items()]
+    }
+
+
+CubeDimension = Literal["day", "product", "category", "product_tier", "user_tier", "company"]
+
+
+@router.get("/cube")
+async def query_sales_cube(
+    group_by: List[CubeDimension] = Query([]),
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    product: List[str] = Query([]),
+    category: List[str] = Query([]),
+    product_tier: List[int] = Query([]),
+    user_tier: List[int] = Query([]),
+    company: List[str] = Query([])
+):
+    """
+    Slice and dice order items from the in-memory sales cube.
+    Repeat group_by to group by several dimensions and repeat a dimension
+    parameter to allow several values, e.g.
+    ?group_by=category&group_by=day&user_tier=2&from=2025-01-01.
+    Dates are UTC days and 'to' is exclusive. Revenue is the items' total
+    price before order-level coupon discounts.
+    """
+    if not sales_cube.loaded:
+        raise HTTPException(status_code=503, detail="Sales cube is not available (requires numpy)")
+
+    filters = {
+        dimension: values
+        for dimension, values in {
+            "product": product,
+            "category": category,
+            "product_tier": product_tier,
+            "user_tier": user_tier,
+            "company": company,
+        }.items()
+        if values
+    }
+    started = time.perf_counter()
+    rows = sales_cube.query(list(dict.fromkeys(group_by)), filters, start, end)
+    return {
+        "group_by": group_by,
+        "rows": rows,
+        "rows_scanned": len(sales_cube),
+        "elapsed_us": round((time.perf_counter() - started) * 1_000_000)
+    }
+
+
+@router.get("/sketches")
+async def get_sketch_summary(
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Approximate unique customers and p50/p90/p99 order value for the UTC
+    days in [from, to), merged from the per-day sketches (see app/sketches.py).
+    Defaults to the last 30 days. Unique customers are within about 2% and
+    percentiles within 1% of the exact values.
+    """
+    end = end or datetime.now(timezone.utc).date() + timedelta(days=1)
+    start = start or end - timedelta(days=30)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    return {"from": start, "to": end, **await sketch_store.summary(db, start, end)}
+
+
+@router.get("/inventory-forecast")
+async def get_inventory_forecast(
+    limit: int = Query(50, ge=1, le=1000),
+    restock_only: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Products ordered by urgency: fewest days of stock left first, products
+    that are not selling last. Velocity and reorder points come from the
+    nightly inventory_forecasts table (see app/forecasting.py); days of
+    stock use the current stock. restock_only keeps products at or below
+    their reorder point.
+    """
+    days_of_stock = Product.stock_quantity / func.nullif(InventoryForecast.velocity, 0)
+    query = (
+        select(Product, InventoryForecast, days_of_stock)
+        .join(InventoryForecast, InventoryForecast.product_id == Product.id)
+        .order_by(days_of_stock.asc().nulls_last(), Product.stock_quantity, Product.name)
+        .limit(limit)
+    )
+    if restock_only:
+        query = query.where(
+            InventoryForecast.velocity > 0,
+            Product.stock_quantity <= InventoryForecast.reorder_point
+        )
+    result = await db.execute(query)
+    rows = result.all()
+
+    return {
+        "computed_at": max((forecast.computed_at for _, forecast, _ in rows), default=None),
+        "lead_time_days": settings.RESTOCK_LEAD_TIME_DAYS,
+        "products": [
+            {
+                "product_id": product.id,
+                "name": product.name,
+                "category": product.category,
+                "stock_quantity": product.stock_quantity,
+                "velocity_per_day": round(forecast.velocity, 3),
+                "days_of_stock": round(days, 1) if days is not None else None,
+                "reorder_point": forecast.reorder_point,
+                "needs_restock": forecast.velocity > 0 and product.stock_quantity <= forecast.reorder_point,
+            }
+            for product, forecast, days in rows
+        ]
+    }
+
+
+@router.get("/coupons")
+async def get_coupon_effectiveness(
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Per-coupon redemptions and discount for the UTC days in [from, to),
+    read from the daily_sales and daily_coupon_sales rollups. Defaults to
+    the last 30 days, including today.
+    avg_order_value_with/without compare orders that redeemed the coupon to
+    all other orders in the range. redemptions_per_day is the rate over the
+    range; with a usage limit, days_until_limit projects it forward.
+    """
+    end = end or datetime.now(timezone.utc).date() + timedelta(days=1)
+    start = start or end - timedelta(days=30)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    days = (end - start).days
+    if days > MAX_TIMESERIES_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Range too large (max {MAX_TIMESERIES_BUCKETS} days)")
+    range_days = [start + timedelta(days=offset) for offset in range(days)]
+
+    result = await db.execute(
+        select(func.sum(DailySales.order_count), func.sum(DailySales.revenue))
+        .where(DailySales.day >= start, DailySales.day < end)
+    )
+    total_orders, total_revenue = result.one()
+    total_orders, total_revenue = int(total_orders or 0), float(total_revenue or 0)
+
+    result = await db.execute(
+        select(
+            DailyCouponSales.code,
+            DailyCouponSales.day,
+            DailyCouponSales.redemptions,
+            DailyCouponSales.discount_amount,
+            DailyCouponSales.order_revenue
+        )
+        .where(DailyCouponSales.day >= start, DailyCouponSales.day < end)
+        .order_by(DailyCouponSales.code, DailyCouponSales.day)
+    )
+    daily = {}
+    for code, day, redemptions, discount_amount, order_revenue in result.all():
+        daily.setdefault(code, {})[day] = (redemptions, discount_amount, order_revenue)
+
+    result = await db.execute(select(Coupon))
+    coupons = {coupon.code: coupon for coupon in result.scalars().all()}
+
+    report = []
+    for code in sorted(set(coupons) | set(daily)):
+        coupon = coupons.get(code)
+        by_day = daily.get(code, {})
+        redemptions = sum(entry[0] for entry in by_day.values())
+        discount = sum((entry[1] for entry in by_day.values()), 0.0)
+        revenue_with = sum((entry[2] for entry in by_day.values()), 0.0)
+        other_orders = total_orders - redemptions
+        velocity = redemptions / days
+
+        remaining = None
+        days_until_limit = None
+        if coupon is not None and coupon.usage_limit:
+            remaining = max(coupon.usage_limit - coupon.used_count, 0)
+            days_until_limit = round(remaining / velocity, 1) if velocity > 0 else None
+
+        report.append({
+            "code": code,
+            "discount_type": coupon.discount_type if coupon else None,
+            "discount_value": coupon.discount_value if coupon else None,
+            "is_active": coupon.is_active if coupon else False,
+            "expires_at": coupon.expires_at if coupon else None,
+            "redemptions": redemptions,
+            "total_discount": round(discount, 2),
+            "avg_discount": round(discount / redemptions, 2) if redemptions else 0.0,
+            "revenue_with_coupon": round(revenue_with, 2),
+            "avg_order_value_with": round(revenue_with / redemptions, 2) if redemptions else None,
+            "avg_order_value_without": (
+                round((total_revenue - revenue_with) / other_orders, 2) if other_orders > 0 else None
+            ),
+            "redemptions_per_day": round(velocity, 3),
+            "used_count": coupon.used_count if coupon else None,
+            "usage_limit": coupon.usage_limit if coupon else None,
+            "remaining_uses": remaining,
+            "days_until_limit": days_until_limit,
+            "daily": [
+                {"date": day, "redemptions": by_day[day][0], "discount": round(by_day[day][1], 2)}
+                if day in by_day else {"date": day, "redemptions": 0, "discount": 0.0}
+                for day in range_days
+            ],
+        })
+
+    report.sort(key=lambda entry: (-entry["redemptions"], entry["code"]))
+    return {
+        "from": start,
+        "to": end,
+        "total_orders": total_orders,
+        "total_revenue": round(total_revenue, 2),
+        "coupons": report
     }
@@ -1,22 +1,31 @@
 """Orders API routes"""
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-from datetime import datetime, timezone
-from typing import List
+from sqlalchemy.orm import joinedload
+from datetime import datetime
+from typing import List, Optional, Tuple
 
+from app.config import get_settings
 from app.database import get_db
-from app.models import Order, OrderItem, Product, Coupon, User
+from app.models import Order, OrderItem, User, CheckoutQueueEntry
 from app.schemas import (
     PlaceOrderRequest, 
-    OrderResponse, 
     OrderItemResponse,
     BillResponse,
     AppliedCouponInfo,
-    OrderHistoryItem
+    OrderHistoryItem,
+    AsyncOrderAccepted,
+    OrderStatusResponse,
+    BulkOrderResponse
 )
 from app.auth import get_current_user
+from app.cache import BILLS_VERSION, cache_bill, etag_matches, get_cached_bill, read_data_version, CachedBill
+from app.checkout import create_order, validate_order_request, checkout_pipeline
+from app.bulk_orders import create_bulk_order
+from app.idempotency import hash_request, claim_key, wait_for_result, complete_key, release_key
+
+settings = get_settings()
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
@@ -25,193 +34,140 @@ router = APIRouter(prefix="/orders", tags=["orders"])
 async def place_order(
     request: PlaceOrderRequest,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
 ):
     """
     Place a new order with items and coupons.
     Updates user's order history and coupons used.
-    """
-    if not request.items:
-        raise HTTPException(status_code=400, detail="Order must contain at least one item")
     
-    # Calculate subtotal
-    subtotal = sum(item.price * item.quantity for item in request.items)
+    Retries that send the same Idempotency-Key header replay the stored
+    bill of the first attempt instead of placing the order again.
+    """
+    if not idempotency_key:
+        return await _checkout(request, db, current_user)
     
-    # Apply coupons and calculate discount
-    applied_coupons = []
-    total_discount = 0.0
-    remaining_amount = subtotal
-    coupon_codes_used = []
+    if len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be at most 255 characters")
     
-    for coupon_code in request.coupon_codes:
-        if remaining_amount <= 0:
+    request_hash = hash_request(request.model_dump_json())
+    while True:
+        claimed_at = await claim_key(current_user.id, idempotency_key, request_hash)
+        if claimed_at is not None:
             break
-            
-        # Fetch and validate coupon
-        query = select(Coupon).where(Coupon.code == coupon_code.upper())
-        result = await db.execute(query)
-        coupon = result.scalar_one_or_none()
-        
-        if not coupon:
-            raise HTTPException(status_code=404, detail=f"Coupon '{coupon_code}' not found")
-        
-        if not coupon.is_active:
-            raise HTTPException(status_code=400, detail=f"Coupon '{coupon_code}' is inactive")
-        
-        # Fix timezone comparison
-        if coupon.expires_at:
-            current_time = datetime.now(timezone.utc)
-            expires_at = coupon.expires_at.replace(tzinfo=timezone.utc) if coupon.expires_at.tzinfo is None else coupon.expires_at
-            if expires_at < current_time:
-                raise HTTPException(status_code=400, detail=f"Coupon '{coupon_code}' has expired")
-        
-        if coupon.usage_limit and coupon.used_count >= coupon.usage_limit:
-            raise HTTPException(status_code=400, detail=f"Coupon '{coupon_code}' usage limit reached")
-        
-        # Calculate discount
-        discount_amount = 0.0
-        
-        if coupon.makes_free:
-            discount_amount = remaining_amount
-        elif coupon.discount_type == "percentage":
-            discount_amount = remaining_amount * (coupon.discount_value / 100)
-        elif coupon.discount_type == "fixed":
-            discount_amount = min(coupon.discount_value, remaining_amount)
-        
-        remaining_amount -= discount_amount
-        total_discount += discount_amount
-        
-        applied_coupons.append(AppliedCouponInfo(
-            code=coupon.code,
-            discount_type=coupon.discount_type,
-            discount_value=coupon.discount_value,
-            discount_amount=discount_amount
-        ))
-        
-        coupon_codes_used.append(coupon.code)
-        
-        # Increment coupon usage count
-        coupon.used_count += 1
-    
-    final_total = max(0, subtotal - total_discount)
-    
-    # Prepare items_brought data
-    items_brought = [
-        {
-            "name": item.name,
-            "quantity": item.quantity,
-            "price": item.price
-        }
-        for item in request.items
-    ]
+        record = await wait_for_result(current_user.id, idempotency_key, request_hash)
+        if record is not None:
+            return Response(
+                content=record.response_body,
+                status_code=record.response_status,
+                media_type="application/json",
+                headers={"Idempotent-Replayed": "true"}
+            )
+        # The original request's lease expired; take the key over
     
-    # Create order
-    new_order = Order(
-        customer_email=current_user.email,
-        customer_name=current_user.name,
-        items_brought=items_brought,
-        subtotal=subtotal,
-        discount=total_discount,
-        total=final_total,
-        status="confirmed",
-        applied_coupon_code=",".join(coupon_codes_used) if coupon_codes_used else None
-    )
+    try:
+        return await _checkout(request, db, current_user, (idempotency_key, claimed_at))
+    except Exception:
+        await release_key(current_user.id, idempotency_key, claimed_at)
+        raise
+
+
+async def _checkout(
+    request: PlaceOrderRequest,
+    db: AsyncSession,
+    current_user: User,
+    idempotency_claim: Optional[Tuple[str, datetime]] = None
+) -> BillResponse:
+    """Place an order in the request session and commit it"""
+    bill = await create_order(db, request, current_user)
+    body = bill.model_dump_json().encode()
     
-    db.add(new_order)
-    await db.flush()  # Get order ID
+    # Store the replayable result in the same transaction as the order
+    if idempotency_claim:
+        key, claimed_at = idempotency_claim
+        await complete_key(db, current_user.id, key, claimed_at, bill.order_id, body)
     
-    # Create order items
-    order_items = []
-    for item in request.items:
-        # Verify product exists
-        product_query = select(Product).where(Product.id == item.product_id)
-        product_result = await db.execute(product_query)
-        product = product_result.scalar_one_or_none()
-        
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product '{item.product_id}' not found")
-        
-        # Check stock
-        if product.stock_quantity < item.quantity:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Insufficient stock for product '{product.name}'. Available: {product.stock_quantity}"
-            )
-        
-        # Deduct stock
-        product.stock_quantity -= item.quantity
-        
-        # Create order item with product name
-        order_item = OrderItem(
-            order_id=new_order.id,
-            product_id=item.product_id,
-            product_name=product.name,
-            quantity=item.quantity,
-            unit_price=item.price,
-            total_price=item.price * item.quantity
-        )
-        db.add(order_item)
-        order_items.append(order_item)
-    
-    # Update user's order history and coupons used
-    user_query = select(User).where(User.id == current_user.id)
-    user_result = await db.execute(user_query)
-    user = user_result.scalar_one()
+    # Nobody else can change the new order before the commit
+    bills_version = await read_data_version(db, BILLS_VERSION)
     
-    # Build detailed order info with product names and quantities
-    order_details = {
-        "order_id": new_order.id,
-        "items": [
-            {
-                "product_id": item.product_id,
-                "name": item.name,
-                "quantity": item.quantity,
-                "price": item.price
-            }
-            for item in request.items
-        ],
-        "total": final_total,
-        "coupons": coupon_codes_used,
-        "date": new_order.created_at.isoformat() if new_order.created_at else datetime.utcnow().isoformat()
-    }
+    # Commit transaction
+    await db.commit()
+    cache_bill(bill.order_id, bill.customer_email, body, bills_version)
     
-    # Update order history
-    if user.order_history is None:
-        user.order_history = []
-    user.order_history.append(order_details)
+    return bill
+
+
+@router.post("/async", response_model=AsyncOrderAccepted, status_code=202)
+async def place_order_async(
+    request: PlaceOrderRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Queue an order for asynchronous checkout.
+    The order is validated and stored in the durable checkout queue; poll
+    GET /orders/status/{token} until it is completed or failed.
+    """
+    if not checkout_pipeline.running:
+        raise HTTPException(status_code=503, detail="Asynchronous checkout is disabled")
     
-    # Update coupons used
-    if user.coupons_used is None:
-        user.coupons_used = []
-    user.coupons_used.extend(coupon_codes_used)
+    await validate_order_request(db, request)
     
-    # Commit transaction
+    entry = CheckoutQueueEntry(
+        user_id=current_user.id,
+        payload=request.model_dump(mode="json")
+    )
+    db.add(entry)
     await db.commit()
-    await db.refresh(new_order)
+    checkout_pipeline.notify()
     
-    # Prepare response
-    order_items_response = [
-        OrderItemResponse(
-            product_id=item.product_id,
-            quantity=item.quantity,
-            unit_price=item.unit_price,
-            total_price=item.total_price
-        )
-        for item in order_items
-    ]
+    return AsyncOrderAccepted(
+        token=entry.token,
+        status=entry.status,
+        status_url=f"{settings.API_V1_PREFIX}/orders/status/{entry.token}"
+    )
+
+
+@router.get("/status/{token}", response_model=OrderStatusResponse)
+async def get_order_status(
+    token: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Get the processing status of an asynchronously placed order"""
+    entry = await db.get(CheckoutQueueEntry, token)
     
-    return BillResponse(
-        order_id=new_order.id,
-        customer_name=new_order.customer_name or "Guest",
-        customer_email=new_order.customer_email,
-        items=order_items_response,
-        subtotal=subtotal,
-        applied_coupons=applied_coupons,
-        total_discount=total_discount,
-        final_total=final_total,
-        created_at=new_order.created_at,
-        status=new_order.status
+    if not entry or entry.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Order token not found")
+    
+    return entry
+
+
+@router.post("/bulk", response_model=BulkOrderResponse)
+async def place_bulk_order(
+    http_request: Request,
+    coupon_codes: List[str] = Query([]),
+    strict: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Place a large order from an NDJSON or CSV line stream.
+    Send Content-Type application/x-ndjson with {"product_id", "quantity"}
+    objects per line, or text/csv with a product_id,quantity header.
+    Prices come from the catalog (including bulk pricing tiers). Invalid
+    lines are skipped and reported, or reject the order when strict=true.
+    """
+    result = await create_bulk_order(
+        db,
+        http_request.stream(),
+        http_request.headers.get("content-type", ""),
+        current_user,
+        coupon_codes,
+        strict
     )
+    await db.commit()
+    return result
 
 
 @router.get("/history", response_model=List[OrderHistoryItem])
@@ -266,19 +222,43 @@ async def get_order_history(
     return history
 
 
+def _bill_response(entry: CachedBill, if_none_match: Optional[str]) -> Response:
+    """Serve a cached bill body, or 304 when the client already has it"""
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
 @router.get("/{order_id}", response_model=BillResponse)
 async def get_order_bill(
     order_id: str,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None)
 ):
     """
-    Get detailed bill for a specific order
+    Get detailed bill for a specific order.
+    Bills are served from an in-process cache with a strong ETag, so
+    clients sending If-None-Match get a 304 without a body. Cached bills
+    are only used while no worker has changed an existing order since.
     """
-    # Fetch order
-    query = select(Order).where(Order.id == order_id)
+    bills_version = await read_data_version(db, BILLS_VERSION)
+    cached = get_cached_bill(order_id, bills_version)
+    if cached:
+        # Verify order belongs to current user
+        if cached.customer_email != current_user.email:
+            raise HTTPException(status_code=403, detail="Access denied")
+        return _bill_response(cached, if_none_match)
+    
+    # Fetch order with its items and coupon breakdown in one joined read
+    query = (
+        select(Order)
+        .where(Order.id == order_id)
+        .options(joinedload(Order.items), joinedload(Order.coupons))
+    )
     result = await db.execute(query)
-    order = result.scalar_one_or_none()
+    order = result.unique().scalar_one_or_none()
     
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -287,11 +267,6 @@ async def get_order_bill(
     if order.customer_email != current_user.email:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Fetch order items
-    items_query = select(OrderItem).where(OrderItem.order_id == order_id)
-    items_result = await db.execute(items_query)
-    order_items = items_result.scalars().all()
-    
     order_items_response = [
         OrderItemResponse(
             product_id=item.product_id,
@@ -299,28 +274,20 @@ async def get_order_bill(
             unit_price=item.unit_price,
             total_price=item.total_price
         )
-        for item in order_items
+        for item in order.items
     ]
     
-    # Parse applied coupons
-    applied_coupons = []
-    if order.applied_coupon_code:
-        coupon_codes = order.applied_coupon_code.split(",")
-        for code in coupon_codes:
-            coupon_query = select(Coupon).where(Coupon.code == code)
-            coupon_result = await db.execute(coupon_query)
-            coupon = coupon_result.scalar_one_or_none()
-            if coupon:
-                # Calculate what discount was applied (approximate)
-                discount_per_coupon = order.discount / len(coupon_codes)
-                applied_coupons.append(AppliedCouponInfo(
-                    code=coupon.code,
-                    discount_type=coupon.discount_type,
-                    discount_value=coupon.discount_value,
-                    discount_amount=discount_per_coupon
-                ))
+    applied_coupons = [
+        AppliedCouponInfo(
+            code=coupon.code,
+            discount_type=coupon.discount_type,
+            discount_value=coupon.discount_value,
+            discount_amount=coupon.discount_amount
+        )
+        for coupon in order.coupons
+    ]
     
-    return BillResponse(
+    bill = BillResponse(
         order_id=order.id,
         customer_name=order.customer_name or "Guest",
         customer_email=order.customer_email,
@@ -332,3 +299,6 @@ async def get_order_bill(
         created_at=order.created_at,
         status=order.status
     )
+    entry = cache_bill(order.id, order.customer_email, bill.model_dump_json().encode(), bills_version)
+    
+    return _bill_response(entry, if_none_match)
@@ -1,5 +1,5 @@
 """Products API routes"""
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
@@ -7,8 +7,10 @@ from typing import List, Optional
 
 from app.database import get_db
 from app.models import Product, User
-from app.schemas import ProductResponse
+from app.schemas import ProductResponse, TrendingProductResponse, RelatedProductResponse
 from app.auth import get_current_user_optional
+from app.trending import trending_tracker
+from app.recommendations import related_products
 
 router = APIRouter(prefix="/products", tags=["products"])
 
@@ -39,6 +41,40 @@ async def get_products(
     return products
 
 
+@router.get("/trending", response_model=List[TrendingProductResponse])
+async def get_trending_products(
+    tier: Optional[int] = Query(None, ge=1, le=3),
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user_optional)
+):
+    """
+    Products selling fastest right now, by sales that decay with a
+    TRENDING_HALF_LIFE_HOURS half-life. Only products visible to the user's
+    tier are returned; tier narrows that further (e.g. tier=1 for entry products).
+    """
+    user_tier = current_user.tier if current_user and hasattr(current_user, 'tier') else 1
+    max_tier = min(tier, user_tier) if tier else user_tier
+    
+    top = trending_tracker.top(limit, max_tier=max_tier)
+    if not top:
+        return []
+    result = await db.execute(
+        select(Product)
+        .where(Product.id.in_([product_id for product_id, _ in top]), Product.tier <= max_tier)
+        .options(selectinload(Product.tiered_pricing))
+    )
+    products = {product.id: product for product in result.scalars().all()}
+    return [
+        TrendingProductResponse(
+            **ProductResponse.model_validate(products[product_id]).model_dump(),
+            trending_score=round(score, 3)
+        )
+        for product_id, score in top
+        if product_id in products
+    ]
+
+
 @router.get("/{product_id}", response_model=ProductResponse)
 async def get_product(product_id: str, db: AsyncSession = Depends(get_db)):
     """Get single product by ID"""
@@ -53,3 +89,43 @@ async def get_product(product_id: str, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Product not found")
     
     return product
+
+
+@router.get("/{product_id}/related", response_model=List[RelatedProductResponse])
+async def get_related_products(
+    product_id: str,
+    limit: int = Query(5, ge=1, le=20),
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user_optional)
+):
+    """
+    Products most often bought in the same order as this one, from the
+    in-memory co-occurrence matrix. Only products visible to the user's tier
+    are considered, including the requested one.
+    """
+    user_tier = current_user.tier if current_user and hasattr(current_user, 'tier') else 1
+    
+    result = await db.execute(
+        select(Product.id).where(Product.id == product_id, Product.tier <= user_tier)
+    )
+    product_id = result.scalar_one_or_none()
+    if not product_id:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    related = related_products.related(product_id, limit, max_tier=user_tier)
+    if not related:
+        return []
+    result = await db.execute(
+        select(Product)
+        .where(Product.id.in_([related_id for related_id, _ in related]), Product.tier <= user_tier)
+        .options(selectinload(Product.tiered_pricing))
+    )
+    products = {product.id: product for product in result.scalars().all()}
+    return [
+        RelatedProductResponse(
+            **ProductResponse.model_validate(products[related_id]).model_dump(),
+            bought_together=count
+        )
+        for related_id, count in related
+        if related_id in products
+    ]
@@ -0,0 +1,249 @@
+"""
+In-memory columnar sales cube for ad-hoc analytics drill-downs.
+
+Every order item is one row of NumPy columns: day, product, category,
+product tier, user tier and company as small integer codes, plus order,
+quantity and revenue. The cube is loaded once at startup and rows from new
+orders are appended after their checkout transaction commits, so filters and
+group-bys are answered with vectorized reductions without touching Postgres.
+
+Orders are numbered with a per-process sequence instead of being
+dictionary-encoded: their ids are only needed to count distinct orders, and
+an order's rows are always appended together.
+
+NumPy is optional; without it the cube stays disabled.
+"""
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+from app.database import pop_committed, stage_for_commit
+from app.models import Order, OrderItem, Product, User
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+EPOCH = date(1970, 1, 1)
+
+# Dimensions that can be filtered and grouped on
+DIMENSIONS = ["day", "product", "category", "product_tier", "user_tier", "company"]
+
+# Encoded dimensions map their values to integer codes through a dictionary
+ENCODED_DIMENSIONS = ["product", "category", "company"]
+
+COLUMN_TYPES = {
+    "day": "int32",
+    "product": "int32",
+    "category": "int32",
+    "product_tier": "int16",
+    "user_tier": "int16",
+    "company": "int32",
+    "order": "int64",
+    "quantity": "int64",
+    "revenue": "float64",
+}
+
+LOAD_BATCH_SIZE = 10000
+
+
+def _day_number(value: datetime) -> int:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return (value.date() - EPOCH).days
+
+
+class SalesCube:
+    """Append-only columnar store of order items with group-by queries"""
+
+    def __init__(self):
+        self.enabled = np is not None
+        self.loaded = False
+        self._reset()
+
+    def _reset(self) -> None:
+        self._size = 0
+        self._columns: Dict[str, "np.ndarray"] = {}
+        self._codes: Dict[str, Dict[object, int]] = {name: {} for name in ENCODED_DIMENSIONS}
+        self._values: Dict[str, List[object]] = {name: [] for name in ENCODED_DIMENSIONS}
+        self._order_sequence = 0
+        self._last_order_id = None
+        if self.enabled:
+            self._columns = {name: np.zeros(1024, dtype=dtype) for name, dtype in COLUMN_TYPES.items()}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _encode(self, dimension: str, value) -> int:
+        codes = self._codes[dimension]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self._values[dimension].append(value)
+        return code
+
+    def _decode(self, dimension: str, code: int):
+        if dimension == "day":
+            return date.fromordinal(EPOCH.toordinal() + int(code))
+        if dimension in self._values:
+            return self._values[dimension][int(code)]
+        return int(code)
+
+    def append(self, rows: Iterable[Tuple]) -> None:
+        """
+        Add rows of (created_at, order_id, product_id, category, product_tier,
+        user_tier, company, quantity, revenue). Rows of one order must be
+        consecutive.
+        """
+        if not self.enabled:
+            return
+        rows = list(rows)
+        needed = self._size + len(rows)
+        capacity = len(self._columns["day"])
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            for name, column in self._columns.items():
+                grown = np.zeros(capacity, dtype=column.dtype)
+                grown[:self._size] = column[:self._size]
+                self._columns[name] = grown
+
+        columns = self._columns
+        for index, row in enumerate(rows, start=self._size):
+            created_at, order_id, product_id, category, product_tier, user_tier, company, quantity, revenue = row
+            columns["day"][index] = _day_number(created_at)
+            if order_id != self._last_order_id:
+                self._order_sequence += 1
+                self._last_order_id = order_id
+            columns["order"][index] = self._order_sequence
+            columns["product"][index] = self._encode("product", product_id)
+            columns["category"][index] = self._encode("category", category)
+            columns["product_tier"][index] = product_tier or 0
+            columns["user_tier"][index] = user_tier or 0
+            columns["company"][index] = self._encode("company", company)
+            columns["quantity"][index] = quantity
+            columns["revenue"][index] = revenue
+        self._size = needed
+
+    async def load(self, engine: AsyncEngine) -> None:
+        """Load every order item from the database, replacing the current contents"""
+        if not self.enabled:
+            return
+        self._reset()
+        query = (
+            select(
+                Order.created_at,
+                Order.id,
+                OrderItem.product_id,
+                Product.category,
+                Product.tier,
+                User.tier,
+                User.server,
+                OrderItem.quantity,
+                OrderItem.total_price,
+            )
+            .select_from(OrderItem)
+            .join(Order, (Order.id == OrderItem.order_id) & (Order.created_at == OrderItem.order_created_at))
+            .join(Product, Product.id == OrderItem.product_id)
+            .outerjoin(User, User.email == Order.customer_email)
+            .order_by(Order.created_at, Order.id)  # Keeps each order's rows together
+            .execution_options(yield_per=LOAD_BATCH_SIZE)
+        )
+        async with AsyncSession(engine) as db:
+            result = await db.stream(query)
+            async for rows in result.partitions():
+                self.append(rows)
+        self.loaded = True
+
+    def query(
+        self,
+        group_by: List[str],
+        filters: Optional[Dict[str, list]] = None,
+        start: Optional[date] = None,
+        end: Optional[date] = None
+    ) -> List[dict]:
+        """
+        Revenue, quantity and distinct order count per group, for rows with
+        start <= day < end matching every filter (dimension -> allowed values).
+        Without group_by a single total row is returned.
+        """
+        size = self._size
+        columns = {name: column[:size] for name, column in self._columns.items()}
+        mask = np.ones(size, dtype=bool)
+        if start is not None:
+            mask &= columns["day"] >= (start - EPOCH).days
+        if end is not None:
+            mask &= columns["day"] < (end - EPOCH).days
+        for dimension, values in (filters or {}).items():
+            if dimension in self._codes:
+                allowed = [self._codes[dimension][value] for value in values if value in self._codes[dimension]]
+            elif dimension == "day":
+                allowed = [(value - EPOCH).days for value in values]
+            else:
+                allowed = values
+            mask &= np.isin(columns[dimension], allowed)
+
+        # Combine the group columns into one mixed-radix key per row
+        keys = np.zeros(int(mask.sum()), dtype=np.int64)
+        radices = []
+        for dimension in group_by:
+            column = columns[dimension][mask].astype(np.int64)
+            low = int(column.min()) if len(column) else 0
+            radix = int(column.max()) - low + 1 if len(column) else 1
+            keys = keys * radix + (column - low)
+            radices.append((dimension, low, radix))
+
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        revenue = np.bincount(inverse, weights=columns["revenue"][mask], minlength=len(unique_keys))
+        quantity = np.bincount(inverse, weights=columns["quantity"][mask], minlength=len(unique_keys))
+        order_pairs = np.unique(np.stack([inverse, columns["order"][mask]]), axis=1)
+        orders = np.bincount(order_pairs[0], minlength=len(unique_keys))
+
+        results = []
+        for position, key in enumerate(unique_keys.tolist()):
+            row = {}
+            for dimension, low, radix in reversed(radices):
+                key, code = divmod(key, radix)
+                row[dimension] = self._decode(dimension, code + low)
+            row = {dimension: row[dimension] for dimension in group_by}
+            row.update(
+                revenue=float(revenue[position]),
+                quantity=int(quantity[position]),
+                orders=int(orders[position])
+            )
+            results.append(row)
+        return results
+
+
+sales_cube = SalesCube()
+
+
+def stage_order_rows(
+    db: AsyncSession,
+    order: Order,
+    user: User,
+    lines: Iterable[Tuple[Product, int, float]]
+) -> None:
+    """
+    Queue an order's items for the cube; they are appended once the
+    session commits and dropped if the transaction or savepoint they were
+    staged in rolls back. lines are (product, quantity, total_price) tuples.
+    """
+    if not sales_cube.enabled:
+        return
+    stage_for_commit(db, "sales_cube_rows", (
+        (order.created_at, order.id, product.id, product.category, product.tier,
+         user.tier, user.server, quantity, total_price)
+        for product, quantity, total_price in lines
+    ))
+
+
+@event.listens_for(Session, "after_commit")
+def _append_staged_rows(session):
+    rows = pop_committed(session, "sales_cube_rows")
+    if rows and sales_cube.loaded:
+        sales_cube.append(rows)
@@ -3,7 +3,7 @@ Pydantic schemas for request/response validation
 """
 
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, List
+from typing import Literal, Optional, List
 from datetime import datetime
 
 
@@ -35,6 +35,16 @@ class ProductResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class TrendingProductResponse(ProductResponse):
+    """Product with its decayed recent-sales score"""
+    trending_score: float
+
+
+class RelatedProductResponse(ProductResponse):
+    """Product with the number of orders it shared with the requested product"""
+    bought_together: int
+
+
 # =========================
 # Coupon Schemas
 # =========================
@@ -230,6 +240,47 @@ class BillResponse(BaseModel):
     status: str
 
 
+class BulkLineError(BaseModel):
+    """Validation error for one line of a bulk order upload"""
+    line: int
+    product_id: Optional[str] = None
+    detail: str
+
+
+class BulkOrderResponse(BaseModel):
+    """Bulk order result with per-line errors"""
+    order_id: str
+    lines_received: int
+    lines_accepted: int
+    line_errors: List[BulkLineError]
+    items: List[OrderItemResponse]
+    subtotal: float
+    applied_coupons: List[AppliedCouponInfo]
+    total_discount: float
+    final_total: float
+    created_at: datetime
+    status: str
+
+
+class AsyncOrderAccepted(BaseModel):
+    """Asynchronous checkout acknowledgement"""
+    token: str
+    status: str
+    status_url: str
+
+
+class OrderStatusResponse(BaseModel):
+    """Asynchronous checkout status"""
+    token: str
+    status: str
+    order_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    processed_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 # =========================
 # AI Chat Schemas
 # =========================
@@ -243,3 +294,4 @@ class ChatResponse(BaseModel):
     """AI chat response"""
     answer: str
     context_used: dict = {}
+    answered_by: Literal["intent", "cache", "model"] = "model"
@@ -0,0 +1,278 @@
+"""
+Approximate per-day analytics sketches fed from checkout.
+
+Each UTC day keeps a HyperLogLog of customer emails (unique buyers) and a
+log-bucketed quantile sketch of order totals (order value percentiles). Both
+merge losslessly, so any date range is answered by merging one small sketch
+per day instead of scanning orders.
+
+Each order inserts a pending_sketch_orders row in its own checkout
+transaction, so a committed order is never lost to a crash. Every
+SKETCH_FLUSH_INTERVAL_SECONDS (and on shutdown) pending rows are merged into
+daily_sketches and deleted in one transaction; rows left by a crashed
+process are merged by the next flush, from any worker. Readers merge the
+daily sketches with the rows still pending. rebuild_sales_sketches.py
+recomputes the table from orders.
+"""
+import asyncio
+import hashlib
+import math
+from datetime import date, datetime, time, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.models import DailySketch, Order, PendingSketchOrder
+
+settings = get_settings()
+
+# Pending orders merged per flush transaction
+FLUSH_BATCH_SIZE = 10000
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with 2^precision one-byte registers (~1.6% error at 12)"""
+
+    def __init__(self, precision: int = 12, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.size)
+
+    def add(self, value: str) -> None:
+        hashed = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        index = hashed >> (64 - self.precision)
+        remaining_bits = 64 - self.precision
+        remainder = hashed & ((1 << remaining_bits) - 1)
+        rank = remaining_bits - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self) -> int:
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # Linear counting for small cardinalities
+        return round(estimate)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+
+class QuantileSketch:
+    """
+    Relative-error quantile sketch (DDSketch-style): values are counted in
+    logarithmic buckets, so every quantile is within relative_accuracy of the
+    true value and merging is a bucket-wise sum.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0  # Values <= 0, e.g. fully discounted orders
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.bins.values())
+
+    def add(self, value: float, count: int = 1) -> None:
+        if value <= 0:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + count
+
+    def merge(self, other: "QuantileSketch") -> None:
+        self.zero_count += other.zero_count
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+
+    def quantile(self, q: float) -> Optional[float]:
+        total = self.count
+        if total == 0:
+            return None
+        rank = q * (total - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_dict(self) -> dict:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "zero_count": self.zero_count,
+            "bins": {str(index): count for index, count in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        sketch = cls(data.get("relative_accuracy", 0.01))
+        sketch.zero_count = data.get("zero_count", 0)
+        sketch.bins = {int(index): count for index, count in data.get("bins", {}).items()}
+        return sketch
+
+
+class DaySketches:
+    """The sketches kept for one day"""
+
+    def __init__(self, customers: Optional[HyperLogLog] = None, order_totals: Optional[QuantileSketch] = None):
+        self.customers = customers or HyperLogLog()
+        self.order_totals = order_totals or QuantileSketch()
+
+    def add_order(self, customer_email: str, total: float) -> None:
+        self.customers.add(customer_email.lower())
+        self.order_totals.add(total)
+
+    def merge(self, other: "DaySketches") -> None:
+        self.customers.merge(other.customers)
+        self.order_totals.merge(other.order_totals)
+
+    @classmethod
+    def from_row(cls, row: DailySketch) -> "DaySketches":
+        return cls(HyperLogLog(registers=row.customers), QuantileSketch.from_dict(row.order_totals))
+
+
+def _utc_day(value: datetime) -> date:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+class SketchStore:
+    """Periodic merge of pending orders into daily_sketches"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def flush(self) -> int:
+        """Merge pending orders into daily_sketches; returns the number of orders merged"""
+        merged = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                batch = (
+                    select(PendingSketchOrder.id)
+                    .order_by(PendingSketchOrder.id)
+                    .limit(FLUSH_BATCH_SIZE)
+                    .with_for_update(skip_locked=True)
+                )
+                result = await db.execute(
+                    delete(PendingSketchOrder)
+                    .where(PendingSketchOrder.id.in_(batch.scalar_subquery()))
+                    .returning(
+                        PendingSketchOrder.order_created_at,
+                        PendingSketchOrder.customer_email,
+                        PendingSketchOrder.total
+                    )
+                )
+                orders = result.all()
+                if not orders:
+                    return merged
+                pending = build_day_sketches(orders)
+
+                result = await db.execute(
+                    select(DailySketch)
+                    .where(DailySketch.day.in_(list(pending)))
+                    .order_by(DailySketch.day)
+                    .with_for_update()
+                )
+                rows = {row.day: row for row in result.scalars().all()}
+                for day, delta in pending.items():
+                    row = rows.get(day)
+                    if row is None:
+                        sketches = delta
+                        row = DailySketch(day=day)
+                        db.add(row)
+                    else:
+                        sketches = DaySketches.from_row(row)
+                        sketches.merge(delta)
+                    row.customers = sketches.customers.to_bytes()
+                    row.order_totals = sketches.order_totals.to_dict()
+                await db.commit()
+            merged += len(orders)
+            if len(orders) < FLUSH_BATCH_SIZE:
+                return merged
+
+    async def summary(self, db: AsyncSession, start: date, end: date) -> dict:
+        """Unique customers and order total percentiles for start <= day < end"""
+        merged = DaySketches()
+        result = await db.execute(
+            select(DailySketch).where(DailySketch.day >= start, DailySketch.day < end)
+        )
+        for row in result.scalars().all():
+            merged.merge(DaySketches.from_row(row))
+        result = await db.execute(
+            select(
+                PendingSketchOrder.order_created_at,
+                PendingSketchOrder.customer_email,
+                PendingSketchOrder.total
+            ).where(
+                PendingSketchOrder.order_created_at >= datetime.combine(start, time.min, timezone.utc),
+                PendingSketchOrder.order_created_at < datetime.combine(end, time.min, timezone.utc)
+            )
+        )
+        for delta in build_day_sketches(result.all()).values():
+            merged.merge(delta)
+
+        totals = merged.order_totals
+        return {
+            "unique_customers": merged.customers.count(),
+            "orders": totals.count,
+            "order_value_p50": totals.quantile(0.5),
+            "order_value_p90": totals.quantile(0.9),
+            "order_value_p99": totals.quantile(0.99),
+        }
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.SKETCH_FLUSH_INTERVAL_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️  Sketch flush failed, will retry: {e}")
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="sketch-flush")
+
+    async def stop(self) -> None:
+        """Stop the periodic flush and merge what is still pending"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+sketch_store = SketchStore()
+
+
+def stage_order_sketch(db: AsyncSession, order: Order) -> None:
+    """Record an order for the sketches in the caller's transaction"""
+    db.add(PendingSketchOrder(
+        order_created_at=order.created_at,
+        customer_email=order.customer_email,
+        total=order.total
+    ))
+
+
+def build_day_sketches(
+    orders: Iterable[Tuple[datetime, str, float]],
+    days: Optional[Dict[date, DaySketches]] = None
+) -> Dict[date, DaySketches]:
+    """Add (created_at, customer_email, total) rows to per-day sketches"""
+    days = {} if days is None else days
+    for created_at, customer_email, total in orders:
+        days.setdefault(_utc_day(created_at), DaySketches()).add_order(customer_email, total)
+    return days
@@ -0,0 +1,288 @@
+"""
+Columnar Parquet snapshots of the sales tables for offline analysis.
+
+Layout under SNAPSHOT_DIR:
+    orders/day=YYYY-MM-DD/part-0.parquet       one directory per UTC day
+    order_items/day=YYYY-MM-DD/part-0.parquet
+    products/part-0.parquet                     rewritten on every run
+    coupons/part-0.parquet
+    _state.json                                 last fully exported day
+
+Days are exported incrementally: every run writes the days after the last
+complete one, up to and including today. A day only counts as complete once
+commit_lag has passed since it ended, because an order committed just after
+midnight can carry the previous day's created_at; until then it is
+rewritten on every run.
+SalesSnapshot reads the files back memory-mapped with pyarrow.dataset, so
+analysts can aggregate without querying the database.
+
+pyarrow is optional and only needed by the snapshot job and the helper.
+"""
+import json
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.models import Coupon, Order, OrderItem, Product
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.fs as fs
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+STATE_FILE = "_state.json"
+EXPORT_BATCH_ROWS = 50000  # Rows fetched per cursor round trip and written per row group
+
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise RuntimeError("pyarrow is required for sales snapshots (pip install pyarrow)")
+
+
+def _schemas() -> Dict[str, "pa.Schema"]:
+    timestamp = pa.timestamp("us", tz="UTC")
+    return {
+        "orders": pa.schema([
+            ("id", pa.string()),
+            ("customer_email", pa.string()),
+            ("customer_name", pa.string()),
+            ("subtotal", pa.float64()),
+            ("discount", pa.float64()),
+            ("total", pa.float64()),
+            ("status", pa.string()),
+            ("applied_coupon_code", pa.string()),
+            ("created_at", timestamp),
+        ]),
+        "order_items": pa.schema([
+            ("id", pa.string()),
+            ("order_id", pa.string()),
+            ("order_created_at", timestamp),
+            ("product_id", pa.string()),
+            ("product_name", pa.string()),
+            ("quantity", pa.int64()),
+            ("unit_price", pa.float64()),
+            ("total_price", pa.float64()),
+        ]),
+        "products": pa.schema([
+            ("id", pa.string()),
+            ("name", pa.string()),
+            ("category", pa.string()),
+            ("tier", pa.int64()),
+            ("base_price", pa.float64()),
+            ("stock_quantity", pa.int64()),
+            ("created_at", timestamp),
+        ]),
+        "coupons": pa.schema([
+            ("id", pa.string()),
+            ("code", pa.string()),
+            ("discount_type", pa.string()),
+            ("discount_value", pa.float64()),
+            ("usage_limit", pa.int64()),
+            ("used_count", pa.int64()),
+            ("is_active", pa.bool_()),
+            ("expires_at", timestamp),
+        ]),
+    }
+
+
+# Model columns exported for each table, in schema order
+TABLE_COLUMNS = {
+    "orders": [
+        Order.id, Order.customer_email, Order.customer_name, Order.subtotal, Order.discount,
+        Order.total, Order.status, Order.applied_coupon_code, Order.created_at,
+    ],
+    "order_items": [
+        OrderItem.id, OrderItem.order_id, OrderItem.order_created_at, OrderItem.product_id,
+        OrderItem.product_name, OrderItem.quantity, OrderItem.unit_price, OrderItem.total_price,
+    ],
+    "products": [
+        Product.id, Product.name, Product.category, Product.tier, Product.base_price,
+        Product.stock_quantity, Product.created_at,
+    ],
+    "coupons": [
+        Coupon.id, Coupon.code, Coupon.discount_type, Coupon.discount_value, Coupon.usage_limit,
+        Coupon.used_count, Coupon.is_active, Coupon.expires_at,
+    ],
+}
+
+# Time column of each day-partitioned table
+DAY_COLUMNS = {"orders": Order.created_at, "order_items": OrderItem.order_created_at}
+
+
+def _to_batch(rows: Sequence[Tuple], schema: "pa.Schema") -> "pa.RecordBatch":
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema
+    )
+
+
+async def _write_table(result, schema: "pa.Schema", directory: str) -> int:
+    """
+    Write a streamed result as one Parquet file (one row group per fetched
+    chunk), replacing the directory's previous file atomically
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "part-0.parquet")
+    temporary = os.path.join(directory, ".part-0.parquet.tmp")  # Hidden from readers
+    rows = 0
+    with pq.ParquetWriter(temporary, schema, compression="zstd") as writer:
+        async for chunk in result.partitions():
+            writer.write_batch(_to_batch(chunk, schema))
+            rows += len(chunk)
+    os.replace(temporary, path)
+    return rows
+
+
+def _read_state(snapshot_dir: str) -> Optional[date]:
+    try:
+        with open(os.path.join(snapshot_dir, STATE_FILE)) as state:
+            return date.fromisoformat(json.load(state)["complete_through"])
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+
+
+def _write_state(snapshot_dir: str, complete_through: date) -> None:
+    path = os.path.join(snapshot_dir, STATE_FILE)
+    with open(path + ".tmp", "w") as state:
+        json.dump({"complete_through": complete_through.isoformat()}, state)
+    os.replace(path + ".tmp", path)
+
+
+async def export_snapshot(
+    engine: AsyncEngine,
+    snapshot_dir: str,
+    start: Optional[date] = None,
+    commit_lag: timedelta = timedelta(0)
+) -> Dict[str, int]:
+    """
+    Export the days after the last complete one (or from start) through
+    today, plus the full products and coupons tables. Returns rows written per table.
+    """
+    _require_pyarrow()
+    schemas = _schemas()
+    written = {name: 0 for name in TABLE_COLUMNS}
+    now = datetime.now(timezone.utc)
+    today = now.date()
+    # Days ending at least commit_lag ago can no longer receive orders
+    settled_through = (now - commit_lag).date() - timedelta(days=1)
+
+    async with AsyncSession(engine) as db:
+        if start is None:
+            complete_through = _read_state(snapshot_dir)
+            if complete_through is not None:
+                start = complete_through + timedelta(days=1)
+            else:
+                result = await db.execute(select(Order.created_at).order_by(Order.created_at).limit(1))
+                oldest = result.scalar()
+                start = oldest.astimezone(timezone.utc).date() if oldest else today
+
+        for name in ("products", "coupons"):
+            result = await db.stream(
+                select(*TABLE_COLUMNS[name]).execution_options(yield_per=EXPORT_BATCH_ROWS)
+            )
+            written[name] = await _write_table(result, schemas[name], os.path.join(snapshot_dir, name))
+
+        day = start
+        while day <= today:
+            lower = datetime.combine(day, time.min, tzinfo=timezone.utc)
+            upper = lower + timedelta(days=1)
+            for name, day_column in DAY_COLUMNS.items():
+                result = await db.stream(
+                    select(*TABLE_COLUMNS[name])
+                    .where(day_column >= lower, day_column < upper)
+                    .execution_options(yield_per=EXPORT_BATCH_ROWS)
+                )
+                written[name] += await _write_table(
+                    result,
+                    schemas[name],
+                    os.path.join(snapshot_dir, name, f"day={day.isoformat()}")
+                )
+            if day <= settled_through:
+                _write_state(snapshot_dir, day)
+            day += timedelta(days=1)
+
+    return written
+
+
+class SalesSnapshot:
+    """
+    Read-only access to a snapshot directory.
+
+        snapshot = SalesSnapshot("snapshots")
+        items = snapshot.table("order_items", start=date(2025, 1, 1))
+        snapshot.aggregate("orders", ["day"], [("total", "sum"), ("id", "count")])
+    """
+
+    def __init__(self, snapshot_dir: str):
+        _require_pyarrow()
+        self.snapshot_dir = snapshot_dir
+
+    def dataset(self, name: str) -> "ds.Dataset":
+        """Lazily opened dataset; day-partitioned tables expose a day column"""
+        return ds.dataset(
+            os.path.join(self.snapshot_dir, name),
+            format="parquet",
+            filesystem=fs.LocalFileSystem(use_mmap=True),
+            partitioning=ds.partitioning(pa.schema([("day", pa.date32())]), flavor="hive")
+            if name in DAY_COLUMNS else None,
+            ignore_prefixes=[".", "_"]
+        )
+
+    def table(
+        self,
+        name: str,
+        columns: Optional[List[str]] = None,
+        start: Optional[date] = None,
+        end: Optional[date] = None
+    ) -> "pa.Table":
+        """Load a table, pruning day partitions to start <= day < end"""
+        dataset = self.dataset(name)
+        condition = None
+        if name in DAY_COLUMNS:
+            if start is not None:
+                condition = ds.field("day") >= start
+            if end is not None:
+                upper = ds.field("day") < end
+                condition = upper if condition is None else condition & upper
+        return dataset.to_table(columns=columns, filter=condition)
+
+    def aggregate(
+        self,
+        name: str,
+        group_by: List[str],
+        aggregations: List[Tuple[str, str]],
+        start: Optional[date] = None,
+        end: Optional[date] = None
+    ) -> "pa.Table":
+        """
+        Group a table and aggregate it with Arrow's vectorized kernels.
+        aggregations are (column, function) pairs, e.g. ("total", "sum").
+        Joins are left to the caller, e.g. via pa.Table.join with table("products").
+        """
+        columns = list(dict.fromkeys(group_by + [column for column, _ in aggregations]))
+        table = self.table(name, columns=columns, start=start, end=end)
+        return table.group_by(group_by).aggregate(aggregations)
+
+    def revenue_by_day(self, start: Optional[date] = None, end: Optional[date] = None) -> "pa.Table":
+        """Orders and revenue per UTC day"""
+        return self.aggregate(
+            "orders", ["day"], [("total", "sum"), ("id", "count")], start, end
+        ).sort_by("day")
+
+    def top_products(self, limit: int = 5, start: Optional[date] = None, end: Optional[date] = None) -> "pa.Table":
+        """Products by units sold, joined with their names and categories"""
+        sales = self.aggregate(
+            "order_items", ["product_id"], [("quantity", "sum"), ("total_price", "sum")], start, end
+        )
+        products = self.table("products", columns=["id", "name", "category"])
+        joined = sales.join(products, "product_id", "id")
+        order = pc.sort_indices(joined, sort_keys=[("quantity_sum", "descending")])
+        return joined.take(order).slice(0, limit)
@@ -0,0 +1,115 @@
+"""
+Trending products from exponentially decayed sales counters.
+
+Every unit sold adds to its product's score, and scores halve every
+TRENDING_HALF_LIFE_HOURS. Scores use forward decay: a sale at time t adds
+quantity * 2^((t - landmark) / half_life), so stored scores never have to be
+touched as time passes and their order is the current ranking. The landmark
+is moved forward (rescaling every score) before the weights grow too large.
+
+The tracker is fed from committed orders and rebuilt at startup from the
+order_items of the last TRENDING_LOOKBACK_HOURS.
+"""
+import heapq
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.database import pop_committed, stage_for_commit
+from app.models import OrderItem, Product
+
+settings = get_settings()
+
+# Rescale once weights reach 2^RESCALE_EXPONENT to stay far from float overflow
+RESCALE_EXPONENT = 512
+
+
+class TrendingTracker:
+    """Decayed per-product sales scores, bounded to the capacity highest ones"""
+
+    def __init__(self, half_life_seconds: float, capacity: int):
+        self.half_life_seconds = half_life_seconds
+        self.capacity = capacity
+        self._landmark = time.time()
+        self._scores: Dict[str, float] = {}
+        self._tiers: Dict[str, int] = {}
+
+    def _weight(self, timestamp: float) -> float:
+        return 2.0 ** ((timestamp - self._landmark) / self.half_life_seconds)
+
+    def _rescale(self, now: float) -> None:
+        factor = 2.0 ** (-(now - self._landmark) / self.half_life_seconds)
+        self._scores = {product_id: score * factor for product_id, score in self._scores.items()}
+        self._landmark = now
+
+    def record(self, product_id: str, tier: int, quantity: int, timestamp: Optional[float] = None) -> None:
+        """Count units of a product sold at timestamp (default now)"""
+        timestamp = time.time() if timestamp is None else timestamp
+        if (timestamp - self._landmark) / self.half_life_seconds > RESCALE_EXPONENT:
+            self._rescale(timestamp)
+        self._scores[product_id] = self._scores.get(product_id, 0.0) + quantity * self._weight(timestamp)
+        self._tiers[product_id] = tier or 1
+        if len(self._scores) > 2 * self.capacity:
+            # Keep the top capacity products; cold ones drop out until they sell again
+            kept = heapq.nlargest(self.capacity, self._scores.items(), key=lambda entry: entry[1])
+            self._scores = dict(kept)
+            self._tiers = {product_id: self._tiers[product_id] for product_id in self._scores}
+
+    def top(self, limit: int, max_tier: Optional[int] = None) -> List[Tuple[str, float]]:
+        """The limit highest (product_id, score) pairs, scores decayed to now"""
+        candidates = (
+            entry for entry in self._scores.items()
+            if max_tier is None or self._tiers[entry[0]] <= max_tier
+        )
+        now_weight = self._weight(time.time())
+        return [
+            (product_id, score / now_weight)
+            for product_id, score in heapq.nlargest(limit, candidates, key=lambda entry: entry[1])
+        ]
+
+    def clear(self) -> None:
+        self._landmark = time.time()
+        self._scores.clear()
+        self._tiers.clear()
+
+    async def load(self, engine: AsyncEngine, lookback: timedelta) -> int:
+        """Rebuild the scores from recent order items; returns the number of items read"""
+        self.clear()
+        since = datetime.now(timezone.utc) - lookback
+        rows = 0
+        async with AsyncSession(engine) as db:
+            result = await db.stream(
+                select(OrderItem.product_id, Product.tier, OrderItem.quantity, OrderItem.order_created_at)
+                .join(Product, Product.id == OrderItem.product_id)
+                .where(OrderItem.order_created_at >= since)
+                .execution_options(yield_per=10000)
+            )
+            async for product_id, tier, quantity, created_at in result:
+                self.record(product_id, tier, quantity, created_at.timestamp())
+                rows += 1
+        return rows
+
+
+trending_tracker = TrendingTracker(
+    settings.TRENDING_HALF_LIFE_HOURS * 3600,
+    settings.TRENDING_CAPACITY
+)
+
+
+def stage_trending_sales(db: AsyncSession, lines: Iterable[Tuple[Product, int]]) -> None:
+    """
+    Queue (product, quantity) sales; they are counted once the session
+    commits and dropped if their transaction or savepoint rolls back
+    """
+    stage_for_commit(db, "trending_sales", ((product.id, product.tier, quantity) for product, quantity in lines))
+
+
+@event.listens_for(Session, "after_commit")
+def _record_staged_sales(session):
+    for product_id, tier, quantity in pop_committed(session, "trending_sales"):
+        trending_tracker.record(product_id, tier, quantity)
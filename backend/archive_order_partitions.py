@@ -0,0 +1,40 @@
+"""
+Archive order partitions older than ARCHIVE_HORIZON_MONTHS.
+Run nightly (e.g. from cron): python archive_order_partitions.py [--horizon-months N] [--archive-dir DIR]
+
+Each month of orders, order_items and order_coupons is detached, written to
+ARCHIVE_DIR as gzip-compressed NDJSON and dropped. Upcoming monthly partitions
+are created on every run.
+"""
+import argparse
+import asyncio
+from app.config import get_settings
+from app.database import engine
+from app.partitions import archivable_months, archive_month, ensure_current_partitions
+
+settings = get_settings()
+
+
+async def archive(horizon_months: int, archive_dir: str):
+    """Create upcoming partitions and archive the expired ones"""
+    async with engine.begin() as conn:
+        await ensure_current_partitions(conn, settings.PARTITION_MONTHS_AHEAD)
+        months = await archivable_months(conn, horizon_months)
+
+    if not months:
+        print(f"✅ No partitions older than {horizon_months} months")
+    for month in months:
+        print(f"Archiving {month.strftime('%Y-%m')}...")
+        exported = await archive_month(engine, month, archive_dir)
+        for name, rows in exported.items():
+            print(f"  ✓ {name}: {rows} rows -> {archive_dir}/{name}.ndjson.gz")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--horizon-months", type=int, default=settings.ARCHIVE_HORIZON_MONTHS)
+    parser.add_argument("--archive-dir", default=settings.ARCHIVE_DIR)
+    args = parser.parse_args()
+    asyncio.run(archive(args.horizon_months, args.archive_dir))
@@ -0,0 +1,75 @@
+"""Convert string id and foreign key columns to the native uuid type"""
+import asyncio
+from sqlalchemy import text
+from app.database import engine, Base
+from app.models import GUID
+
+UUID_PATTERN = "^[0-9a-fA-F]{8}-?([0-9a-fA-F]{4}-?){3}[0-9a-fA-F]{12}$"
+
+
+def uuid_columns():
+    """(table, column) pairs declared as GUID in the models"""
+    return [
+        (table.name, column.name)
+        for table in Base.metadata.sorted_tables
+        for column in table.columns
+        if isinstance(column.type, GUID)
+    ]
+
+
+async def migrate():
+    """Change column types in place, dropping and restoring foreign keys around it"""
+    async with engine.begin() as conn:
+        pending = {}
+        for table, column in uuid_columns():
+            result = await conn.execute(text("""
+                SELECT data_type
+                FROM information_schema.columns
+                WHERE table_name = :table AND column_name = :column
+            """), {"table": table, "column": column})
+            data_type = result.scalar()
+            if data_type is None or data_type == "uuid":
+                continue
+
+            result = await conn.execute(text(
+                f"SELECT count(*) FROM {table} WHERE {column} IS NOT NULL AND {column} !~ :pattern"
+            ), {"pattern": UUID_PATTERN})
+            invalid = result.scalar()
+            if invalid:
+                print(f"❌ {table}.{column} has {invalid} values that are not UUIDs, nothing was changed")
+                return
+            pending.setdefault(table, []).append(column)
+
+        if not pending:
+            print("ℹ️  id columns already use the uuid type")
+            return
+
+        # Foreign keys must be dropped while the columns on either side change type.
+        # Constraints cloned onto partitions (conparentid <> 0) go with their parent.
+        result = await conn.execute(text("""
+            SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)
+            FROM pg_constraint
+            WHERE contype = 'f'
+              AND conparentid = 0
+              AND (conrelid::regclass::text = ANY(:tables) OR confrelid::regclass::text = ANY(:tables))
+        """), {"tables": list(pending)})
+        foreign_keys = result.all()
+        for table, name, _ in foreign_keys:
+            await conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+
+        for table, columns in pending.items():
+            alterations = ", ".join(
+                f"ALTER COLUMN {column} TYPE uuid USING {column}::uuid" for column in columns
+            )
+            await conn.execute(text(f"ALTER TABLE {table} {alterations}"))
+            print(f"✅ {table}: {', '.join(columns)}")
+
+        for table, name, definition in foreign_keys:
+            await conn.execute(text(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}'))
+        print(f"✅ Restored {len(foreign_keys)} foreign keys")
+
+        print("\n✅ id columns converted to uuid!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,27 @@
+"""
+Recompute per-product sales velocity, days of stock and reorder points.
+Run nightly (e.g. from cron), after midnight UTC: python forecast_inventory.py
+
+Reads the last FORECAST_LOOKBACK_DAYS of daily_product_sales and replaces
+the inventory_forecasts table served by GET /api/analytics/inventory-forecast.
+"""
+import asyncio
+from app.database import engine, Base
+from app.forecasting import refresh_forecasts
+from app.models import InventoryForecast
+
+
+async def forecast():
+    """Create inventory_forecasts if needed and recompute it"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[InventoryForecast.__table__])
+
+    print("Forecasting inventory...")
+    products = await refresh_forecasts(engine)
+    print(f"✅ Forecast {products} products")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(forecast())
@@ -2,10 +2,18 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from datetime import timedelta
 
 from app.config import get_settings
-from app.database import init_db, close_db
-from app.routes import products, coupons, orders, analytics, ai, auth
+from app.database import engine, init_db, close_db
+from app.checkout import checkout_pipeline
+from app.partitions import partition_maintainer
+from app.sales_cube import sales_cube
+from app.sketches import sketch_store
+from app.trending import trending_tracker
+from app.recommendations import related_products
+from app.ai_client import gemini_client
+from app.routes import products, coupons, orders, analytics, ai, auth, admin_orders, admin_customers
 
 settings = get_settings()
 
@@ -17,9 +25,31 @@ async def lifespan(app: FastAPI):
     await init_db()
     print("✅ Database initialized")
     
+    # Load the in-memory sales cube before orders start arriving
+    if sales_cube.enabled:
+        await sales_cube.load(engine)
+        print(f"✅ Sales cube loaded ({len(sales_cube)} order items)")
+    
+    # Replay recent order items into the trending scores
+    replayed = await trending_tracker.load(engine, timedelta(hours=settings.TRENDING_LOOKBACK_HOURS))
+    print(f"✅ Trending scores rebuilt ({replayed} recent order items)")
+    
+    # Build the frequently-bought-together matrix
+    pairs = await related_products.rebuild(engine)
+    print(f"✅ Related products built ({pairs} product pairs)")
+    
+    # Start asynchronous checkout workers, the sketch flush and partition maintenance tasks
+    await checkout_pipeline.start()
+    sketch_store.start()
+    partition_maintainer.start(engine)
+    
     yield
     
-    # Shutdown: Close connections
+    # Shutdown: Stop workers and close connections
+    await checkout_pipeline.stop()
+    await sketch_store.stop()
+    await partition_maintainer.stop()
+    await gemini_client.close()
     await close_db()
     print("✅ Database connections closed")
 
@@ -47,6 +77,8 @@ app.include_router(coupons.router, prefix=settings.API_V1_PREFIX)
 app.include_router(orders.router, prefix=settings.API_V1_PREFIX)
 app.include_router(analytics.router, prefix=settings.API_V1_PREFIX)
 app.include_router(ai.router, prefix=settings.API_V1_PREFIX)
+app.include_router(admin_orders.router, prefix=settings.API_V1_PREFIX)
+app.include_router(admin_customers.router, prefix=settings.API_V1_PREFIX)
 
 
 @app.get("/")
@@ -0,0 +1,105 @@
+"""Convert orders, order_items and order_coupons into monthly range-partitioned tables"""
+import asyncio
+from datetime import datetime, timezone
+from sqlalchemy import text
+from app.config import get_settings
+from app.database import engine, Base
+from app.models import Order, OrderItem, OrderCoupon
+from app.partitions import ensure_partitions, add_months, month_start
+
+settings = get_settings()
+
+TABLES = ["orders", "order_items", "order_coupons"]
+
+
+async def is_partitioned(conn, table: str) -> bool:
+    result = await conn.execute(
+        text("SELECT relkind::text FROM pg_class WHERE relname = :table"),
+        {"table": table}
+    )
+    return result.scalar() == "p"
+
+
+async def rename_legacy(conn, table: str) -> None:
+    """Move a table and its indexes out of the way of the partitioned replacement"""
+    await conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_legacy"))
+    result = await conn.execute(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = :table"),
+        {"table": f"{table}_legacy"}
+    )
+    for (index_name,) in result.all():
+        await conn.execute(text(f"ALTER INDEX {index_name} RENAME TO {index_name}_legacy"))
+
+
+async def migrate():
+    """Rebuild the order tables as partitioned tables and copy existing rows"""
+    async with engine.begin() as conn:
+        if await is_partitioned(conn, "orders"):
+            print("ℹ️  orders is already partitioned")
+            return
+
+        print("Partitioning orders tables...")
+        for table in TABLES:
+            await rename_legacy(conn, table)
+
+        await conn.run_sync(
+            Base.metadata.create_all,
+            tables=[Order.__table__, OrderItem.__table__, OrderCoupon.__table__]
+        )
+
+        # Partitions for every month that has orders, plus the upcoming ones
+        result = await conn.execute(text("SELECT min(created_at) FROM orders_legacy"))
+        oldest = result.scalar() or datetime.now(timezone.utc)
+        today = datetime.now(timezone.utc).date()
+        await ensure_partitions(
+            conn,
+            month_start(oldest.date()),
+            add_months(month_start(today), settings.PARTITION_MONTHS_AHEAD)
+        )
+
+        result = await conn.execute(text("""
+            INSERT INTO orders (
+                id, customer_email, customer_name, items_brought, subtotal, discount,
+                total, status, applied_coupon_code, created_at
+            )
+            SELECT
+                id, customer_email, customer_name, items_brought, subtotal, discount,
+                total, status, applied_coupon_code, COALESCE(created_at, NOW())
+            FROM orders_legacy
+        """))
+        print(f"✅ Copied {result.rowcount} orders")
+
+        result = await conn.execute(text("""
+            INSERT INTO order_items (
+                id, order_id, order_created_at, product_id, product_name,
+                quantity, unit_price, total_price
+            )
+            SELECT
+                i.id, i.order_id, o.created_at, i.product_id, i.product_name,
+                i.quantity, i.unit_price, i.total_price
+            FROM order_items_legacy i
+            JOIN orders o ON o.id = i.order_id
+        """))
+        print(f"✅ Copied {result.rowcount} order items")
+
+        result = await conn.execute(text("""
+            INSERT INTO order_coupons (
+                id, order_id, order_created_at, coupon_id, code, position,
+                discount_type, discount_value, discount_amount
+            )
+            SELECT
+                c.id, c.order_id, o.created_at, c.coupon_id, c.code, c.position,
+                c.discount_type, c.discount_value, c.discount_amount
+            FROM order_coupons_legacy c
+            JOIN orders o ON o.id = c.order_id
+        """))
+        print(f"✅ Copied {result.rowcount} order coupons")
+
+        for table in reversed(TABLES):
+            await conn.execute(text(f"DROP TABLE {table}_legacy"))
+
+        print("\n✅ Orders tables partitioned successfully!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,27 @@
+"""
+Create the customer and company metrics tables and rebuild them from existing orders.
+Run add_order_company_column.py first on databases created before orders.company.
+"""
+import asyncio
+from app.database import engine, Base
+from app.models import CustomerMetrics, CompanyCustomer, CompanyMetrics
+from app.rollups import rebuild_customer_metrics
+
+
+async def migrate():
+    """Create customer_metrics, company_customers and company_metrics if needed and backfill them"""
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            Base.metadata.create_all,
+            tables=[CustomerMetrics.__table__, CompanyCustomer.__table__, CompanyMetrics.__table__]
+        )
+        print("Rebuilding customer and company metrics...")
+        customers, companies = await rebuild_customer_metrics(conn)
+        print(f"✅ customer_metrics: {customers} customers")
+        print(f"✅ company_metrics: {companies} companies")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,25 @@
+"""Create the daily sales rollup tables and rebuild them from existing orders"""
+import asyncio
+from app.database import engine, Base
+from app.models import DailySales, DailyProductSales, DailyCouponSales
+from app.rollups import rebuild_rollups
+
+
+async def migrate():
+    """Create daily_sales, daily_product_sales and daily_coupon_sales if needed and backfill them"""
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            Base.metadata.create_all,
+            tables=[DailySales.__table__, DailyProductSales.__table__, DailyCouponSales.__table__]
+        )
+        print("Rebuilding daily sales rollups...")
+        days, product_days, coupon_days = await rebuild_rollups(conn)
+        print(f"✅ daily_sales: {days} days")
+        print(f"✅ daily_product_sales: {product_days} product-days")
+        print(f"✅ daily_coupon_sales: {coupon_days} coupon-days")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
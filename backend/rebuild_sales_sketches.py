@@ -0,0 +1,47 @@
+"""Create the daily_sketches table and rebuild it from existing orders"""
+import asyncio
+from sqlalchemy import select, delete
+from app.database import engine, Base, AsyncSessionLocal
+from app.models import DailySketch, Order, PendingSketchOrder
+from app.sketches import build_day_sketches
+
+
+async def migrate():
+    """
+    Recompute every day's customer and order total sketches.
+    Runs in one REPEATABLE READ snapshot, so it only drops the pending orders
+    it has counted; orders committed meanwhile stay pending for the flush.
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(
+            Base.metadata.create_all,
+            tables=[DailySketch.__table__, PendingSketchOrder.__table__]
+        )
+
+    print("Rebuilding daily sketches...")
+    async with AsyncSessionLocal() as db:
+        await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        result = await db.stream(
+            select(Order.created_at, Order.customer_email, Order.total)
+            .execution_options(yield_per=10000)
+        )
+        days = {}
+        async for rows in result.partitions():
+            build_day_sketches(rows, days)
+
+        await db.execute(delete(DailySketch))
+        await db.execute(delete(PendingSketchOrder))
+        for day, sketches in days.items():
+            db.add(DailySketch(
+                day=day,
+                customers=sketches.customers.to_bytes(),
+                order_totals=sketches.order_totals.to_dict()
+            ))
+        await db.commit()
+    print(f"✅ Rebuilt sketches for {len(days)} days")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
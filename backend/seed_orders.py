@@ -9,6 +9,7 @@ from sqlalchemy import select
 from app.database import AsyncSessionLocal, init_db
 from app.models import Product, Order, OrderItem, User
 from app.auth import hash_password
+from app.rollups import record_customer_order, record_order_sales
 
 
 async def seed_orders():
@@ -105,6 +106,7 @@ async def seed_orders():
                         discount=discount,
                         total=total,
                         status="confirmed",
+                        company=customer.server or None,
                         created_at=order_date
                     )
                     db.add(order)
@@ -114,6 +116,7 @@ async def seed_orders():
                     for item_data in order_items_data:
                         order_item = OrderItem(
                             order_id=order.id,
+                            order_created_at=order.created_at,
                             product_id=item_data['product'].id,
                             product_name=item_data['product'].name,
                             quantity=item_data['quantity'],
@@ -122,6 +125,17 @@ async def seed_orders():
                         )
                         db.add(order_item)
                     
+                    await db.flush()
+                    await record_order_sales(
+                        db,
+                        order.created_at,
+                        total,
+                        [
+                            (item_data['product'].id, item_data['quantity'], item_data['total_price'])
+                            for item_data in order_items_data
+                        ]
+                    )
+                    await record_customer_order(db, order)
                     orders_created += 1
             
             await db.commit()
@@ -0,0 +1,59 @@
+"""Test which admin chat questions the intent router answers and which go to the model"""
+from app.ai_intents import match_intent
+from app.cache import normalize_question
+
+
+# (question, expected intent, expected named groups)
+ANSWERED = [
+    ("How many orders today?", "orders_today", {}),
+    ("What's today's revenue?", "revenue_today", {}),
+    ("What was our total revenue?", "revenue_all_time", {}),
+    ("What were sales last week?", "sales_period", {"period": "last week"}),
+    ("How much did we make this month?", "sales_period", {"period": "this month"}),
+    ("Which products are low on stock?", "low_stock", {}),
+    ("Show me the stock levels", "low_stock", {}),
+    ("Which coupons are active?", "active_coupons", {}),
+    ("How many products do we have?", "product_count", {}),
+    ("What are the top products?", "top_products", {"limit": None, "period": None}),
+    ("Top 10 products", "top_products", {"limit": "10", "period": None}),
+    ("Top products this month", "top_products", {"limit": None, "period": "this month"}),
+    ("Best sellers last week", "top_products", {"limit": None, "period": "last week"}),
+]
+
+# Questions with a qualifier no rule handles; answering them from a rule
+# would silently drop the qualifier
+LEFT_TO_MODEL = [
+    "Total revenue last month",
+    "Total sales in 2025",
+    "What is the stock level of the blue hoodie?",
+    "Which coupons expired?",
+    "How many orders today were over $100?",
+    "Orders today from Acme Corp",
+    "Why did revenue drop this week?",
+]
+
+
+def test_answered_questions():
+    """Plain questions are answered by the matching rule with its parameters"""
+    for question, intent, groups in ANSWERED:
+        matched = match_intent(normalize_question(question))
+        assert matched is not None, f"{question!r} was not matched"
+        assert matched[0] == intent, f"{question!r} matched {matched[0]}, expected {intent}"
+        for name, value in groups.items():
+            assert matched[1].group(name) == value, f"{question!r}: {name}={matched[1].group(name)!r}"
+        print(f"✅ {question} -> {intent}")
+
+
+def test_qualified_questions_go_to_model():
+    """Questions with extra qualifiers are not answered by a rule"""
+    for question in LEFT_TO_MODEL:
+        matched = match_intent(normalize_question(question))
+        assert matched is None, f"{question!r} was matched by {matched[0]}"
+        print(f"✅ {question} -> model")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing admin chat intent matching\n")
+    test_answered_questions()
+    test_qualified_questions_go_to_model()
+    print("\n✅ Intent matching test complete!")